@@ -1,3 +1,15 @@
+import weakref
+from typing import TYPE_CHECKING, Any
+
+from opcodes import Op, OpCode, opcode2name
+
+if TYPE_CHECKING:
+    from governor import Governor
+
+E256 = 2**256
+E256M1 = 2**256 - 1
+
+
 # 关键类
 class UnsupportedOpError(Exception):
     op: OpCode
@@ -11,25 +23,738 @@ class UnsupportedOpError(Exception):
 ## 实际应用：虚拟机使用这个异常来判断EVM处理函数参数信息的操作是否结束
 
 
+# 描述：栈中元素的来源标记(provenance tag)
+class Tag:
+    __slots__ = ('val',)
+    val: int # 被标记的元素的值
+
+    def __init__(self, val: int = 0):
+        self.val = val
+
+    def __int__(self):
+        return self.val
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({hex(self.val)})'
+## Tag类：栈中的元素直接使用int存储，只有需要标记来源的元素才会被替换为Tag的子类(例如arguments.py中的Arg)，int(x)对int和Tag都能取出值
+## 实际应用：原来每个栈元素都是32字节的bytes，标记是带有__dict__的bytes子类，现在只有被标记的元素才会分配一个使用__slots__的小对象
+
+
+class StackIndexError(Exception):
+    pass
+
+
+# 描述：超出了Governor(governor.py)给一次分析设置的资源上限，reason和arguments.py中Termination的停止原因一致
+class ResourceLimitError(Exception):
+    reason = 'resource_limit'
+
+
+class StepLimitError(ResourceLimitError):
+    reason = 'step_limit'
+
+
+class DeadlineError(ResourceLimitError):
+    reason = 'deadline'
+
+
+class MemoryLimitError(ResourceLimitError):
+    reason = 'memory_limit'
+## ResourceLimitError类：Vm在执行过程中抛出，function_arguments捕获之后停止执行，并返回已经推断出的参数类型
+
+
+class Stack:
+    def __init__(self):
+        self._data: list[int | Tag] = []
+        # _data是否和另一个Stack共享，共享的列表在第一次写入之前才会被复制
+        self._shared = False
+
+    def __str__(self):
+        r = f'{len(self._data)} elems:'
+        return r + ('\n' if len(self._data) else '') + '\n'.join(f'  - {int(el):064x} | {type(el).__name__}' for el in self._data)
+
+    # 快照：两个Stack共享同一个列表，直到其中一方写入
+    def __copy__(self):
+        obj = Stack()
+        obj._data = self._data
+        obj._shared = self._shared = True
+        return obj
+
+    def _own(self):
+        self._data = self._data[:]
+        self._shared = False
+
+    def push(self, val: int | Tag):
+        if self._shared:
+            self._own()
+        self._data.append(val)
+
+    def push_uint(self, val: int):
+        if self._shared:
+            self._own()
+        self._data.append(val)
+
+    # 返回栈顶的元素本身，如果它被标记过，返回的就是Tag
+    def pop(self) -> int | Tag:
+        if self._shared:
+            self._own()
+        try:
+            return self._data.pop()
+        except IndexError as e:
+            raise StackIndexError from e
+
+    def pop_uint(self) -> int:
+        return int(self.pop())
+
+    def peek(self, n: int = 0) -> int | Tag:
+        if len(self._data) <= n:
+            raise StackIndexError
+        return self._data[-1 * (n + 1)]
+
+    def dup(self, n: int):
+        if len(self._data) < n:
+            raise StackIndexError
+        if self._shared:
+            self._own()
+        self._data.append(self._data[-n])
+
+    def swap(self, n: int):
+        if len(self._data) <= n:
+            raise StackIndexError
+        if self._shared:
+            self._own()
+        self._data[-1], self._data[-n - 1] = self._data[-n - 1], self._data[-1]
+## Stack类：EVM的栈，元素是int或者Tag，不再为每个元素分配32字节的bytes
+## 实际应用：__copy__()不复制元素，fork出来的vm和原来的vm共享同一个列表，哪一方先写入，哪一方才复制
+
+
+class Memory:
+    PAGE_SIZE = 1024
+
+    def __init__(self):
+        # 内存按PAGE_SIZE分页，只有被写入过的页才会分配bytearray，所以很大的offset也不会分配整段内存
+        self._pages: dict[int, bytearray] = {}
+        # 可以直接修改的页，其余的页可能和其他Memory共享，写入之前需要先复制
+        self._owned: set[int] = set()
+        # 稀疏的来源标记：字节的位置 -> 写入这个字节的数据的Tag，没有被标记的字节不在字典中
+        self._tags: dict[int, Tag] = {}
+        # 符号化的区间：CALLDATACOPY复制进来的全0数据，不管多长都只占一个MemoryRange，互相之间不重叠
+        self._ranges: list[MemoryRange] = []
+        # _pages、_tags和_ranges是否和另一个Memory共享
+        self._shared = False
+        # 内存扩展的上限(字节)，写入超过这个位置时抛出MemoryLimitError，None表示不限制
+        self.limit: int | None = None
+
+    def __str__(self):
+        r = f'{len(self._pages)} pages, {len(self._tags)} tagged bytes, {len(self._ranges)} ranges:\n'
+        return r + '\n'.join(f'  - {idx * self.PAGE_SIZE}: {bytes(page).rstrip(bytes(1)).hex()}' for idx, page in sorted(self._pages.items()))
+
+    # 快照：两个Memory共享所有的页和来源标记，直到其中一方写入
+    def __copy__(self):
+        obj = Memory()
+        obj._pages = self._pages
+        obj._tags = self._tags
+        obj._ranges = self._ranges
+        obj._shared = self._shared = True
+        obj.limit = self.limit
+        self._owned = set()
+        return obj
+
+    def _own(self):
+        self._pages = dict(self._pages)
+        self._tags = dict(self._tags)
+        self._ranges = list(self._ranges)
+        self._shared = False
+
+    def _page_for_write(self, idx: int) -> bytearray:
+        page = self._pages.get(idx)
+        if page is None:
+            page = bytearray(self.PAGE_SIZE)
+        elif idx in self._owned:
+            return page
+        else:
+            # 共享的页，写入之前复制一份
+            page = bytearray(page)
+        self._pages[idx] = page
+        self._owned.add(idx)
+        return page
+
+    def _read(self, offset: int, size: int) -> bytes:
+        idx, start = divmod(offset, self.PAGE_SIZE)
+        if start + size <= self.PAGE_SIZE:
+            page = self._pages.get(idx)
+            return bytes(size) if page is None else bytes(page[start : start + size])
+        res = bytearray(size)
+        pos = 0
+        while pos < size:
+            idx, start = divmod(offset + pos, self.PAGE_SIZE)
+            n = min(self.PAGE_SIZE - start, size - pos)
+            page = self._pages.get(idx)
+            if page is not None:
+                res[pos : pos + n] = page[start : start + n]
+            pos += n
+        return bytes(res)
+
+    # 只有写入内存的时候才把栈中的int转换为bytes
+    def store(self, offset: int, value: bytes, tag: Tag | None = None):
+        if self.limit is not None and offset + len(value) > self.limit:
+            raise MemoryLimitError(f'memory expansion to {offset + len(value)} > {self.limit}')
+        if self._shared:
+            self._own()
+        pos = 0
+        while pos < len(value):
+            idx, start = divmod(offset + pos, self.PAGE_SIZE)
+            n = min(self.PAGE_SIZE - start, len(value) - pos)
+            self._page_for_write(idx)[start : start + n] = value[pos : pos + n]
+            pos += n
+
+        if tag is not None:
+            for i in range(offset, offset + len(value)):
+                self._tags[i] = tag
+        elif len(self._tags) > 0:
+            for i in range(offset, offset + len(value)):
+                self._tags.pop(i, None)
+        if len(self._ranges) > 0:
+            self._cut(offset, offset + len(value))
+
+    # 写入size个0字节，来源标记为tag，只记录一个MemoryRange，代价和size无关
+    def store_range(self, offset: int, size: int, tag: 'CallDataCopy'):
+        if size == 0:
+            return
+        end = offset + size
+        if self.limit is not None and end > self.limit:
+            raise MemoryLimitError(f'memory expansion to {end} > {self.limit}')
+        if self._shared:
+            self._own()
+        # 只处理已经分配的页和已经标记的字节，完全被覆盖的页直接丢弃
+        first, last = offset // self.PAGE_SIZE, (end - 1) // self.PAGE_SIZE
+        for idx in [i for i in self._pages if first <= i <= last]:
+            base = idx * self.PAGE_SIZE
+            lo, hi = max(offset, base) - base, min(end, base + self.PAGE_SIZE) - base
+            if lo == 0 and hi == self.PAGE_SIZE:
+                del self._pages[idx]
+                self._owned.discard(idx)
+            else:
+                self._page_for_write(idx)[lo:hi] = bytes(hi - lo)
+        for i in [i for i in self._tags if offset <= i < end]:
+            del self._tags[i]
+        self._cut(offset, end)
+        self._ranges.append(MemoryRange(offset, end, tag))
+
+    # 从已有的区间中去掉[start, end)，被切开的区间保留两端
+    def _cut(self, start: int, end: int):
+        ranges = []
+        for r in self._ranges:
+            if r.end <= start or r.start >= end:
+                ranges.append(r)
+                continue
+            if r.start < start:
+                ranges.append(MemoryRange(r.start, start, r.tag))
+            if r.end > end:
+                ranges.append(MemoryRange(end, r.end, r.tag.at(end - r.start)))
+        self._ranges = ranges
+
+    # 返回加载出来的值，以及组成这个值的所有数据的Tag
+    def load(self, offset: int) -> tuple[int, set[Tag]]:
+        ret = int.from_bytes(self._read(offset, 32), 'big')
+        used = set()
+        if len(self._tags) > 0:
+            for i in range(offset, offset + 32):
+                tag = self._tags.get(i)
+                if tag is not None:
+                    used.add(tag)
+        # 只有从区间内部开始加载时，值才对应calldata中的一个位置；从区间之前开始加载的值不是复制过来的某个参数
+        for r in self._ranges:
+            if r.start <= offset < r.end:
+                used.add(r.tag.at(offset - r.start))
+        return ret, used
+## Memory类：EVM的内存，数据保存在按页分配的bytearray中，并行维护一个稀疏的来源标记，MLOAD的时候通过used返回加载出来的值来自哪些被标记的数据
+## 实际应用：__copy__()是写时复制的，fork出来的vm只有在写入某一页的时候才复制这一页
+
+
 class CallData(bytes):
     # 每个CallData类包含一个操作，从当前类在CallData中的存储位置加载size长度的数据
-    def load(self, offset: int, size: int = 32):
+    def load(self, offset: int, size: int = 32) -> bytes:
         val = self[offset : min(offset + size, len(self))]
         # 以左对齐的方式将val调整到size的长度 左对齐：（原本数据在左边，填充的值在右边： hello----------）
-        return CallData(val.ljust(size, b'\x00'))
+        return val.ljust(size, b'\x00')
+
+    # CALLDATALOAD使用，直接返回int，超出calldata的部分(除了选择器之外的所有参数)不需要切片和填充
+    def word(self, offset: int) -> int:
+        if offset >= len(self):
+            return 0
+        return int.from_bytes(self[offset : offset + 32].ljust(32, b'\x00'), 'big')
       
 ## CallData类，该类的作用：作为Calldata中的具体元素进行处理
 
+
+class CallDataValue(Tag):
+    __slots__ = ()
+## CallDataValue类：CALLDATALOAD/CALLDATACOPY从calldata中加载出来的值，代替原来CallData.load返回的CallData对象
+
+# Tag不会被修改，所以所有加载出0的CALLDATALOAD共享同一个对象
+_ZERO_CALLDATA_WORD = CallDataValue(0)
+
+
+class CallDataCopy(CallDataValue):
+    __slots__ = ('src', 'offset')
+
+    # src：CALLDATACOPY的源地址操作数本身(int或者Tag，例如arguments.py中的ArgDynamic)
+    # offset：这个值在calldata中的位置
+    def __init__(self, val: int = 0, src: 'int | Tag' = 0, offset: int = 0):
+        super().__init__(val)
+        self.src = src
+        self.offset = offset
+
+    # 同一次复制中，往后delta个字节处的数据
+    def at(self, delta: int) -> 'CallDataCopy':
+        return self if delta == 0 else CallDataCopy(self.val, self.src, self.offset + delta)
+## CallDataCopy类：CALLDATACOPY复制到内存中的数据，MLOAD时出现在used中，arguments.py根据src和offset把加载出来的值当作Arg
+
+
+class MemoryRange:
+    __slots__ = ('start', 'end', 'tag')
+
+    def __init__(self, start: int, end: int, tag: CallDataCopy):
+        self.start = start
+        self.end = end
+        self.tag = tag
+## MemoryRange类：内存中[start, end)这一段是从calldata中复制过来的0，只在被再次写入的部分之外有效
+
+# 每个合约的字节码只解码一次，同一个合约的所有Vm(包括__copy__出来的)共享同一个DecodedCode
+# 以字节码本身作为字典的键(bytes的hash值会被缓存)，超过上限之后淘汰最早加入的字节码
+_DECODED_CODE_CACHE_SIZE = 256
+_decoded_code_cache: dict[bytes, 'DecodedCode'] = {}
+
+
+class DecodedCode:
+    # ops[pc]：pc处的操作码
+    # imm[pc]：如果pc处是PUSH类操作，则为PUSH推入的数据(int)，否则为0
+    # next_pc[pc]：顺序执行时下一条指令的序号，PUSH类操作会跳过它推入的数据
+    # jumpdests：合法JUMPDEST的位图，PUSH推入的数据中的0x5b不是合法的跳转目的地
+    # fused：pc -> 从pc开始的融合指令(superinstruction)，None表示pc处不能融合，只在第一次执行到pc时编译
+    def __init__(self, code: bytes):
+        n = len(code)
+        self.ops = bytes(code)
+        self.imm = [0] * n
+        self.next_pc = [0] * n
+        self.jumpdests = bytearray((n + 7) // 8)
+        self.fused: dict[int, Any] = {}
+        _decoded_codes.add(self)
+        self._cfg: ControlFlowGraph | None = None
+        # 子程序的摘要，arguments.py中的_Summaries使用，同一个合约的所有选择器共享
+        self.summaries: dict[tuple, tuple] = {}
+        pc = 0
+        while pc < n:
+            op = code[pc]
+            size = op - Op.PUSH0 if op >= Op.PUSH0 and op <= Op.PUSH32 else 0
+            if size > 0:
+                # 和原来的rjust一样，字节码末尾被截断的PUSH只使用剩下的字节
+                self.imm[pc] = int.from_bytes(code[(pc + 1) : (pc + 1 + size)], 'big')
+            elif op == Op.JUMPDEST:
+                self.jumpdests[pc >> 3] |= 1 << (pc & 7)
+            self.next_pc[pc] = pc + 1 + size
+            pc += 1 + size
+
+    def is_jumpdest(self, pc: int) -> bool:
+        return pc < len(self.ops) and (self.jumpdests[pc >> 3] >> (pc & 7)) & 1 == 1
+
+    # 静态控制流图，第一次使用时才构建，之后和DecodedCode一起被缓存
+    @property
+    def cfg(self) -> 'ControlFlowGraph':
+        if self._cfg is None:
+            self._cfg = ControlFlowGraph(self)
+        return self._cfg
+
+
+# code也可以是只读的memoryview，它和内容相同的bytes有相同的hash值并且相等，所以可以直接查找缓存
+# 可写的memoryview(例如memoryview(bytearray))以及不是按字节排列的memoryview不能计算hash值，先复制为bytes
+def decode_code(code: bytes | memoryview) -> DecodedCode:
+    if type(code) is memoryview and (not code.readonly or code.format != 'B' or code.ndim != 1):
+        code = code.tobytes()
+    decoded = _decoded_code_cache.get(code)
+    if decoded is None:
+        if len(_decoded_code_cache) >= _DECODED_CODE_CACHE_SIZE:
+            del _decoded_code_cache[next(iter(_decoded_code_cache))]
+        decoded = DecodedCode(code)
+        # 以解码时复制出来的ops作为键，缓存不会一直引用调用者的缓冲区
+        _decoded_code_cache[decoded.ops] = decoded
+    return decoded
+## DecodedCode类：对字节码做一次性的预解码，Vm.step()不再需要每一步都构造OpCode、对PUSH的数据做切片和rjust
+## 实际应用：JUMP/JUMPI通过jumpdests位图判断跳转目的地是否合法，修复了原来self.code[s0] != Op.JUMPDEST会把PUSH数据中的0x5b当作JUMPDEST的问题
+
+
+# 描述：把基本块中连续的纯栈操作编译为一个函数(superinstruction)
+'''_compile_run(decoded, pc)的运行流程：
+   step1：从pc开始，收集连续的PUSH/DUP/SWAP/POP/JUMPDEST/CALLVALUE/ADDRESS，遇到其他操作码或者下一个基本块的JUMPDEST(跳转目的地)时结束，少于两条时不融合
+         如果结束的位置是JUMP，则把JUMP作为基本块的结尾一起融合
+   step2：对这些操作做一次符号执行：('s', j)表示执行前栈顶往下第j个元素，('c', v)表示常量，得到执行后栈顶部分的排列以及需要的最小栈深度
+   step3：生成一个Python函数，用一次切片赋值完成整段的栈变化，并把pc设置为这一段之后的指令(或者JUMP的目的地)，返回(第一条指令的操作码, 这一段的gas之和)
+   融合指令只返回第一条指令的操作码，中间的指令不会经过arguments.py中的RULES，所以注册了规则的操作码(set_unfused_ops)不融合，融合之后参数推断的结果不变
+   栈的深度不够或者JUMP的目的地不合法时返回None，由Vm.step()逐条执行，在原来的位置抛出StackIndexError/UnsupportedOpError
+'''
+_FUSED_GAS = {Op.PUSH0: 2, Op.POP: 2, Op.JUMPDEST: 1, Op.CALLVALUE: 2, Op.ADDRESS: 2}
+
+
+def _fusable(op: int) -> bool:
+    return (Op.PUSH0 <= op <= Op.PUSH32) or (Op.DUP1 <= op <= Op.DUP16) or (Op.SWAP1 <= op <= Op.SWAP16) or op in _FUSED_GAS
+
+
+# 不参与融合的操作码，由arguments.py在规则注册表变化时设置为注册了规则的操作码
+_unfused_ops: frozenset[int] = frozenset()
+# 所有的DecodedCode(包括不在decode_code缓存中的)，不融合的操作码变化时清空它们已经编译的融合指令
+_decoded_codes: 'weakref.WeakSet[DecodedCode]' = weakref.WeakSet()
+
+
+def set_unfused_ops(ops):
+    global _unfused_ops
+    ops = frozenset(op for op in ops if _fusable(op) or op == Op.JUMP)
+    if ops == _unfused_ops:
+        return
+    _unfused_ops = ops
+    for decoded in list(_decoded_codes):
+        decoded.fused.clear()
+
+
+def _compile_run(decoded: 'DecodedCode', start: int):
+    ops = decoded.ops
+    pc = start
+    sym: list[tuple[str, int]] = [] # 执行之后栈顶部分的内容，从栈底到栈顶
+    depth = 0 # 用到的执行前的栈元素个数
+    gas = 0
+    count = 0
+
+    def need(k: int):
+        nonlocal depth
+        while len(sym) < k:
+            depth += 1
+            sym.insert(0, ('s', depth))
+
+    while pc < len(ops) and _fusable(ops[pc]) and ops[pc] not in _unfused_ops and not (pc != start and ops[pc] == Op.JUMPDEST):
+        op = ops[pc]
+        if Op.PUSH0 <= op <= Op.PUSH32:
+            sym.append(('c', decoded.imm[pc]))
+        elif Op.DUP1 <= op <= Op.DUP16:
+            need(op - Op.DUP1 + 1)
+            sym.append(sym[-(op - Op.DUP1 + 1)])
+        elif Op.SWAP1 <= op <= Op.SWAP16:
+            n = op - Op.SWAP1 + 1
+            need(n + 1)
+            sym[-1], sym[-n - 1] = sym[-n - 1], sym[-1]
+        elif op == Op.POP:
+            need(1)
+            sym.pop()
+        elif op == Op.CALLVALUE:
+            sym.append(('c', 0))
+        elif op == Op.ADDRESS:
+            sym.append(('c', 1))
+        gas += _FUSED_GAS.get(op, 3)
+        count += 1
+        pc = decoded.next_pc[pc]
+    jump = pc < len(ops) and ops[pc] == Op.JUMP and Op.JUMP not in _unfused_ops
+    if jump:
+        need(1)
+        target = sym.pop()
+        gas += 8
+        count += 1
+    if count < 2:
+        return None
+
+    # 没有被改变的栈底部分不需要重新赋值
+    required = depth
+    while len(sym) > 0 and depth > 0 and sym[0] == ('s', depth):
+        sym.pop(0)
+        depth -= 1
+    # 常量、跳转目的地以及结束的pc作为闭包变量传入，形状相同的段(例如不同合约中的PUSH2 x JUMP)共享同一个编译好的工厂函数
+    consts = []
+
+    def expr(item: tuple[str, int]) -> str:
+        if item[0] == 's':
+            return f'd[n - {item[1]}]'
+        consts.append(item[1])
+        return f'c{len(consts) - 1}'
+
+    items = ', '.join(expr(item) for item in sym)
+    lines = [
+        'def run(vm):',
+        '    st = vm.stack',
+        '    d = st._data',
+        '    n = len(d)',
+        f'    if n < {required}:',
+        '        return None',
+    ]
+    if jump:
+        lines += [
+            f'    target = int({expr(target)})',
+            '    if not vm.decoded.is_jumpdest(target):',
+            '        return None',
+        ]
+    lines += [
+        '    if st._shared:',
+        '        st._own()',
+        '        d = st._data',
+        f'    d[n - {depth}:] = [{items}]',
+        '    vm.pc = target' if jump else '    vm.pc = end',
+    ]
+    if not jump and pc >= len(ops):
+        lines.append('    vm.stopped = True')
+    lines.append('    return ret')
+    params = ', '.join(['end', 'ret'] + [f'c{i}' for i in range(len(consts))])
+    src = f'def make({params}):\n' + '\n'.join('    ' + line for line in lines) + '\n    return run'
+    factory = _fused_factories.get(src)
+    if factory is None:
+        if len(_fused_factories) >= _FUSED_FACTORIES_SIZE:
+            del _fused_factories[next(iter(_fused_factories))]
+        namespace = {}
+        exec(src, namespace)
+        factory = _fused_factories[src] = namespace['make']
+    # 以JUMP结尾的段返回的操作码是JUMP，这样arguments.py可以知道这一步之后pc是一个基本块的起始位置
+    return factory(pc, (Op.JUMP if jump else ops[start], gas), *consts)
+
+
+# 生成的源码 -> 工厂函数，所有合约共享，超过_FUSED_FACTORIES_SIZE时淘汰最早编译的(已经创建的融合指令不受影响)
+_FUSED_FACTORIES_SIZE = 4096
+_fused_factories: dict[str, Any] = {}
+## _compile_run：每个DecodedCode中的融合指令只编译一次，同一个合约的所有选择器、fork出来的vm都共享
+
+
+# 描述：合约的静态控制流图
+'''ControlFlowGraph(decoded)的构建流程：
+   step1：切分基本块，基本块从pc = 0、每一个JUMPDEST以及JUMP/JUMPI/STOP/RETURN/REVERT/INVALID/SELFDESTRUCT之后的指令开始
+   step2：解析跳转：基本块以PUSH x; JUMP或者PUSH x; JUMPI结尾并且x是合法的JUMPDEST时，x是它的后继；跳转目的地来自栈中(例如内部函数的返回地址)时记录在dynamic中
+   step3：dispatcher的入口表：以PUSH4 selector; EQ; PUSH dest; JUMPI结尾的基本块给出selector -> dest
+   step4：从pc = 0(以及只能通过动态跳转到达的基本块)开始深度优先遍历，回边指向的基本块是循环的入口，记录在loop_heads中
+   step5：被两个以上的基本块通过PUSH x; JUMP调用的x记录在subroutines中，arguments.py在这些位置记录和复用子程序的摘要
+   step6：包含CALLDATALOAD/CALLDATACOPY的基本块记录在calldata_blocks中，reaches_calldata(pc, targets)判断从pc出发还能不能执行到它们
+   step7：回边记录在back_edges中，loop_body(head)沿着前驱从回边的起点反向遍历到head，得到循环体(natural loop)包含的基本块，branches记录静态JUMPI的两个去向
+   _process_function在函数体中每次到达循环的入口时，比较栈中的来源标记以及已经推断出的参数类型，和上一次到达时完全相同则说明这一轮循环没有新的信息，
+   此时不再继续迭代，而是在循环体中下一个有一边离开循环体的JUMPI处强制走离开的一边，继续分析循环之后的参数
+'''
+_NO_FALLTHROUGH_OPS = frozenset((Op.STOP, Op.RETURN, Op.REVERT, Op.INVALID, Op.SELFDESTRUCT, Op.JUMP))
+_CALLDATA_READ_OPS = frozenset((Op.CALLDATALOAD, Op.CALLDATACOPY))
+
+
+class ControlFlowGraph:
+    # blocks：基本块的起始pc，从小到大排列
+    # block_end：基本块的起始pc -> 最后一条指令的pc
+    # successors：基本块的起始pc -> 可以静态解析的后继基本块
+    # dynamic：以无法静态解析的JUMP/JUMPI结尾的基本块
+    # entries：函数选择器 -> 函数体的入口pc
+    # subroutines：subroutines[pc] == 1表示pc是共享子程序的候选入口，大小和loop_heads相同
+    # calldata_blocks：读取calldata的基本块
+    # pushed_targets：基本块的起始pc -> 这个基本块中PUSH的合法JUMPDEST(例如调用内部函数之前推入的返回地址)
+    # loop_heads：loop_heads[pc] == 1表示pc是循环的入口，比字节码多留出33个字节，所以任何执行到的pc都可以直接作为下标
+    # back_edges：循环的入口 -> 回边的起点基本块
+    # branches：静态JUMPI的pc -> (跳转的目的地, 不跳转时的下一条指令)
+    def __init__(self, decoded: DecodedCode):
+        ops = decoded.ops
+        n = len(ops)
+        insts = []
+        pc = 0
+        while pc < n:
+            insts.append(pc)
+            pc = decoded.next_pc[pc]
+
+        leaders = set([0])
+        for i, pc in enumerate(insts):
+            op = ops[pc]
+            if op == Op.JUMPDEST:
+                leaders.add(pc)
+            elif (op in _NO_FALLTHROUGH_OPS or op == Op.JUMPI) and i + 1 < len(insts):
+                leaders.add(insts[i + 1])
+        self.blocks: list[int] = sorted(pc for pc in leaders if pc < n)
+        self.block_end: dict[int, int] = {}
+        self.successors: dict[int, list[int]] = {}
+        self.dynamic: set[int] = set()
+        self.entries: dict[bytes, int] = {}
+        self.calldata_blocks: set[int] = set()
+        self.pushed_targets: dict[int, list[int]] = {}
+        self.back_edges: dict[int, list[int]] = {}
+        self.branches: dict[int, tuple[int, int]] = {}
+        self._reach_cache: dict[tuple, bool] = {}
+        self._loop_bodies: dict[int, frozenset] = {}
+        self._predecessors: dict[int, list[int]] | None = None
+
+        i = 0
+        for b, start in enumerate(self.blocks):
+            next_block = self.blocks[b + 1] if b + 1 < len(self.blocks) else n
+            body = []
+            while i < len(insts) and insts[i] < next_block:
+                body.append(insts[i])
+                i += 1
+            last = body[-1]
+            op = ops[last]
+            self.block_end[start] = last
+            succ = []
+            if op == Op.JUMP or op == Op.JUMPI:
+                push = body[-2] if len(body) > 1 else None
+                if push is not None and Op.PUSH1 <= ops[push] <= Op.PUSH32 and decoded.is_jumpdest(decoded.imm[push]):
+                    succ.append(decoded.imm[push])
+                else:
+                    self.dynamic.add(start)
+                if op == Op.JUMPI and len(body) >= 4 and ops[body[-4]] == Op.PUSH4 and ops[body[-3]] == Op.EQ and len(succ) > 0:
+                    self.entries[decoded.imm[body[-4]].to_bytes(4, 'big')] = succ[0]
+            if op not in _NO_FALLTHROUGH_OPS and next_block < n:
+                succ.append(next_block)
+            if op == Op.JUMPI and len(succ) == 2:
+                self.branches[last] = (succ[0], succ[1])
+            self.successors[start] = succ
+            if any(ops[pc] in _CALLDATA_READ_OPS for pc in body):
+                self.calldata_blocks.add(start)
+            pushed = [decoded.imm[pc] for pc in body if Op.PUSH1 <= ops[pc] <= Op.PUSH32 and decoded.is_jumpdest(decoded.imm[pc])]
+            if len(pushed) > 0:
+                self.pushed_targets[start] = pushed
+
+        # 从两个以上的基本块通过PUSH x; JUMP跳转过来的x是共享的子程序(例如solc的abi_decode_*)的候选入口
+        callers: dict[int, set[int]] = {}
+        for start, last in self.block_end.items():
+            if ops[last] == Op.JUMP and start not in self.dynamic:
+                callers.setdefault(self.successors[start][0], set()).add(start)
+        self.subroutines = bytearray(n + 33)
+        for target, sources in callers.items():
+            if len(sources) >= 2:
+                self.subroutines[target] = 1
+
+        self.loop_heads = bytearray(n + 33)
+        # 迭代的深度优先遍历，state：1表示在遍历的栈中，2表示已经遍历完
+        state: dict[int, int] = {}
+        for root in self.blocks:
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(self.successors[root]))]
+            while len(stack) > 0:
+                node, it = stack[-1]
+                for succ in it:
+                    st = state.get(succ)
+                    if st is None:
+                        state[succ] = 1
+                        stack.append((succ, iter(self.successors[succ])))
+                        break
+                    if st == 1:
+                        self.loop_heads[succ] = 1
+                        self.back_edges.setdefault(succ, []).append(node)
+                else:
+                    state[node] = 2
+                    stack.pop()
+
+    # 循环体包含的基本块(包括head本身)，第一次使用时才计算
+    # 调用内部函数的基本块(PUSH返回地址; PUSH x; JUMP)和返回地址之间加一条边，这样反向遍历可以越过循环体中的函数调用
+    def loop_body(self, head: int) -> frozenset:
+        body = self._loop_bodies.get(head)
+        if body is not None:
+            return body
+        if self._predecessors is None:
+            preds: dict[int, list[int]] = {}
+            for start, succ in self.successors.items():
+                for s in succ:
+                    preds.setdefault(s, []).append(start)
+                if start not in self.dynamic:
+                    for ret in self.pushed_targets.get(start, ()):
+                        if ret not in succ:
+                            preds.setdefault(ret, []).append(start)
+            self._predecessors = preds
+        seen = {head}
+        work = [b for b in self.back_edges.get(head, ()) if b != head]
+        seen.update(work)
+        while len(work) > 0:
+            b = work.pop()
+            for p in self._predecessors.get(b, ()):
+                if p not in seen:
+                    seen.add(p)
+                    work.append(p)
+        body = self._loop_bodies[head] = frozenset(seen)
+        return body
+
+    # 从基本块的起始pc出发，是否还可能执行到读取calldata的基本块
+    # 动态跳转的目的地只可能是targets(调用者给出的栈中的返回地址)，或者遍历到的基本块中PUSH的JUMPDEST，所以每遇到一个新的PUSH都要重新考虑已经遍历过的动态跳转
+    # pc不是基本块的起始位置时无法判断，返回True
+    def reaches_calldata(self, pc: int, targets: frozenset) -> bool:
+        key = (pc, targets)
+        res = self._reach_cache.get(key)
+        if res is not None:
+            return res
+        if pc not in self.successors:
+            return True
+        res = False
+        seen = {pc}
+        work = [pc]
+        jump_targets = set(targets)
+        has_dynamic = False
+        while True:
+            while len(work) > 0:
+                b = work.pop()
+                if b in self.calldata_blocks:
+                    res = True
+                    break
+                jump_targets.update(self.pushed_targets.get(b, ()))
+                if b in self.dynamic:
+                    has_dynamic = True
+                for succ in self.successors[b]:
+                    if succ not in seen:
+                        seen.add(succ)
+                        work.append(succ)
+            if res or not has_dynamic:
+                break
+            work = [t for t in jump_targets if t not in seen and t in self.successors]
+            if len(work) == 0:
+                break
+            seen.update(work)
+        self._reach_cache[key] = res
+        return res
+## ControlFlowGraph类：通过decoded.cfg获取，同一个合约的所有选择器共享同一个控制流图
+
+
+# 描述：Vm以及参数推断循环的事件回调，所有方法默认什么都不做，子类只需要覆盖关心的事件
+class Tracer:
+    # 执行完一条指令，pc是这条指令的位置，ret是Vm.step()的返回值
+    def on_step(self, vm: 'Vm', pc: int, ret: tuple):
+        pass
+
+    # 参数推断把栈顶的元素替换为了新的Tag，old是产生它的操作数(例如Arg -> ArgDynamicLength中的Arg)
+    def on_tag(self, vm: 'Vm', old: int | Tag, new: Tag):
+        pass
+
+    # 参数推断给calldata中offset处的参数确定了类型，''表示还不知道类型
+    def on_type(self, selector: bytes, offset: int, type_: str):
+        pass
+
+    # 一个函数选择器的分析结束，result是arguments.py中的ArgumentsResult，steps是该选择器执行的步数(包括dispatcher)
+    def on_termination(self, selector: bytes, result: Any, steps: int):
+        pass
+## Tracer类：代替原来写死在热路径上的print，通过Vm.set_tracer()或者function_arguments(..., tracer=)挂载，内置的统计实现见tracing.py中的MetricsCollector
+## 实际应用：没有挂载tracer的时候Vm.step就是原来的方法，不会多执行任何判断
+
+
 ## Vm类：每一个Vm类都是一个EVM虚拟机，只不过这个EVM虚拟机只实现了判断当前操作是否是和处理函数参数信息相关的操作
 ## 实际应用：当进入一个函数选择器之后，便会开始处理参数信息的阶段，此时操作码开始在此EVM中执行，当处理完和参数信息相关的操作之后，会出现在不在该EVM中的操作码，此时抛出UnsupportedOpError异常
 class Vm:
-    def __init__(self, *, code: bytes, calldata: CallData):
-        self.code = code
+    # LockstepVm按lane执行了最近一步时，每个lane的返回值以及这一步推入栈中的元素个数，普通的Vm总是None
+    lane_rets: list[tuple] | None = None
+    lane_outputs = 0
+    # arguments.py中function_arguments_explore的_Explorer，每一步之后调用explorer.after_step(vm, pc, ret)，只通过set_explorer()挂载
+    explorer: Any = None
+
+    def __init__(self, *, code: bytes | memoryview, calldata: CallData, tracer: Tracer | None = None, governor: 'Governor | None' = None, fuse: bool = False):
+        self.decoded = decode_code(code)
+        # 使用DecodedCode中的副本，传入的memoryview(例如corpus.py中mmap的切片)不会被vm引用
+        self.code = self.decoded.ops
         self.pc = 0
         self.stack = Stack()
         self.memory = Memory()
         self.stopped = False
         self.calldata = calldata
+        self.tracer = None
+        self.governor = None
+        # 是否使用_compile_run融合连续的纯栈操作，挂载了tracer时为了让tracer看到每一条指令，不会融合
+        self.fuse = fuse
+        # 已经执行的步数，只在挂载了tracer的时候计数
+        self.steps = 0
+        if tracer is not None:
+            self.set_tracer(tracer)
+        if governor is not None:
+            self.set_governor(governor)
+        if fuse:
+            self._select_step()
 
     def __str__(self):
         return '\n'.join(
@@ -41,21 +766,69 @@ class Vm:
             )
         )
 
+    # stack和memory都是写时复制的快照，fork一个vm不需要复制栈和内存中的数据
     def __copy__(self):
-        obj = Vm(code=self.code, calldata=self.calldata)
+        obj = Vm(code=self.code, calldata=self.calldata, tracer=self.tracer, governor=self.governor, fuse=self.fuse)
         obj.pc = self.pc
-        obj.memory._seq = self.memory._seq
-        obj.memory._data = self.memory._data[:]
-        obj.stack._data = self.stack._data[:]
+        obj.memory = self.memory.__copy__()
+        obj.stack = self.stack.__copy__()
         obj.stopped = self.stopped
+        obj.steps = self.steps
         return obj
 
+    # 挂载tracer时把vm的类换成_HookedVm，卸载时换回Vm，所以没有tracer的vm执行的还是原来的step
+    def set_tracer(self, tracer: Tracer | None):
+        self.tracer = tracer
+        self._select_step()
+
+    # governor和tracer一样通过_HookedVm挂载，同时把内存扩展的上限设置到memory上
+    def set_governor(self, governor: 'Governor | None'):
+        self.governor = governor
+        self.memory.limit = None if governor is None else governor.max_memory
+        self._select_step()
+
+    # 探索模式和tracer一样通过替换类挂载，fork出来的vm不会继承explorer
+    def set_explorer(self, explorer: Any):
+        self.explorer = explorer
+        self._select_step()
+
+    # 不把绑定方法保存为实例属性(vm -> 方法 -> vm的循环引用会让vm和它的内存只能等到gc时才释放)，而是替换vm的类
+    def _select_step(self):
+        if self.explorer is not None:
+            self.__class__ = _ExploringVm
+        elif self.governor is not None or self.tracer is not None:
+            self.__class__ = _HookedVm
+        else:
+            self.__class__ = _FusedVm if self.fuse else Vm
+
+    # pc处是一段可以融合的栈操作时一次执行完，否则和Vm.step()相同
+    def _fused_step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        fused = self.decoded.fused
+        pc = self.pc
+        try:
+            run = fused[pc]
+        except KeyError:
+            run = fused[pc] = _compile_run(self.decoded, pc)
+        if run is not None:
+            ret = run(self)
+            if ret is not None:
+                return ret
+        return Vm.step(self)
+
+    def _traced_step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        pc = self.pc
+        ret = Vm.step(self)
+        self.steps += 1
+        self.tracer.on_step(self, pc, ret)
+        return ret
+
     def current_op(self) -> OpCode:
-        return OpCode(self.code[self.pc])
+        return self.decoded.ops[self.pc]
 
     def step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
         # 当前栈操作码
-        op = self.current_op()
+        pc = self.pc
+        op = self.decoded.ops[pc]
         '''
             1.if op in {
                 Op.EQ,Op.LT,Op.GT,Op.SUB,Op.ADD,Op.DIV,Op.MUL,Op.EXP,Op.XOR,Op.AND,Op.OR,Op.SHR,Op.SHL,Op.BYTE,
@@ -65,210 +838,472 @@ class Vm:
             4.if op in MLOAD，则ret(gas_used,MLOAD加载出来的值)
             5.if op in SIGNEXTEND，则ret(gas_used,operand1,operand2)
         '''
-        ret = self._exec_opcode(op)
-        if op not in {Op.JUMP, Op.JUMPI}:
-            self.pc += 1
+        ret = _OPCODE_HANDLERS[op](self, op)
+        if op not in _JUMP_OPS:
+            self.pc = self.decoded.next_pc[pc]
 
         if self.pc >= len(self.code):
 
             self.stopped = True
         return (op, *ret)
 
-    # 能改变指令序号的操作码本身是：1.PUSH类，他推入数据的长度会对后续操作码序号产生影响 2.JUMP/JUMPI操作码，他跳转的目的地会决定下一个指令的序号
+    # 能改变指令序号的操作码本身是：1.PUSH类，他推入数据的长度会对后续操作码序号产生影响(由decoded.next_pc处理) 2.JUMP/JUMPI操作码，他跳转的目的地会决定下一个指令的序号
+    # 每个操作码对应_OPCODE_HANDLERS中的一个处理函数，以操作码的字节作为下标直接取出，不再需要像match/case那样按顺序逐个匹配
     def _exec_opcode(self, op: OpCode) -> tuple[int, *tuple[Any, ...]]:
-        match op:
-        #n代表当前PUSH类操作和PUSH0之间的距离
-            case op if op >= Op.PUSH0 and op <= Op.PUSH32:
-                n = op - Op.PUSH0
-                # arg从字节码中获取PUSH操作推入的数据
-                args = self.code[(self.pc + 1) : (self.pc + 1 + n)].rjust(32, b'\x00')
-                self.stack.push(args)
-                self.pc += n
-                return (2 if n == 0 else 3,)
-
-            case op if op in {Op.JUMP, Op.JUMPI}:
-                s0 = self.stack.pop_uint()
-                if op == Op.JUMPI:
-                    s1 = self.stack.pop_uint()
-                    # 条件跳转为假，不跳转
-                    if s1 == 0:
-                        self.pc += 1
-                        return (10,)
-                # 跳转不在范围内
-                if s0 >= len(self.code) or self.code[s0] != Op.JUMPDEST:
-                    raise UnsupportedOpError(op)
-                self.pc = s0
-                return (8 if op == Op.JUMP else 10,)
-
-            case op if op >= Op.DUP1 and op <= Op.DUP16:
-                self.stack.dup(op - Op.DUP1 + 1)
-                return (3,)
-
-            case Op.JUMPDEST:
-                return (1,)
-
-            case Op.REVERT:
-                # skip 2 stack pop()s
-                self.stopped = True
-                print("yep!")
-                return (4,)
-
-            case op if op in {
-                Op.EQ,
-                Op.LT,
-                Op.GT,
-                Op.SUB,
-                Op.ADD,
-                Op.DIV,
-                Op.MUL,
-                Op.EXP,
-                Op.XOR,
-                Op.AND,
-                Op.OR,
-                Op.SHR,
-                Op.SHL,
-                Op.BYTE,
-            }:
-                raws0 = self.stack.pop()
-                raws1 = self.stack.pop()
-
-                s0 = int.from_bytes(raws0, 'big', signed=False)
-                s1 = int.from_bytes(raws1, 'big', signed=False)
-
-                gas_used = 3
-                match op:
-                    case Op.EQ:
-                        res = 1 if s0 == s1 else 0
-                    case Op.LT:
-                        res = 1 if s0 < s1 else 0
-                    case Op.GT:
-                        res = 1 if s0 > s1 else 0
-                    case Op.SUB:
-                        res = (s0 - s1) & E256M1
-                    case Op.ADD:
-                        res = (s0 + s1) & E256M1
-                    case Op.DIV:
-                        res = 0 if s1 == 0 else s0 // s1
-                        gas_used = 5
-                    case Op.MUL:
-                        res = (s0 * s1) & E256M1
-                        gas_used = 5
-                    case Op.EXP:
-                        res = pow(s0, s1, E256)
-                        gas_used = 50 * (1 + (s1.bit_length() // 8))  # ~approx
-                    case Op.XOR:
-                        res = s0 ^ s1
-                    case Op.AND:
-                        res = s0 & s1
-                    case Op.OR:
-                        res = s0 | s1
-                    case Op.SHR:
-                        res = 0 if s0 >= 256 else (s1 >> s0) & E256M1
-                    case Op.SHL:
-                        res = 0 if s0 >= 256 else (s1 << s0) & E256M1
-                    case Op.BYTE:
-                        res = 0 if s0 >= 32 else raws1[s0]
-                    case _:
-                        raise Exception(f'BUG: op {op} not handled in match')
-
-                self.stack.push_uint(res)
-                # print("+++++++++++++++++++")
-                # print(gas_used, raws0, raws1)
-                # print("+++++++++++++++++++")
-                return (gas_used, raws0, raws1)
-
-            case op if op in {Op.SLT, Op.SGT}:
-                raws0 = self.stack.pop()
-                raws1 = self.stack.pop()
-
-                s0 = int.from_bytes(raws0, 'big', signed=True)
-                s1 = int.from_bytes(raws1, 'big', signed=True)
-                if op == Op.SLT:
-                    res = 1 if s0 < s1 else 0
-                else:
-                    res = 1 if s0 > s1 else 0
-                self.stack.push_uint(res)
-                return (3,)
-
-            case Op.ISZERO:
-                raws0 = self.stack.pop()
-                s0 = int.from_bytes(raws0, 'big', signed=False)
-                res = 0 if s0 else 1
-                self.stack.push_uint(res)
-                return (3, raws0)
-
-            case Op.POP:
-                self.stack.pop()
-                return (2,)
-
-            case Op.CALLVALUE:
-                self.stack.push_uint(0)  # msg.value == 0
-                return (2,)
-
-            case Op.CALLDATALOAD:
-                raws0 = self.stack.pop()
-                # print("===================")
-                # print(raws0)
-                # print("===================")
-                offset = int.from_bytes(raws0, 'big', signed=False)
-                self.stack.push(self.calldata.load(offset))
-                return (3, raws0)
-
-            case Op.CALLDATASIZE:
-                self.stack.push_uint(len(self.calldata))
-                return (2,)
-
-            case op if op >= Op.SWAP1 and op <= Op.SWAP16:
-                self.stack.swap(op - Op.SWAP1 + 1)
-                return (3,)
-
-            case Op.MSTORE:
-                offset = self.stack.pop_uint()
-                value = self.stack.pop()
-                self.memory.store(offset, value)
-                return (3,)
-
-            case Op.MLOAD:
-                offset = self.stack.pop_uint()
-                # used应该是指MLOAD加载的操作数
-                val, used = self.memory.load(offset)
-                self.stack.push(val)
-                return (4, used)
-
-            case Op.NOT:
-                s0 = self.stack.pop_uint()
-                self.stack.push_uint(E256M1 - s0)
-                return (3,)
-
-            case Op.SIGNEXTEND:
-                s0 = self.stack.pop_uint()
-                raws1 = self.stack.pop()
-                s1 = int.from_bytes(raws1, 'big', signed=False)
-                if s0 <= 31:
-                    sign_bit = 1 << (s0 * 8 + 7)
-                    if s1 & sign_bit:
-                        res = s1 | (E256 - sign_bit)
-                    else:
-                        res = s1 & (sign_bit - 1)
-                else:
-                    res = s1
-
-                self.stack.push_uint(res)
-                return (5, s0, raws1)
-
-            case Op.ADDRESS:
-                self.stack.push_uint(1)
-                return (2,)
-
-            case Op.CALLDATACOPY:
-                mem_off = self.stack.pop_uint()
-                src_off = self.stack.pop_uint()
-                size = self.stack.pop_uint()
-                if size > 256:
-                    raise UnsupportedOpError(op)
-                value = self.calldata.load(src_off, size)
-                self.memory.store(mem_off, value)
-                return (4,)
-
-            case _:
-                raise UnsupportedOpError(op)
+        return _OPCODE_HANDLERS[op](self, op)
+
+    def _op_unsupported(self, op: OpCode):
+        raise UnsupportedOpError(op)
+
+    def _op_push(self, op: OpCode):
+        # PUSH推入的数据已经在decode_code中解码好了
+        self.stack.push(self.decoded.imm[self.pc])
+        return (2 if op == Op.PUSH0 else 3,)
+
+    def _op_jump(self, op: OpCode):
+        s0 = self.stack.pop_uint()
+        # 跳转不在范围内，或者跳转目的地不是合法的JUMPDEST
+        if not self.decoded.is_jumpdest(s0):
+            raise UnsupportedOpError(op)
+        self.pc = s0
+        return (8,)
+
+    # 返回(gas_used,跳转的目的地,跳转条件)，function_arguments_explore根据它们fork出另一个分支
+    def _op_jumpi(self, op: OpCode):
+        s0 = self.stack.pop_uint()
+        s1 = self.stack.pop_uint()
+        # 条件跳转为假，不跳转
+        if s1 == 0:
+            self.pc += 1
+            return (10, s0, s1)
+        if not self.decoded.is_jumpdest(s0):
+            raise UnsupportedOpError(op)
+        self.pc = s0
+        return (10, s0, s1)
+
+    def _op_dup(self, op: OpCode):
+        self.stack.dup(op - Op.DUP1 + 1)
+        return (3,)
+
+    def _op_swap(self, op: OpCode):
+        self.stack.swap(op - Op.SWAP1 + 1)
+        return (3,)
+
+    def _op_jumpdest(self, op: OpCode):
+        return (1,)
+
+    def _op_revert(self, op: OpCode):
+        # skip 2 stack pop()s
+        self.stopped = True
+        return (4,)
+
+    # 下面的二元运算都返回(gas_used,operand1,operand2)，operand是栈中的元素本身(int或者Tag)
+    def _op_eq(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(1 if int(raws0) == int(raws1) else 0)
+        return (3, raws0, raws1)
+
+    def _op_lt(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(1 if int(raws0) < int(raws1) else 0)
+        return (3, raws0, raws1)
+
+    def _op_gt(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(1 if int(raws0) > int(raws1) else 0)
+        return (3, raws0, raws1)
+
+    def _op_sub(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push((int(raws0) - int(raws1)) & E256M1)
+        return (3, raws0, raws1)
+
+    def _op_add(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push((int(raws0) + int(raws1)) & E256M1)
+        return (3, raws0, raws1)
+
+    def _op_div(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        s1 = int(raws1)
+        self.stack.push(0 if s1 == 0 else int(raws0) // s1)
+        return (5, raws0, raws1)
+
+    def _op_mul(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push((int(raws0) * int(raws1)) & E256M1)
+        return (5, raws0, raws1)
+
+    def _op_exp(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        s1 = int(raws1)
+        self.stack.push(pow(int(raws0), s1, E256))
+        return (50 * (1 + (s1.bit_length() // 8)), raws0, raws1)  # ~approx
+
+    def _op_xor(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(int(raws0) ^ int(raws1))
+        return (3, raws0, raws1)
+
+    def _op_and(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(int(raws0) & int(raws1))
+        return (3, raws0, raws1)
+
+    def _op_or(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        self.stack.push(int(raws0) | int(raws1))
+        return (3, raws0, raws1)
+
+    def _op_shr(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        s0 = int(raws0)
+        self.stack.push(0 if s0 >= 256 else (int(raws1) >> s0) & E256M1)
+        return (3, raws0, raws1)
+
+    def _op_shl(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        s0 = int(raws0)
+        self.stack.push(0 if s0 >= 256 else (int(raws1) << s0) & E256M1)
+        return (3, raws0, raws1)
+
+    def _op_byte(self, op: OpCode):
+        raws0 = self.stack.pop()
+        raws1 = self.stack.pop()
+        s0 = int(raws0)
+        self.stack.push(0 if s0 >= 32 else (int(raws1) >> (8 * (31 - s0))) & 0xFF)
+        return (3, raws0, raws1)
+
+    def _op_slt(self, op: OpCode):
+        s0 = _to_signed(self.stack.pop_uint())
+        s1 = _to_signed(self.stack.pop_uint())
+        self.stack.push(1 if s0 < s1 else 0)
+        return (3,)
+
+    def _op_sgt(self, op: OpCode):
+        s0 = _to_signed(self.stack.pop_uint())
+        s1 = _to_signed(self.stack.pop_uint())
+        self.stack.push(1 if s0 > s1 else 0)
+        return (3,)
+
+    def _op_iszero(self, op: OpCode):
+        raws0 = self.stack.pop()
+        self.stack.push(0 if int(raws0) else 1)
+        return (3, raws0)
+
+    def _op_pop(self, op: OpCode):
+        self.stack.pop()
+        return (2,)
+
+    def _op_callvalue(self, op: OpCode):
+        self.stack.push(0)  # msg.value == 0
+        return (2,)
+
+    def _op_calldataload(self, op: OpCode):
+        raws0 = self.stack.pop()
+        v = self.calldata.word(int(raws0))
+        self.stack.push(_ZERO_CALLDATA_WORD if v == 0 else CallDataValue(v))
+        return (3, raws0)
+
+    def _op_calldatasize(self, op: OpCode):
+        self.stack.push(len(self.calldata))
+        return (2,)
+
+    def _op_mstore(self, op: OpCode):
+        offset = self.stack.pop_uint()
+        value = self.stack.pop()
+        # 只有在这里才需要把int转换为32字节的bytes
+        self.memory.store(offset, int(value).to_bytes(32, 'big'), None if type(value) is int else value)
+        return (3,)
+
+    def _op_mload(self, op: OpCode):
+        offset = self.stack.pop_uint()
+        # used应该是指MLOAD加载的操作数
+        val, used = self.memory.load(offset)
+        self.stack.push(val)
+        return (4, used)
+
+    def _op_not(self, op: OpCode):
+        s0 = self.stack.pop_uint()
+        self.stack.push(E256M1 - s0)
+        return (3,)
+
+    def _op_signextend(self, op: OpCode):
+        s0 = self.stack.pop_uint()
+        raws1 = self.stack.pop()
+        s1 = int(raws1)
+        if s0 <= 31:
+            sign_bit = 1 << (s0 * 8 + 7)
+            if s1 & sign_bit:
+                res = s1 | (E256 - sign_bit)
+            else:
+                res = s1 & (sign_bit - 1)
+        else:
+            res = s1
+
+        self.stack.push(res)
+        return (5, s0, raws1)
+
+    def _op_address(self, op: OpCode):
+        self.stack.push(1)
+        return (2,)
+
+    def _op_calldatacopy(self, op: OpCode):
+        mem_off = self.stack.pop_uint()
+        raws1 = self.stack.pop()
+        src_off = int(raws1)
+        size = self.stack.pop_uint()
+        # 只有和calldata重叠的开头(最多是选择器的4个字节)需要真正写入，剩下的都是0，作为一个区间记录
+        head = min(size, max(0, len(self.calldata) - src_off))
+        if head > 0:
+            value = self.calldata.load(src_off, head)
+            self.memory.store(mem_off, value, CallDataCopy(int.from_bytes(value, 'big'), raws1, src_off))
+        self.memory.store_range(mem_off + head, size - head, CallDataCopy(0, raws1, src_off + head))
+        return (4, raws1)
+
+
+class _HookedVm(Vm):
+    def step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        # 先检查步数和截止时间，超出时抛出ResourceLimitError，这一步不会被执行
+        # 融合之后一段连续的栈操作只算一步
+        if self.governor is not None:
+            self.governor.check()
+        if self.tracer is not None:
+            return self._traced_step()
+        if self.fuse:
+            return self._fused_step()
+        return Vm.step(self)
+## _HookedVm类：挂载了tracer或者governor的vm，step()依次执行这些钩子，最后执行Vm.step()
+
+
+class _FusedVm(Vm):
+    step = Vm._fused_step
+## _FusedVm类：只开启了fuse的vm，step()就是_fused_step()，不需要经过_HookedVm中的判断
+
+
+class _ExploringVm(Vm):
+    def step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        pc = self.pc
+        ret = _HookedVm.step(self)
+        self.explorer.after_step(self, pc, ret)
+        return ret
+## _ExploringVm类：挂载了explorer的vm，执行完_HookedVm中的钩子和这一步之后通知explorer
+
+
+# 以操作码的字节作为下标的处理函数表，没有实现的操作码都会抛出UnsupportedOpError
+def _build_opcode_handlers() -> list:
+    handlers = [Vm._op_unsupported] * 256
+    for op in range(Op.PUSH0, Op.PUSH32 + 1):
+        handlers[op] = Vm._op_push
+    for op in range(Op.DUP1, Op.DUP16 + 1):
+        handlers[op] = Vm._op_dup
+    for op in range(Op.SWAP1, Op.SWAP16 + 1):
+        handlers[op] = Vm._op_swap
+    for op, handler in (
+        (Op.JUMP, Vm._op_jump),
+        (Op.JUMPI, Vm._op_jumpi),
+        (Op.JUMPDEST, Vm._op_jumpdest),
+        (Op.REVERT, Vm._op_revert),
+        (Op.EQ, Vm._op_eq),
+        (Op.LT, Vm._op_lt),
+        (Op.GT, Vm._op_gt),
+        (Op.SUB, Vm._op_sub),
+        (Op.ADD, Vm._op_add),
+        (Op.DIV, Vm._op_div),
+        (Op.MUL, Vm._op_mul),
+        (Op.EXP, Vm._op_exp),
+        (Op.XOR, Vm._op_xor),
+        (Op.AND, Vm._op_and),
+        (Op.OR, Vm._op_or),
+        (Op.SHR, Vm._op_shr),
+        (Op.SHL, Vm._op_shl),
+        (Op.BYTE, Vm._op_byte),
+        (Op.SLT, Vm._op_slt),
+        (Op.SGT, Vm._op_sgt),
+        (Op.ISZERO, Vm._op_iszero),
+        (Op.POP, Vm._op_pop),
+        (Op.CALLVALUE, Vm._op_callvalue),
+        (Op.CALLDATALOAD, Vm._op_calldataload),
+        (Op.CALLDATASIZE, Vm._op_calldatasize),
+        (Op.MSTORE, Vm._op_mstore),
+        (Op.MLOAD, Vm._op_mload),
+        (Op.NOT, Vm._op_not),
+        (Op.SIGNEXTEND, Vm._op_signextend),
+        (Op.ADDRESS, Vm._op_address),
+        (Op.CALLDATACOPY, Vm._op_calldatacopy),
+    ):
+        handlers[op] = handler
+    return handlers
+
+
+def _to_signed(v: int) -> int:
+    return v - E256 if v >> 255 else v
+
+
+_OPCODE_HANDLERS = _build_opcode_handlers()
+_JUMP_OPS = frozenset((Op.JUMP, Op.JUMPI))
+## _OPCODE_HANDLERS：256个元素的处理函数表，取代了原来_exec_opcode中按顺序匹配的match/case(包括二元运算内部嵌套的match)
+## 实际应用：SWAP、MSTORE这样的操作码不再需要先经过十几个失败的case才能被执行
+
+
+# 描述：多个calldata同步执行(lockstep)，一次执行代替对每个探测calldata分别执行一遍
+'''全0的CallData(selector)只能走一条路径，依赖参数值的布局(数组长度、偏移量)需要用不同的探测calldata分别执行，而大部分步骤(dispatcher、栈操作)在每个calldata中都完全相同
+   LockstepVm(code=code, lanes=[CallData(...), ...])的执行流程：
+   step1：每个lane是一个calldata，所有lane共享pc、内存以及栈中相同的元素；只有在lane之间不同的元素才保存为Lanes(每个lane的值)
+   step2：PUSH/DUP/SWAP/POP/JUMPDEST/REVERT只移动元素，和普通的Vm一样执行一次；其余操作码只有在操作数中有Lanes或者读取calldata时才按lane执行，每个lane把Lanes换成自己的值执行一次，结果相同的合并回一个元素
+   step3：JUMP/JUMPI在各个lane中的下一条指令不同，或者MSTORE/MLOAD/CALLDATACOPY需要在内存中保存不同的值时，在执行之前抛出LaneDivergence，调用者通过split()按照lane分组拆成多个vm继续执行，只剩一个lane的组就是普通的Vm
+   按lane执行的那一步，lane_rets中是每个lane的返回值，arguments.py对每个lane分别执行推断规则
+   LockstepVm自己处理tracer和governor，不会被替换为_HookedVm，也不支持fuse
+'''
+class Lanes(tuple):
+    __slots__ = ()
+## Lanes类：栈中在各个lane中值不同的元素，第i项是第i个lane中的值(int或者Tag)，所有lane都相同的元素不会被包装
+
+
+class LaneDivergence(Exception):
+    def __init__(self, groups: list[list[int]]):
+        super().__init__(f'lanes diverge into {len(groups)} groups')
+        self.groups = groups # 按照lane的序号分组，第一组总是包含lane 0
+## LaneDivergence类：LockstepVm在执行一步之前发现lane之间无法继续共享状态时抛出，这一步还没有被执行
+
+
+# 所有lane中类型和值都相同时合并为一个元素(取lane 0的对象)，否则返回Lanes
+def merge_lanes(vals: list) -> 'int | Tag | Lanes':
+    v0 = vals[0]
+    t0 = type(v0)
+    i0 = int(v0)
+    for v in vals:
+        if type(v) is not t0 or int(v) != i0:
+            return Lanes(vals)
+    return v0
+
+
+# 需要按lane执行的操作码 -> (从栈中弹出的元素个数, 推入栈中的元素个数)，不在表中的操作码只移动元素或者不被支持
+_LANE_STACK_EFFECT: dict[int, tuple[int, int]] = {
+    Op.JUMP: (1, 0),
+    Op.JUMPI: (2, 0),
+    Op.ISZERO: (1, 1),
+    Op.NOT: (1, 1),
+    Op.CALLDATALOAD: (1, 1),
+    Op.CALLDATASIZE: (0, 1),
+    Op.MLOAD: (1, 1),
+    Op.MSTORE: (2, 0),
+    Op.CALLDATACOPY: (3, 0),
+}
+for _op in (Op.EQ, Op.LT, Op.GT, Op.SUB, Op.ADD, Op.DIV, Op.MUL, Op.EXP, Op.XOR, Op.AND, Op.OR, Op.SHR, Op.SHL, Op.BYTE, Op.SLT, Op.SGT, Op.SIGNEXTEND):
+    _LANE_STACK_EFFECT[_op] = (2, 1)
+# 读取calldata的操作码，即使操作数相同，每个lane的结果也可能不同
+_LANE_CALLDATA_OPS = frozenset((Op.CALLDATALOAD, Op.CALLDATASIZE))
+# 内存中不保存Lanes，这些操作码的操作数中有Lanes时只能拆开
+_LANE_MEMORY_OPS = frozenset((Op.MSTORE, Op.MLOAD))
+
+
+class LockstepVm(Vm):
+    def __init__(self, *, code: bytes | memoryview, lanes: list[CallData], tracer: Tracer | None = None, governor: 'Governor | None' = None):
+        self.lanes = lanes
+        super().__init__(code=code, calldata=lanes[0], tracer=tracer, governor=governor)
+
+    def __copy__(self):
+        obj = LockstepVm(code=self.code, lanes=self.lanes, tracer=self.tracer, governor=self.governor)
+        obj.pc = self.pc
+        obj.memory = self.memory.__copy__()
+        obj.stack = self.stack.__copy__()
+        obj.stopped = self.stopped
+        obj.steps = self.steps
+        return obj
+
+    # step()自己执行tracer和governor的钩子，类不需要替换
+    def _select_step(self):
+        pass
+
+    def step(self) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        if self.governor is not None:
+            self.governor.check()
+        pc = self.pc
+        op = self.decoded.ops[pc]
+        self.lane_rets = None
+        effect = _LANE_STACK_EFFECT.get(op)
+        data = self.stack._data
+        if effect is None or len(data) < effect[0]:
+            ret = Vm.step(self)
+        else:
+            inputs = data[len(data) - effect[0] :]
+            if op in _LANE_CALLDATA_OPS or op == Op.CALLDATACOPY or any(type(v) is Lanes for v in inputs):
+                ret = self._lane_step(pc, op, effect[1], inputs)
+            else:
+                ret = Vm.step(self)
+        if self.tracer is not None:
+            self.steps += 1
+            self.tracer.on_step(self, pc, ret)
+        return ret
+
+    def _lane_step(self, pc: int, op: int, n_out: int, inputs: list) -> tuple[OpCode, int, *tuple[Any, ...]]:
+        n = len(self.lanes)
+        if op == Op.CALLDATACOPY or op in _LANE_MEMORY_OPS:
+            raise LaneDivergence([[i] for i in range(n)])
+        if op == Op.JUMP or op == Op.JUMPI:
+            # 先算出每个lane的下一条指令，不同时按照下一条指令分组
+            groups: dict[int, list[int]] = {}
+            for i in range(n):
+                dest = int(_lane(inputs[-1], i))
+                if op == Op.JUMPI and int(_lane(inputs[-2], i)) == 0:
+                    dest = pc + 1
+                groups.setdefault(dest, []).append(i)
+            if len(groups) > 1:
+                raise LaneDivergence(list(groups.values()))
+
+        stack = self.stack
+        for _ in inputs:
+            stack.pop()
+        rets = []
+        outs = []
+        for i in range(n):
+            for v in inputs:
+                stack.push(_lane(v, i))
+            self.pc = pc
+            self.calldata = self.lanes[i]
+            rets.append(Vm.step(self))
+            outs.append([stack.pop() for _ in range(n_out)])
+        self.calldata = self.lanes[0]
+        for j in reversed(range(n_out)):
+            stack.push(merge_lanes([o[j] for o in outs]))
+        self.lane_rets = rets
+        self.lane_outputs = n_out
+        return tuple(merge_lanes([r[k] for r in rets]) for k in range(len(rets[0])))
+
+    # 按照groups拆成多个vm，只有一个lane的组是普通的Vm，栈和内存都是写时复制的快照
+    def split(self, groups: list[list[int]]) -> list[Vm]:
+        vms = []
+        for group in groups:
+            if len(group) == 1:
+                i = group[0]
+                vm = Vm(code=self.code, calldata=self.lanes[i], tracer=self.tracer, governor=self.governor)
+                data = [_lane(v, i) for v in self.stack._data]
+            else:
+                vm = LockstepVm(code=self.code, lanes=[self.lanes[i] for i in group], tracer=self.tracer, governor=self.governor)
+                data = [merge_lanes([v[i] for i in group]) if type(v) is Lanes else v for v in self.stack._data]
+            vm.pc = self.pc
+            vm.memory = self.memory.__copy__()
+            vm.stack._data = data
+            vm.stopped = self.stopped
+            vm.steps = self.steps
+            vms.append(vm)
+        return vms
+## LockstepVm类：arguments.py中的function_arguments_probes使用，lane一致的时候所有探测calldata只需要执行一遍
+
+
+def _lane(v: 'int | Tag | Lanes', i: int) -> int | Tag:
+    return v[i] if type(v) is Lanes else v
@@ -1,66 +1,127 @@
+from typing import TYPE_CHECKING
+
+from opcodes import Op
+from utils import to_bytes
+from VM import (
+    E256M1,
+    CallData,
+    CallDataCopy,
+    CallDataValue,
+    DecodedCode,
+    LaneDivergence,
+    Lanes,
+    LockstepVm,
+    ResourceLimitError,
+    Stack,
+    StackIndexError,
+    Tag,
+    Tracer,
+    UnsupportedOpError,
+    Vm,
+    merge_lanes,
+    set_unfused_ops,
+)
+
+if TYPE_CHECKING:
+    from governor import Governor
+
+
 # 关键类 
 
 # 描述：在EVM的calldata中，除了function_selector以外的其他数据，每一个都是Arg类,或者是Arg类的子类
-class Arg(bytes):
+class Arg(Tag):
+    __slots__ = ('offset', 'dynamic')
     offset: int #该数据在CALLDATA中的位置
     dynamic: bool # 该数据是否为动态数据
 
-    # 这里是对于一个战中的处理数据而言，获取其序号offset，是否是动态数据dynamic,dynamic默认为静态，以及具体的数据bytes,默认为32字节的0
-    def __new__(cls, *, offset: int, dynamic: bool = False, val: bytes = b'\x00' * 32):
-        v = super().__new__(cls, val)
-        v.dynamic = dynamic
-        v.offset = offset
-        return v
+    # 这里是对于一个战中的处理数据而言，获取其序号offset，是否是动态数据dynamic,dynamic默认为静态，以及具体的数据val,默认为0
+    def __init__(self, *, offset: int, dynamic: bool = False, val: int = 0):
+        self.val = val
+        self.dynamic = dynamic
+        self.offset = offset
 
     def __repr__(self):
         return f'arg({self.offset},{self.dynamic})'
 ## Arg类：作为CallData中每一个数据的基础类(出函数选择器外)，如果一个bytes类型的数据被CALLDATALOAD操作处理后，将该bytes类型数据升级为Arg类。拥有两个属性1.offset 该数据在CallData中的位置 2.dynamic 该数据是否是动态数据
-## Arg类方法：1._new_()该方法在创建一个新的Arg类的时候会自动执行，offset默认为int类型，dynamic默认为false,val表示该Arg类型的值，默认为32字节的0 2.__repr__()该方法打印当前数据的信息
+## Arg类方法：1.__init__()该方法在创建一个新的Arg类的时候会自动执行，offset默认为int类型，dynamic默认为false,val表示该Arg类型的值，默认为0 2.__repr__()该方法打印当前数据的信息
 ## 实际应用：在本项目中，EVM执行时CALLDATALOAD操作处理的每一个数据至少都是Arg，可能是Arg的子类
-========================================================================================================================================================================================
+
 # 描述：可能是想用来作为描述动态数据长度的类
-class ArgDynamicLength(bytes):
+class ArgDynamicLength(Tag):
+    __slots__ = ('offset',)
     offset: int
 
-    def __new__(cls, *, offset: int):
-        # v的最低字段是1,其余全是0
-        v = super().__new__(cls, (1).to_bytes(32, 'big'))
-        v.offset = offset
-        return v
+    # 动态数据的长度默认为1(全0的calldata中长度是0，当作1才能执行一遍处理元素的代码)，function_arguments_probes中使用探测calldata给出的长度
+    def __init__(self, *, offset: int, val: int = 1):
+        self.val = val
+        self.offset = offset
 
     def __repr__(self):
         return f'dlen({self.offset})'
 
 ## ArgDynamicLength类：如果一个Arg类的数据被CALLDATALOAD操作码处理了，则将该Arg类型的数据从Arg类升级为ArgDynamicLength类型数据。
-========================================================================================================================================================================================
+
 # ArgDynamic代表的是动态数据在calldata中的存储位置
-class ArgDynamic(bytes):
+class ArgDynamic(Tag):
+    __slots__ = ('offset',)
     offset: int
 
-    def __new__(cls, *, offset: int, val: bytes):
-        v = super().__new__(cls, val)
-        v.offset = offset
-        return v
+    def __init__(self, *, offset: int, val: int):
+        self.val = val
+        self.offset = offset
 
     def __repr__(self):
         return f'darg({self.offset})'
 ## ArgDynamic类：如果一个Arg类的数据被ADD操作码进行了处理，且该Arg类型的数据不是函数选择器，则将该Arg类型的数据升级到ArgDynamic类型。
-========================================================================================================================================================================================
 
-class IsZeroResult(bytes):
+
+class IsZeroResult(Tag):
+    __slots__ = ('offset', 'dynamic')
     offset: int
     dynamic: bool
 
-    def __new__(cls, *, offset: int, dynamic: bool, val: bytes):
-        v = super().__new__(cls, val)
-        v.offset = offset
-        v.dynamic = dynamic
-        return v
+    def __init__(self, *, offset: int, dynamic: bool, val: int):
+        self.val = val
+        self.offset = offset
+        self.dynamic = dynamic
 
     def __repr__(self):
         return f'zarg({self.offset})'
 ## IsZeroResult类：如果一个Arg类的数据被ISZERO操作码进行了处理，则将该Arg类型的数据升级到IsZeroResult类型
-========================================================================================================================================================================================
+
+# 描述：dispatcher中由calldata的前4个字节(函数选择器)计算得到的值
+class CallDataSignature(Tag):
+    __slots__ = ()
+## CallDataSignature类：function_arguments_many在dispatcher中使用，如果SHR/DIV/AND/MLOAD的结果的最后4个字节等于calldata中的函数选择器，则将该结果升级为CallDataSignature类型
+## 实际应用：dispatcher中的EQ/XOR/SUB/LT/GT如果有一个操作数是CallDataSignature，说明这是在拿函数选择器和常量做比较，此时可以计算出其他选择器的比较结果，从而fork出对应的vm
+
+# 描述：function_arguments停止执行的原因
+class Termination:
+    STOPPED = 'stopped' # EVM执行到了字节码末尾或者REVERT
+    UNSUPPORTED_OP = 'unsupported_op' # 遇到了Vm没有实现的操作码，这也是大部分函数正常结束参数处理的方式
+    STACK_ERROR = 'stack_error' # 栈中的元素不够
+    GAS_OVERFLOW = 'gas_overflow' # 消耗的gas超过了gas_limit
+    NOT_FOUND = 'not_found' # 在dispatcher中没有找到该函数选择器，没有进入过函数体
+    STEP_LIMIT = 'step_limit' # 执行的步数超过了Governor的max_steps
+    DEADLINE = 'deadline' # 超过了Governor的截止时间
+    MEMORY_LIMIT = 'memory_limit' # 内存扩展超过了Governor的max_memory
+    LOOP = 'loop' # 回到了循环的入口，这一轮循环没有产生新的来源标记或者参数类型(探索模式中：并且循环体中找不到可以离开循环的JUMPI)
+    DECODED = 'decoded' # 参数解码已经结束：栈和内存中没有calldata的来源标记，并且不会再执行到读取calldata的基本块
+## Termination类：停止原因的字符串常量，可以直接写入json等结构化的输出中
+
+# 描述：单个函数选择器的分析结果
+class ArgumentsResult:
+    __slots__ = ('arguments', 'reason', 'error')
+
+    def __init__(self, arguments: str, reason: str, error: str | None = None):
+        self.arguments = arguments # 和function_arguments的返回值相同
+        self.reason = reason # Termination中的停止原因
+        self.error = error # 异常的描述，例如UnsupportedOpError(RETURN)
+
+    def __repr__(self):
+        return f'ArgumentsResult({self.arguments!r}, {self.reason}, {self.error})'
+## ArgumentsResult类：function_arguments_results返回的结果，代替原来在执行过程中print出来的异常信息
+
 # 关键函数：
 
 # 描述：整个function_arguments的运行流程
@@ -69,20 +130,20 @@ class IsZeroResult(bytes):
    step3：一个操作执行完之后返回值会被放到ret中，此时栈的状态被更新到操作执行之后的状态
    step4：根据ret中的执行信息，以及栈中的状态去执行具体的参数类型判断操作(此过程同样会对栈中的状态发生改变)
    ===============================================================================================
-   再描述一下整个match的工作流程：
+   再描述一下整个推断规则(RULES)的工作流程：
     step5：
-        1.无论对应于那种类型的数据(动态还是静态)，case (Op.CALLDATALOAD, _, bytes() as offset):都是执行的第一个步骤，该过程会将calldata中出函数选择器以外的其他所有数据都转换为Arg类型的数据
+        1.无论对应于那种类型的数据(动态还是静态)，case (Op.CALLDATALOAD, _, offset):都是执行的第一个步骤，该过程会将calldata中出函数选择器以外的其他所有数据都转换为Arg类型的数据
         2.如果是动态数据，相比于静态数据，会多涉及到(以下过程中所提到的位置均是指在calldata中的位置)：
             case (Op.CALLDATALOAD, _, Arg() as arg):获取动态数据的长度num字段的位置
-            case (Op.ADD, _, Arg() as cd, bytes() as ot) | (Op.ADD, _, bytes() as ot, Arg() as cd):获取动态数据的位置，判断依据就是动态数据紧跟在他的num字段之后
+            case (Op.ADD, _, Arg() as cd, ot) | (Op.ADD, _, ot, Arg() as cd):获取动态数据的位置，判断依据就是动态数据紧跟在他的num字段之后
             case (Op.ADD, _, ArgDynamic() as cd, _) | (Op.ADD, _, _, ArgDynamic() as cd):获取下一个使用的动态数据的位置
             case (Op.CALLDATALOAD, _, ArgDynamic() as arg):从相应的动态数据的位置获取对应的动态数据
         3.模拟参数判断流程：
             对于动态数据，一般情况下，在参数判断的过程中不断地去判断参数类型：
-            1>在获取函数选择器之后进入match
-            2>通过这段代码case (Op.CALLDATALOAD, _, bytes() as offset):该case会创建一个Arg类数据来表示offset字段的位置，该位置存放的值是num字段的位置
+            1>在获取函数选择器之后进入推断规则
+            2>通过这段代码case (Op.CALLDATALOAD, _, offset):该case会创建一个Arg类数据来表示offset字段的位置，该位置存放的值是num字段的位置
             3>通过case (Op.CALLDATALOAD, _, Arg() as arg):该case会创建一个ArgDynamicLength类来表示动态数据num字段的位置，也就是知道该动态数据的长度
-            4>通过case (Op.ADD, _, Arg() as cd, bytes() as ot) | (Op.ADD, _, bytes() as ot, Arg() as cd):该case创建ArgDynamic类，表示在num字段的位置上+20来获取动态参数的第一项数据的位置
+            4>通过case (Op.ADD, _, Arg() as cd, ot) | (Op.ADD, _, ot, Arg() as cd):该case创建ArgDynamic类，表示在num字段的位置上+20来获取动态参数的第一项数据的位置
             5>通过case (Op.CALLDATALOAD, _, ArgDynamic() as arg):来讲具体的动态数据加载到栈中
             6>在屏蔽扩展操作中参数类型不同会采用相应的扩展屏蔽操作
             7>通过case (Op.ADD, _, ArgDynamic() as cd, _) | (Op.ADD, _, _, ArgDynamic() as cd):来加载下一个动态数据的位置
@@ -91,13 +152,58 @@ class IsZeroResult(bytes):
 '''
 
 
+# code可以是十六进制字符串、bytes或者只读的memoryview(例如corpus.py中mmap的切片)，memoryview直接交给decode_code，不做复制
+def _to_code(code: bytes | str | memoryview) -> bytes | memoryview:
+    return code if isinstance(code, memoryview) else to_bytes(code)
 
-def function_arguments(code: bytes | str, selector: bytes | str, gas_limit: int = int(1e4)) -> str:
+
+def function_arguments(
+    code: bytes | str | memoryview,
+    selector: bytes | str,
+    gas_limit: int = int(1e4),
+    *,
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+    fuse: bool = False,
+) -> str:
     bytes_selector = to_bytes(selector)
-    vm = Vm(code=to_bytes(code), calldata=CallData(bytes_selector)) # 传入当前合约的runtime code 创建执行当前合约字节码的EVM，初始化的时候calldata中应该只包含函数选择器，每次处理的是单个函数
-    gas_used = 0 # 消耗的gas，我认为没用 
-    inside_function = False # 判断当前操作码是否是在函数里面，vm虚拟机仅仅只处理函数里面的字节码
-    args: dict[int, str] = {} # 创建参数字典，在calldata中的位置作为键，该参数的类型作为值
+    vm = Vm(code=_to_code(code), calldata=CallData(bytes_selector), tracer=tracer, governor=governor, fuse=fuse) # 传入当前合约的runtime code 创建执行当前合约字节码的EVM，初始化的时候calldata中应该只包含函数选择器，每次处理的是单个函数
+    return _process_function(vm, bytes_selector, gas_limit).arguments
+
+
+# 描述：function_arguments的主循环，从vm当前的状态开始执行，直到EVM停止
+# gas_used和inside_function允许调用者从dispatcher中间的某个状态(例如function_arguments_many中fork出来的vm)继续执行，而不必从pc = 0重新执行
+# explore和args由function_arguments_explore使用：进入函数体之后在JUMPI处fork，参数类型写入调用者传入的args中
+def _process_function(
+    vm: Vm,
+    bytes_selector: bytes,
+    gas_limit: int,
+    *,
+    gas_used: int = 0,
+    inside_function: bool = False,
+    explore: '_Explorer | None' = None,
+    args: dict[int, str] | None = None,
+    report: bool = True,
+) -> ArgumentsResult:
+    # gas_used：消耗的gas，我认为没用
+    # inside_function：判断当前操作码是否是在函数里面，vm虚拟机仅仅只处理函数里面的字节码
+    tracer = vm.tracer
+    # 创建参数字典，在calldata中的位置作为键，该参数的类型作为值，挂载了tracer时每次写入类型都会通知tracer
+    if args is None:
+        args = _new_args(tracer, bytes_selector)
+    # 循环的入口 -> 上一次到达时的(栈中的来源标记, 参数类型)
+    cfg = vm.decoded.cfg
+    loop_heads = cfg.loop_heads
+    loop_seen: dict[int, tuple] = {}
+    # 没有新信息的循环的入口 -> 循环体，在循环体中下一个离开循环体的JUMPI处强制离开
+    # 强制离开会让执行走上具体的calldata不会走的分支，所以只在探索模式中使用，默认模式直接停止(Termination.LOOP)
+    exiting: dict[int, frozenset] = {}
+    # 只有选择器的calldata中，同一个合约的所有选择器可以共享子程序的摘要
+    summaries = None
+    if tracer is None and explore is None and not vm.fuse and len(vm.calldata) == 4 and not isinstance(vm, LockstepVm):
+        summaries = _Summaries(vm.decoded)
+    reason = Termination.STOPPED # 停止执行的原因
+    error = None
     
     # 在这个地方要想停止整个EVM，必须要：1.gas消耗完 2.报错
     # 但是在本项目中所有使得EVM停止的操作都是报错，即遇到非函数参数处理的字节码时报错
@@ -105,172 +211,996 @@ def function_arguments(code: bytes | str, selector: bytes | str, gas_limit: int
         try:
             # 关键步骤：调用EVM中的step()函数，该函数返回一个元组ret：[第一个元素是当前执行的字节码currentOp,第二个元素是当前操作消耗的gas gas_used,第三个元素是从栈顶弹出的当前字节码的操作数operand1,第四个元素是从栈顶弹出的当前字节码的操作数operand2]
             # 注意：该过程中的operand1和operand2并不一定存在，可能为空“_”，第一个原因是有些字节码本身不存在操作数，第二个原因是有些字节码的操作数对后面的代码而言不重要。
-            ret = vm.step()
+            ret = None
+            pc = vm.pc
+            if summaries is not None and inside_function:
+                ret = summaries.before_step(vm, gas_used, gas_limit, args)
+            if ret is None:
+                ret = vm.step()
             gas_used += ret[1]
             # 当前操作消耗的gas大于gaslimit
             if gas_used > gas_limit:
-                # raise Exception(f'gas overflow: {gas_used} > {gas_limit}')
-                print("gas overflow!")
+                reason = Termination.GAS_OVERFLOW
+                error = f'gas overflow: {gas_used} > {gas_limit}'
                 break
-            if inside_function:
-                # print(vm, '\n')
-                # print(ret)
-                pass
         # 抛出异常
-        except (StackIndexError, UnsupportedOpError) as ex:
-            _ = ex
-            print(ex)
+        except StackIndexError:
+            reason = Termination.STACK_ERROR
+            error = 'stack underflow'
+            break
+        except UnsupportedOpError as ex:
+            reason = Termination.UNSUPPORTED_OP
+            error = str(ex)
+            break
+        # 超出了governor的上限，已经推断出的参数类型仍然返回
+        except ResourceLimitError as ex:
+            reason = ex.reason
+            error = str(ex)
+            break
+        # LockstepVm的lane在这一步分开了，每一组lane从当前状态继续执行，结果合并到args中
+        except LaneDivergence as ex:
+            reason, error = _run_lane_groups(vm, ex.groups, bytes_selector, gas_limit, gas_used, inside_function, args)
             break
 
         '''这段操作用来判断当前字节码是在函数中还是在函数外'''
         if inside_function is False:
             # EQ判断是否相等，XOR异或操作，SUB减操作都能被用来作为判断条件
             if ret[0] in {Op.EQ, Op.XOR, Op.SUB}:
-                p = int.from_bytes(vm.stack.peek(), 'big')
+                p = int(vm.stack.peek())
                 # 这个地方是要比较是否选择当前函数，要选择当前函数执行，必然会使用判断条件判断是否要执行当前函数
                 # 要求判断操作的第一个操作数operand1是以输入的函数选择器为结尾，如果条件满足 inside_function会被置为true，说明后续的字节码都是在函数中的操作
                 if p == (1 if ret[0] == Op.EQ else 0):
-                    inside_function = bytes(ret[2]).endswith(bytes_selector)
+                    inside_function = int(ret[2]).to_bytes(32, 'big').endswith(bytes_selector)
+                    if inside_function and explore is not None:
+                        explore.attach(vm, gas_used, args, forked=False)
             continue
 
 
-        #只有函数中的操作才会执行下面的匹配操作
-        # ret：[第一个元素是当前执行的字节码currentOp,第二个元素是当前操作消耗的gas gas_used,第三个元素是从栈顶弹出的当前字节码的操作数operand1,第四个元素是从栈顶弹出的当前字节码的操作数operand2]
-        match ret:
-            # case (Op.CALLDATALOAD,_,_,_):
-            #     print("1")
-
-            # CALLDATASIZE没有操作数，返回calldata中数据的长度到栈中，然后这个地方的意思就是只要遇到CALLDATASIZE操作，就返回8192的长度到栈中
-            case (Op.CALLDATASIZE, _):
-                vm.stack.pop()
-                vm.stack.push_uint(8192)
-
-            # 第一个CALLDATALOAD的结果是Arg，如果有第二个CALLDATALOAD将第一个CALLDATALOAD的结果作为了操作数，则说明该参数类型为bytes，且第二个CALLDATALOAD取出的应该是动态数据的长度num
-            # 并且将Arg()类型数据从栈中弹出,且推入ArgDynamicLength类型的数据
-            case (Op.CALLDATALOAD, _, Arg() as arg):
-                args[arg.offset] = 'bytes'
-                vm.stack.pop()
-                v = ArgDynamicLength(offset=arg.offset)
-                vm.stack.push(v)
-                
-            # ArgDynamic数据作为CALLDATALOAD操作码的操作数，则将当前栈顶元素置为动态数据
-            # 也就是说ArgDynamic本身也描述的是calldata中的一个位置空间
-            case (Op.CALLDATALOAD, _, ArgDynamic() as arg):
-                vm.stack.pop()
-                v = Arg(offset=arg.offset, dynamic=True)
-                vm.stack.push(v)
-
-            # 在这个地方生成CALLDATALOAD的操作数Arg,这个地方创建Arg类型的数据时,只会以val = 0x0000..的方式创建
-            # 所以Arg类型的变量都是CALLDATALOAD操作创建,但是是有可能由别的操作升级
-            # 所以这个函数会将整个CALLDATA中所有的数据全都标为Arg()类数据
-            case (Op.CALLDATALOAD, _, bytes() as offset):
-                # offset作为CALLDATALOAD操作的操作数，表示当前CALLDATALOAD是从calldata中哪个位置取出数据
-                off = int.from_bytes(offset, 'big')
-                # calldata中前四个字节为函数选择器，我们所维护的calldata上限大小为2**32，所以参数数据应该是存储在calldata的4-2**32字节之间
-                if off >= 4 and off < 2**32:
-                    # CALLDATALOAD的执行逻辑在vm.py中执行，执行完之后 栈顶是CALLDATALOAD从calldata中加载的数据，此时将该数据弹出，升级为Arg类型的数据后重新推入栈顶，即只要是通过CALLDATALOAD从栈中加载出来的数据都是Arg类型
-                    vm.stack.pop()
-                    vm.stack.push(Arg(offset=off))
-                    # 单凭CALLDATALOAD对一个bytes类型的数据进行输出，不能知道参数类型，因此该偏移量off对应的参数类型为空
-                    args[off] = ''
-                
-            # 对于ADD操作是可以创造ArgDynamic类型的数据的
-            # ADD(operand1,operand2)将操作数1、2相加之后返回结果到栈中，如果一个Arg类数据+4之后应该仍然是一个普通的Arg类型的数据，如果Arg类型的数据+的不是4，那Arg本身可能就是动态数据，则将栈顶元素置为ArgDynamic类型
-            case (Op.ADD, _, Arg() as cd, bytes() as ot) | (Op.ADD, _, bytes() as ot, Arg() as cd):
-                # v是ADD操作的结果
-                v = vm.stack.pop()
-                # 如果是和一个calldata中的数据相加，那么这个Arg类型的数据只可能是动态数据的offset，所以此时被calldataload推入栈顶的元素应该是num字段的值
-                # 所以也就是说只有动态类型数据的offset的值才有+4这个操作，静态数据无论无何都不会出现calldata中的数据+4bytes的操作
-                if int.from_bytes(ot, 'big') == 4:
-                    # 此时知道Arg的具体值,将该信息传入到栈中
-                    vm.stack.push(Arg(offset=cd.offset, val=v))
-                else:
-                    # 如果该数据+的不是4，但是这里被calldataload推入的数据静态数据就不能+4？是的，因为静态数据如果实在程序中+4的话，其操作是会出现在参数信息处理代码段之外
-                    # 动态数据除了第一次是将offset+4 = num来获取num字段的地址之外，因为动态数据一定是在他的num字段之后，所以其余的都num+20，num+20+20 。。。不会再有+4的情况出现，对应动态数据
-                    vm.stack.push(ArgDynamic(offset=cd.offset, val=v))
-
-            # 如果ADD操作处理了ArgDynamic类型的数据，则返回的结果仍是ArgDynamic类型，且具体的值更新为v
-            # 获取下一个动态数据的位置，在处理完一次动态数据之后，EVM需要在上一次动态数据的位置ArgDynamic基础上再＋一个值
-            case (Op.ADD, _, ArgDynamic() as cd, _) | (Op.ADD, _, _, ArgDynamic() as cd):
-                v = vm.stack.pop()
-                v = ArgDynamic(offset=cd.offset, val=v)
-                vm.stack.push(v)
-
-            # SHL(shift,value):将value(32字节的数据)向右移动shift位bit
-            # 如果当前操作SHL使用了bytes类型和ArgDynamicLength的操作数，则说明ArgDynamicLength数据的类型为uint256[]
-            case (Op.SHL, _, bytes() as ot, ArgDynamicLength() as arg):
-                # int.from_bytes(ot, 'big')将bytes类型的数据转化为大端存储的int类型数据
-                if int.from_bytes(ot, 'big') == 5:
-                    args[arg.offset] = 'uint256[]'
-
-            # MUL(a,b):将a，b相乘
-            # 如果当前操作MUL使用了bytes类型和ArgDynamicLength类型的操作数，则说明ArgDynamicLength数据的类型为uint256[]
-            # ArgDynamicLength代表动态数据的长度，EVM在对一个参数处理过程中如果出现了使用MUL操作将动态数据的长度和int类型的32值相乘，则说明该函数类型为uint256[]
-            case (Op.MUL, _, ArgDynamicLength() as arg, bytes() as ot) | (Op.MUL, _, bytes() as ot, ArgDynamicLength() as arg):
-                if int.from_bytes(ot, 'big') == 32:
-                    args[arg.offset] = 'uint256[]'
-                    
-========================================================================================================================================================================================
-#下面的代码虽然和上面的代码在同一个函数，但是画横线是用来区分，从下面的代码开始就进入了calldata中的数据的屏蔽扩展，(因为无论长度为多少的数据在calldata中都会被扩展到32字节)，所以该值在被使用之前，需要从32字节恢复到原来的长度
-
-            # AND(a,b),计算a+b的结果并返回到栈顶。如果是对calldata中的数据进行处理的话，对于下面几种类型的参数屏蔽扩展使用的都是AND操作
-            # address、uint<M>、bytes<M>、address[]、uint<M>[]、bytes<M>[]这些类型的参数，在被calldata中扩展之后都是使用AND操作屏蔽扩展
-            # AND操作屏蔽的原理是如果参数是八字节例如uint64，根据该数据在calldata中的填充方式，uint64为左填充（calldata扩展的时候在数据左侧添0到32字节），EVM会使用一个0x000000000000000000000000000000000000000000000000ffffffffffffffff来获取最后八字节的数据
-            # 如果是对于连续的同样值的数据,例如2222,大小端存储的差别只有在左右两端补0的位置
-            case (Op.AND, _, Arg() as arg, bytes() as ot) | (Op.AND, _, bytes() as ot, Arg() as arg):
-                v = int.from_bytes(ot, 'big')
-                if v == 0:
-                    pass
-                # 下面这条判断语句用于检测0x0000ffff的情况，即Arg参数在calldata中被左填充
-                # 如果是0x0000ffff的情况，v+1会将连续的f全部变成0，而将原本的0(最高位的)变成1，这样一来相与的结果就是0
-                elif (v & (v + 1)) == 0:
-                    # 0x0000ffff，处理左填充类型的数据
-                    # bit_length()方法用来获取一个int类型数据的有效位(不包括前导0和符号位)，从右侧最低为向最高有效位计算。所以才能用这个方法来获取具体数据的长度
-                    bl = v.bit_length()
-                    if bl % 8 == 0:
-                        # address、uint类型数据在calldata中都是被左填充
-                        t = 'address' if bl == 160 else f'uint{bl}'
-                        args[arg.offset] = f'{t}[]' if arg.dynamic else t
-                else:
-                    # 0xffff0000，处理右填充类型的数据
-                    # 因为要计算v的长度，所以先要将v从0xffff0000的样式转换为0x0000ffff的样式
-                    v = int.from_bytes(ot, 'little')
-                    if (v & (v + 1)) == 0:
-                        bl = v.bit_length()
-                        if bl % 8 == 0:
-                            t = f'bytes{bl // 8}'
-                            # 这里直接根据规则推出bytes<M>[]或bytes<M>
-                            args[arg.offset] = f'{t}[]' if arg.dynamic else t
-
-            # ISZERO(operand)，判断当前栈顶的元素是否是0，如果是返回1到栈顶，否则返回0到栈顶
-            # 如果ISZERO操作码的操作对象是CALLDATA中的数据(即Arg类型的参数)，则将栈顶元素置换为IsZeroResult类型的数据
-            case (Op.ISZERO, _, Arg() as arg):
-                v = vm.stack.pop()
-                vm.stack.push(IsZeroResult(offset=arg.offset, dynamic=arg.dynamic, val=v))
-        
-            # 如果ISZERO操作处理了IsZeroResult类型的数据，也就是说执行了两个连续的ISZERO操作，则可以认定该参数对应的类型为bool类型
-            # bool类型的参数使用两个连续的ISZERO来屏蔽扩展，第一个ISZERO用来消除扩展变为bool值，但是0x000000变成1，0x000001变成0，需要第二个ISZERO用来将bool值还原
-            case (Op.ISZERO, _, IsZeroResult() as arg):
-                args[arg.offset] = 'bool[]' if arg.dynamic else 'bool'
-
-            # 对于八位机而言，只有1~127和 -1 ~ -127以及-128   0xff -1，0xfe -2
-            # SIGNEXTEND操作码，用于int类型的扩展，且只会对int类型的数据使用
-            # 如果SIGNEXTEND操作处理了CALLDATA中的数据，则只能是int<M>或int<M>[]，如果arg是动态类型数据则
-            case (Op.SIGNEXTEND, _, s0, Arg() as arg):
-                if s0 < 32:
-                    t = f'int{(s0+1)*8}'
-                    args[arg.offset] = f'{t}[]' if arg.dynamic else t
-
-            # BYTE(i,value):从bytes32类型的value处取出位置为i的单个字节
-            # 只有bytes32类型数据会用到BYTE字节码，所以如果Arg()数据被BYTE处理了，说明Arg一定是bytes32类型数据
-            case (Op.BYTE, _, _, Arg() as arg):
-                if args[arg.offset] == '':
-                    args[arg.offset] = 'bytes32'
-
-            # case (Op.LT, _, CallDataArgument() as arg, _):
-            #     args[arg.offset] = 'uint8' # enum
+        #只有函数中的操作才会执行下面的推断规则，没有注册规则的操作码(PUSH/DUP/SWAP/JUMPDEST等)直接跳过
+        # ret[0]为None是_Summaries复用摘要的一步(before_step的返回值)，它也会执行到这里，摘要中的参数类型已经写入args，没有规则要执行
+        if vm.lane_rets is not None:
+            _apply_lane_rules(vm, args)
+        elif ret[0] is not None:
+            for rule in RULES[ret[0]]:
+                if rule(vm, ret, args):
+                    break
+        if summaries is not None:
+            summaries.after_step(vm, ret)
+
+        # JUMPI留在了循环体中，而另一边离开循环体：改为走离开的一边，不再迭代这个循环
+        if exiting and ret[0] == Op.JUMPI and pc in cfg.branches:
+            dest, fallthrough = cfg.branches[pc]
+            for head, body in exiting.items():
+                if vm.pc in body and (fallthrough if vm.pc == dest else dest) not in body:
+                    vm.pc = fallthrough if vm.pc == dest else dest
+                    del exiting[head]
+                    break
+
+        # 规则执行完之后再比较，这样这一步升级出来的Tag也算在这一轮循环中
+        if loop_heads[vm.pc]:
+            if summaries is not None:
+                summaries.frames.clear()
+            key = (_provenance(vm.stack), tuple(args.items()))
+            if loop_seen.get(vm.pc) == key:
+                # 不在探索模式中，或者已经在强制离开这个循环，但是又回到了入口(循环体中没有可以离开的JUMPI)
+                if explore is None or vm.pc in exiting:
+                    reason = Termination.LOOP
+                    error = f'loop at {hex(vm.pc)} revisited without new provenance'
+                    break
+                exiting[vm.pc] = cfg.loop_body(vm.pc)
+            else:
+                exiting.pop(vm.pc, None)
+            loop_seen[vm.pc] = key
+
+        # 每次跳转到新的基本块时检查，解码结束之后的业务逻辑不会再改变参数类型
+        if ret[0] in _DECODE_CHECK_OPS and _decoding_done(vm):
+            reason = Termination.DECODED
+            break
+
+    if inside_function is False and reason not in _RESOURCE_REASONS:
+        reason = Termination.NOT_FOUND
+    result = ArgumentsResult(_format_args(args), reason, error)
+    # 探索模式和lane分开之后的每一组都会调用_process_function，由function_arguments_explore汇总之后再通知tracer
+    if tracer is not None and explore is None and report:
+        tracer.on_termination(bytes_selector, result, vm.steps)
+    return result
+
+
+# 描述：函数体中的推断规则，按照操作码索引的注册表
+'''原来每一步的返回值ret都要经过整个match ret，PUSH/DUP/SWAP/JUMPDEST这些不可能匹配任何规则的步骤也要逐个比较元组模式和Arg/ArgDynamic等类型
+   RULES[op]是op这一步执行完之后依次尝试的规则，没有规则的操作码(绝大部分步骤)在_process_function中直接跳过推断
+   规则是一个函数rule(vm, ret, args) -> bool：
+     ret：[第一个元素是当前执行的字节码currentOp,第二个元素是当前操作消耗的gas gas_used,第三个元素是从栈顶弹出的当前字节码的操作数operand1,第四个元素是从栈顶弹出的当前字节码的操作数operand2]
+     返回True表示这条规则匹配了(相当于原来match中的一个case)，同一个操作码后面的规则不再尝试；返回False时继续尝试下一条规则
+     规则只应该在操作数带有_ARG_TAGS中的来源标记时写入args，否则解码结束之后的提前停止(Termination.DECODED)可能会跳过它
+   register_rule(*ops, first=False)：把规则加到这些操作码的规则列表的末尾(first=True时加到开头)，可以作为装饰器使用
+   unregister_rule(rule, *ops)：从这些操作码(没有给出时是所有操作码)的规则列表中删除规则
+   两者都会增加_rules_version，子程序的摘要中记录了规则写入的参数类型，用旧的规则记录的摘要不会再被复用
+   两者还会通过VM.set_unfused_ops()让注册了规则的PUSH/DUP/SWAP/POP/JUMP等操作码不再被fuse=True的vm融合，每一步都经过规则
+   例如把LT用作enum的检查(原来被注释掉的规则)作为扩展注册，不需要修改本文件：
+     @register_rule(Op.LT)
+     def enum_rule(vm, ret, args):
+         if isinstance(ret[2], Arg):
+             args[ret[2].offset] = 'uint8'
+             return True
+         return False
+'''
+RULES: list[list] = [[] for _ in range(256)]
+# 规则每次变化时加一，作为_Summaries的键的一部分
+_rules_version = 0
+
+
+def register_rule(*ops: int, first: bool = False):
+    def decorator(rule):
+        global _rules_version
+        _rules_version += 1
+        for op in ops:
+            if first:
+                RULES[op].insert(0, rule)
+            else:
+                RULES[op].append(rule)
+        set_unfused_ops(op for op in range(256) if RULES[op])
+        return rule
+    return decorator
+
+
+def unregister_rule(rule, *ops: int):
+    global _rules_version
+    _rules_version += 1
+    for op in ops or range(256):
+        if rule in RULES[op]:
+            RULES[op].remove(rule)
+    set_unfused_ops(op for op in range(256) if RULES[op])
+
+
+# 对ret依次执行RULES[ret[0]]中的规则，直到有一条规则匹配
+def _apply_rules(vm: Vm, ret: tuple, args: dict[int, str]):
+    for rule in RULES[ret[0]]:
+        if rule(vm, ret, args):
+            return
+
+
+# CALLDATASIZE没有操作数，返回calldata中数据的长度到栈中，然后这个地方的意思就是只要遇到CALLDATASIZE操作，就返回8192的长度到栈中
+@register_rule(Op.CALLDATASIZE)
+def _rule_calldatasize(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    vm.stack.pop()
+    vm.stack.push_uint(8192)
+    return True
+
+
+# 第一个CALLDATALOAD的结果是Arg，如果有第二个CALLDATALOAD将第一个CALLDATALOAD的结果作为了操作数，则说明该参数类型为bytes，且第二个CALLDATALOAD取出的应该是动态数据的长度num
+# 并且将Arg()类型数据从栈中弹出,且推入ArgDynamicLength类型的数据
+@register_rule(Op.CALLDATALOAD)
+def _rule_calldataload_length(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    arg = ret[2]
+    if not isinstance(arg, Arg):
+        return False
+    args[arg.offset] = 'bytes'
+    v = ArgDynamicLength(offset=arg.offset, val=max(1, _pop_loaded(vm, arg)))
+    _push_tag(vm, arg, v)
+    return True
+
+
+# ArgDynamic数据作为CALLDATALOAD操作码的操作数，则将当前栈顶元素置为动态数据
+# 也就是说ArgDynamic本身也描述的是calldata中的一个位置空间
+@register_rule(Op.CALLDATALOAD)
+def _rule_calldataload_dynamic(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    arg = ret[2]
+    if not isinstance(arg, ArgDynamic):
+        return False
+    v = Arg(offset=arg.offset, dynamic=True, val=_pop_loaded(vm, arg))
+    _push_tag(vm, arg, v)
+    return True
+
+
+# 在这个地方生成CALLDATALOAD的操作数Arg,这个地方创建Arg类型的数据时,只会以val = 0x0000..的方式创建
+# 所以Arg类型的变量都是CALLDATALOAD操作创建,但是是有可能由别的操作升级
+# 所以这个函数会将整个CALLDATA中所有的数据全都标为Arg()类数据
+@register_rule(Op.CALLDATALOAD)
+def _rule_calldataload(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    # offset作为CALLDATALOAD操作的操作数，表示当前CALLDATALOAD是从calldata中哪个位置取出数据
+    offset = ret[2]
+    off = int(offset)
+    # calldata中前四个字节为函数选择器，我们所维护的calldata上限大小为2**32，所以参数数据应该是存储在calldata的4-2**32字节之间
+    if off >= 4 and off < 2**32:
+        # CALLDATALOAD的执行逻辑在vm.py中执行，执行完之后 栈顶是CALLDATALOAD从calldata中加载的数据，此时将该数据弹出，升级为Arg类型的数据后重新推入栈顶，即只要是通过CALLDATALOAD从栈中加载出来的数据都是Arg类型
+        # 保留加载出来的值，全0的calldata中就是0，探测calldata中是探测的值
+        _push_tag(vm, offset, Arg(offset=off, val=_pop_loaded(vm, offset)))
+        # 单凭CALLDATALOAD对一个bytes类型的数据进行输出，不能知道参数类型，因此该偏移量off对应的参数类型为空
+        args[off] = ''
+    return True
+
+
+# CALLDATACOPY复制到内存中的数据，MLOAD出来之后和CALLDATALOAD一样升级为Arg
+# 源地址是ArgDynamic时复制的是动态数据的内容，源地址是常量时offset就是参数在calldata中的位置
+@register_rule(Op.MLOAD)
+def _rule_mload(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    used = ret[2]
+    if not (isinstance(used, set) and len(used) == 1):
+        return False
+    u = next(iter(used))
+    if isinstance(u, CallDataCopy):
+        if isinstance(u.src, ArgDynamic):
+            _push_tag(vm, vm.stack.pop(), Arg(offset=u.src.offset, dynamic=True))
+        elif type(u.src) is int and u.offset >= 4 and u.offset < 2**32:
+            _push_tag(vm, vm.stack.pop(), Arg(offset=u.offset))
+            args[u.offset] = ''
+    return True
+
+
+# 对于ADD操作是可以创造ArgDynamic类型的数据的
+# ADD(operand1,operand2)将操作数1、2相加之后返回结果到栈中，如果一个Arg类数据+4之后应该仍然是一个普通的Arg类型的数据，如果Arg类型的数据+的不是4，那Arg本身可能就是动态数据，则将栈顶元素置为ArgDynamic类型
+@register_rule(Op.ADD)
+def _rule_add_arg(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    if isinstance(ret[2], Arg):
+        cd, ot = ret[2], ret[3]
+    elif isinstance(ret[3], Arg):
+        ot, cd = ret[2], ret[3]
+    else:
+        return False
+    # v是ADD操作的结果
+    v = vm.stack.pop_uint()
+    # 如果是和一个calldata中的数据相加，那么这个Arg类型的数据只可能是动态数据的offset，所以此时被calldataload推入栈顶的元素应该是num字段的值
+    # 所以也就是说只有动态类型数据的offset的值才有+4这个操作，静态数据无论无何都不会出现calldata中的数据+4bytes的操作
+    if int(ot) == 4:
+        # 此时知道Arg的具体值,将该信息传入到栈中
+        _push_tag(vm, cd, Arg(offset=cd.offset, val=v))
+    else:
+        # 如果该数据+的不是4，但是这里被calldataload推入的数据静态数据就不能+4？是的，因为静态数据如果实在程序中+4的话，其操作是会出现在参数信息处理代码段之外
+        # 动态数据除了第一次是将offset+4 = num来获取num字段的地址之外，因为动态数据一定是在他的num字段之后，所以其余的都num+20，num+20+20 。。。不会再有+4的情况出现，对应动态数据
+        _push_tag(vm, cd, ArgDynamic(offset=cd.offset, val=v))
+    return True
+
+
+# 如果ADD操作处理了ArgDynamic类型的数据，则返回的结果仍是ArgDynamic类型，且具体的值更新为v
+# 获取下一个动态数据的位置，在处理完一次动态数据之后，EVM需要在上一次动态数据的位置ArgDynamic基础上再＋一个值
+@register_rule(Op.ADD)
+def _rule_add_dynamic(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    if isinstance(ret[2], ArgDynamic):
+        cd = ret[2]
+    elif isinstance(ret[3], ArgDynamic):
+        cd = ret[3]
+    else:
+        return False
+    v = vm.stack.pop_uint()
+    v = ArgDynamic(offset=cd.offset, val=v)
+    _push_tag(vm, cd, v)
+    return True
+
+
+# SHL(shift,value):将value(32字节的数据)向右移动shift位bit
+# 如果当前操作SHL使用了bytes类型和ArgDynamicLength的操作数，则说明ArgDynamicLength数据的类型为uint256[]
+@register_rule(Op.SHL)
+def _rule_shl(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    ot, arg = ret[2], ret[3]
+    if not isinstance(arg, ArgDynamicLength):
+        return False
+    # int(ot)取出栈中元素的值，ot可能是int，也可能是被标记过的Tag
+    if int(ot) == 5:
+        args[arg.offset] = 'uint256[]'
+    return True
+
+
+# MUL(a,b):将a，b相乘
+# 如果当前操作MUL使用了bytes类型和ArgDynamicLength类型的操作数，则说明ArgDynamicLength数据的类型为uint256[]
+# ArgDynamicLength代表动态数据的长度，EVM在对一个参数处理过程中如果出现了使用MUL操作将动态数据的长度和int类型的32值相乘，则说明该函数类型为uint256[]
+@register_rule(Op.MUL)
+def _rule_mul(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    if isinstance(ret[2], ArgDynamicLength):
+        arg, ot = ret[2], ret[3]
+    elif isinstance(ret[3], ArgDynamicLength):
+        ot, arg = ret[2], ret[3]
+    else:
+        return False
+    if int(ot) == 32:
+        args[arg.offset] = 'uint256[]'
+    return True
+
+
+#下面的规则进入了calldata中的数据的屏蔽扩展，(因为无论长度为多少的数据在calldata中都会被扩展到32字节)，所以该值在被使用之前，需要从32字节恢复到原来的长度
+
+# AND(a,b),计算a+b的结果并返回到栈顶。如果是对calldata中的数据进行处理的话，对于下面几种类型的参数屏蔽扩展使用的都是AND操作
+# address、uint<M>、bytes<M>、address[]、uint<M>[]、bytes<M>[]这些类型的参数，在被calldata中扩展之后都是使用AND操作屏蔽扩展
+# AND操作屏蔽的原理是如果参数是八字节例如uint64，根据该数据在calldata中的填充方式，uint64为左填充（calldata扩展的时候在数据左侧添0到32字节），EVM会使用一个0x000000000000000000000000000000000000000000000000ffffffffffffffff来获取最后八字节的数据
+# 如果是对于连续的同样值的数据,例如2222,大小端存储的差别只有在左右两端补0的位置
+@register_rule(Op.AND)
+def _rule_and(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    if isinstance(ret[2], Arg):
+        arg, ot = ret[2], ret[3]
+    elif isinstance(ret[3], Arg):
+        ot, arg = ret[2], ret[3]
+    else:
+        return False
+    v = int(ot)
+    if v == 0:
+        pass
+    # 下面这条判断语句用于检测0x0000ffff的情况，即Arg参数在calldata中被左填充
+    # 如果是0x0000ffff的情况，v+1会将连续的f全部变成0，而将原本的0(最高位的)变成1，这样一来相与的结果就是0
+    elif (v & (v + 1)) == 0:
+        # 0x0000ffff，处理左填充类型的数据
+        # bit_length()方法用来获取一个int类型数据的有效位(不包括前导0和符号位)，从右侧最低为向最高有效位计算。所以才能用这个方法来获取具体数据的长度
+        bl = v.bit_length()
+        if bl % 8 == 0:
+            # address、uint类型数据在calldata中都是被左填充
+            t = 'address' if bl == 160 else f'uint{bl}'
+            args[arg.offset] = f'{t}[]' if arg.dynamic else t
+    else:
+        # 0xffff0000，处理右填充类型的数据
+        # 因为要计算v的长度，所以先要将v从0xffff0000的样式转换为0x0000ffff的样式
+        v = int.from_bytes(int(ot).to_bytes(32, 'big'), 'little')
+        if (v & (v + 1)) == 0:
+            bl = v.bit_length()
+            if bl % 8 == 0:
+                t = f'bytes{bl // 8}'
+                # 这里直接根据规则推出bytes<M>[]或bytes<M>
+                args[arg.offset] = f'{t}[]' if arg.dynamic else t
+    return True
+
+
+# ISZERO(operand)，判断当前栈顶的元素是否是0，如果是返回1到栈顶，否则返回0到栈顶
+# 如果ISZERO操作码的操作对象是CALLDATA中的数据(即Arg类型的参数)，则将栈顶元素置换为IsZeroResult类型的数据
+@register_rule(Op.ISZERO)
+def _rule_iszero_arg(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    arg = ret[2]
+    if not isinstance(arg, Arg):
+        return False
+    v = vm.stack.pop_uint()
+    _push_tag(vm, arg, IsZeroResult(offset=arg.offset, dynamic=arg.dynamic, val=v))
+    return True
+
+
+# 如果ISZERO操作处理了IsZeroResult类型的数据，也就是说执行了两个连续的ISZERO操作，则可以认定该参数对应的类型为bool类型
+# bool类型的参数使用两个连续的ISZERO来屏蔽扩展，第一个ISZERO用来消除扩展变为bool值，但是0x000000变成1，0x000001变成0，需要第二个ISZERO用来将bool值还原
+@register_rule(Op.ISZERO)
+def _rule_iszero_bool(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    arg = ret[2]
+    if not isinstance(arg, IsZeroResult):
+        return False
+    args[arg.offset] = 'bool[]' if arg.dynamic else 'bool'
+    return True
+
+
+# 对于八位机而言，只有1~127和 -1 ~ -127以及-128   0xff -1，0xfe -2
+# SIGNEXTEND操作码，用于int类型的扩展，且只会对int类型的数据使用
+# 如果SIGNEXTEND操作处理了CALLDATA中的数据，则只能是int<M>或int<M>[]，如果arg是动态类型数据则
+@register_rule(Op.SIGNEXTEND)
+def _rule_signextend(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    s0, arg = ret[2], ret[3]
+    if not isinstance(arg, Arg):
+        return False
+    if s0 < 32:
+        t = f'int{(s0+1)*8}'
+        args[arg.offset] = f'{t}[]' if arg.dynamic else t
+    return True
+
+
+# BYTE(i,value):从bytes32类型的value处取出位置为i的单个字节
+# 只有bytes32类型数据会用到BYTE字节码，所以如果Arg()数据被BYTE处理了，说明Arg一定是bytes32类型数据
+@register_rule(Op.BYTE)
+def _rule_byte(vm: Vm, ret: tuple, args: dict[int, str]) -> bool:
+    arg = ret[3]
+    if not isinstance(arg, Arg):
+        return False
+    if args[arg.offset] == '':
+        args[arg.offset] = 'bytes32'
+    return True
+
+
+# 弹出CALLDATALOAD的结果，只保留从选择器之后加载出来的值，所以全0的calldata中总是0，和原来固定使用0(长度固定使用1)的结果一致
+def _pop_loaded(vm: Vm, offset: int | Tag) -> int:
+    v = vm.stack.pop_uint()
+    return v if int(offset) >= 4 else 0
+
+
+# LockstepVm按lane执行的一步：对每个lane分别执行推断规则，栈顶换成这个lane自己的值，规则执行完之后再合并
+def _apply_lane_rules(vm: 'LockstepVm', args: dict[int, str]):
+    n_out = vm.lane_outputs
+    top = vm.stack.pop() if n_out > 0 else None
+    tops = []
+    for i, ret in enumerate(vm.lane_rets):
+        if n_out > 0:
+            vm.stack.push(top[i] if type(top) is Lanes else top)
+        _apply_rules(vm, ret, args)
+        if n_out > 0:
+            tops.append(vm.stack.pop())
+    if n_out > 0:
+        vm.stack.push(merge_lanes(tops))
+
+
+_RESOURCE_REASONS = frozenset((Termination.STEP_LIMIT, Termination.DEADLINE, Termination.MEMORY_LIMIT))
+
+# 这些步骤之后vm.pc是一个基本块的起始位置，None是_Summaries复用摘要的一步(返回到ret)
+_DECODE_CHECK_OPS = frozenset((Op.JUMP, Op.JUMPI, None))
+
+
+# 推断规则匹配的参数来源标记，dispatcher留在栈底的CallDataSignature以及从选择器中加载出来的CallDataValue不算
+_ARG_TAGS = (Arg, ArgDynamic, ArgDynamicLength, IsZeroResult)
+
+
+# 参数类型只会由作用在参数来源标记上的规则写入，所以满足以下条件时之后的执行不会再改变结果：
+# 1.栈中没有_ARG_TAGS 2.内存中没有CALLDATACOPY复制进来的数据(MLOAD的规则只看CallDataCopy) 3.从当前的基本块出发不会再执行到CALLDATALOAD/CALLDATACOPY
+# 栈中合法的JUMPDEST都当作可能的返回地址，交给ControlFlowGraph.reaches_calldata解析动态跳转
+def _decoding_done(vm: Vm) -> bool:
+    decoded = vm.decoded
+    targets = []
+    for v in vm.stack._data:
+        # LockstepVm中每个lane的值不同的元素是Lanes，逐个检查其中的值
+        for x in (v if type(v) is Lanes else (v,)):
+            if type(x) is not int:
+                if isinstance(x, _ARG_TAGS):
+                    return False
+            elif decoded.is_jumpdest(x):
+                targets.append(x)
+    memory = vm.memory
+    if len(memory._ranges) > 0 or any(isinstance(t, CallDataCopy) for t in memory._tags.values()):
+        return False
+    return not decoded.cfg.reaches_calldata(vm.pc, frozenset(targets))
+
+
+# 栈中所有来源标记的集合，int不算在内，所以循环变量的变化不会被当作新的信息
+def _provenance(stack: Stack) -> frozenset:
+    return frozenset((type(v), getattr(v, 'offset', None), getattr(v, 'dynamic', None)) for v in stack._data if type(v) is not int)
+
+
+# 描述：共享子程序(例如solc的abi_decode_*)的摘要，同一个合约中的不同选择器用相同的输入调用同一个子程序时，只执行一次
+'''_process_function在函数体中每一步之前调用before_step，执行完这一步并且执行完推断规则之后调用after_step：
+   step1：到达ControlFlowGraph.subroutines中的入口时，在栈顶的16个元素中找到最靠近栈顶的、是合法JUMPDEST的int作为返回地址ret
+   step2：摘要的键是(规则的版本, 入口pc, ret之上每个元素的值和Tag的类型/offset/dynamic, 参数字典)，所以只有输入完全相同时才会复用，例如headStart相同的abi_decode
+   step3：已经有摘要时直接把ret以及它之上的元素换成摘要中的输出，写入摘要中的参数类型，pc设置为ret，gas和governor的步数加上摘要中的值，相当于执行了一步
+   step4：没有摘要时开始记录，after_step跟踪ret所在的栈位置(SWAP会移动它)：执行到JUMP并且栈顶就是这个位置时，子程序返回，把输出、参数类型的变化、gas和步数记录为摘要
+   以下情况不会记录摘要，正在记录的所有子程序都会被放弃：
+     MLOAD/MSTORE/CALLDATACOPY(内存不在键中)，从选择器中CALLDATALOAD，到达循环的入口(循环检测依赖整个栈)，访问了ret之下的元素
+   以下情况只放弃这个子程序：ret被DUP复制或者被其他操作消耗(不再能确定哪一次JUMP是返回)
+   只在calldata只有选择器、没有tracer/fuse/探索模式的普通vm中使用
+'''
+class _Summaries:
+    MAX_FRAMES = 16 # 同时记录的子程序的最大嵌套层数
+    MAX_SUMMARIES = 4096 # 每个合约最多保存的摘要数量
+    # 访问内存的操作码，内存不在摘要的键中
+    IMPURE_OPS = frozenset((Op.MLOAD, Op.MSTORE, Op.CALLDATACOPY))
+    # 不向栈中写入结果的操作码，其他操作码都按照写入一个结果计算(多算只会多放弃子程序)
+    NO_OUTPUT_OPS = frozenset((Op.POP, Op.JUMP, Op.JUMPI, Op.JUMPDEST))
+
+    def __init__(self, decoded: 'DecodedCode'):
+        self.decoded = decoded
+        self.subroutines = decoded.cfg.subroutines
+        self.store = decoded.summaries
+        self.version = _rules_version
+        # 正在记录的子程序，每一项是[键, ret在栈中的位置, ret现在在栈中的位置, 开始时的gas, 开始时的步数, 访问过的最低的栈位置, 开始时的参数字典]
+        self.frames: list[list] = []
+        self.clock = 0 # 开始记录之后执行的步数
+
+    # 返回None时由调用者执行vm.step()，否则返回复用了摘要的这一步(None, gas, ret在栈中的位置, 步数)
+    def before_step(self, vm: Vm, gas_used: int, gas_limit: int, args: dict[int, str]) -> tuple | None:
+        data = vm.stack._data
+        if len(self.frames) > 0 and len(data) > 0 and vm.decoded.ops[vm.pc] == Op.JUMP:
+            top = len(data) - 1
+            for i in range(len(self.frames) - 1, -1, -1):
+                if self.frames[i][2] == top:
+                    # 内层还没有返回的子程序(例如共享的revert分支)不会再返回了，直接放弃
+                    del self.frames[i + 1 :]
+                    self._finish(self.frames.pop(), data, gas_used, args)
+                    break
+        if not self.subroutines[vm.pc]:
+            return None
+        ret_idx = None
+        for i in range(len(data) - 1, max(-1, len(data) - 17), -1):
+            v = data[i]
+            if type(v) is int and vm.decoded.is_jumpdest(v):
+                ret_idx = i
+                break
+        if ret_idx is None:
+            return None
+        key = (self.version, vm.pc, tuple(v if type(v) is int else (type(v), v.val, getattr(v, 'offset', None), getattr(v, 'dynamic', None)) for v in data[ret_idx + 1 :]), tuple(args.items()))
+        summary = self.store.get(key)
+        if summary is None:
+            if len(self.frames) < self.MAX_FRAMES:
+                self.frames.append([key, ret_idx, ret_idx, gas_used, self.clock, ret_idx, dict(args)])
+            return None
+        outputs, writes, gas, steps = summary
+        if gas_used + gas > gas_limit or (vm.governor is not None and not vm.governor.advance(steps)):
+            return None
+        ret_pc = data[ret_idx]
+        for _ in range(len(data) - ret_idx):
+            vm.stack.pop()
+        for v in outputs:
+            vm.stack.push(v)
+        for offset, type_ in writes:
+            args[offset] = type_
+        vm.pc = ret_pc
+        return (None, gas, ret_idx, steps)
+
+    def _finish(self, frame: list, data: list, gas_used: int, args: dict[int, str]):
+        key, ret_idx, _, gas_start, clock_start, low, before = frame
+        outputs = tuple(data[ret_idx:-1])
+        if low < ret_idx or len(self.store) >= self.MAX_SUMMARIES:
+            return
+        writes = tuple((k, v) for k, v in args.items() if before.get(k) != v)
+        # 加上这一步JUMP
+        self.store[key] = (outputs, writes, gas_used - gas_start + 8, self.clock - clock_start + 1)
+
+    def after_step(self, vm: Vm, ret: tuple):
+        if len(self.frames) == 0:
+            return
+        op = ret[0]
+        n = len(vm.stack._data)
+        # consumed：这一步消耗掉的最低的栈位置，ret在这个位置或者之上时已经不在栈中
+        consumed = n
+        copied = moved = None
+        if op is None:
+            self.clock += ret[3]
+            low = consumed = ret[2]
+        else:
+            self.clock += 1
+            if op in self.IMPURE_OPS or op == Op.CALLDATALOAD and int(ret[2]) < len(vm.calldata):
+                self.frames.clear()
+                return
+            if Op.DUP1 <= op <= Op.DUP16:
+                low = copied = n - 2 - (op - Op.DUP1)
+            elif Op.SWAP1 <= op <= Op.SWAP16:
+                low = n - 2 - (op - Op.SWAP1)
+                moved = (low, n - 1)
+            else:
+                low = n - 1
+                if op not in self.NO_OUTPUT_OPS:
+                    consumed = n - 1
+        for frame in self.frames:
+            if low < frame[5]:
+                frame[5] = low
+            if moved is not None and frame[2] in moved:
+                frame[2] = moved[0] + moved[1] - frame[2]
+        # ret被复制或者被消耗，无法再确定哪一次JUMP是返回
+        if any(frame[2] >= consumed or frame[2] == copied for frame in self.frames):
+            self.frames = [frame for frame in self.frames if frame[2] < consumed and frame[2] != copied]
+## _Summaries类：每次_process_function创建一个，摘要保存在DecodedCode.summaries中，同一个合约的所有选择器共享
 
+
+# 按照参数在calldata中的位置排序，还不知道类型的参数当作uint256
+def _format_args(args: dict[int, str]) -> str:
     return ','.join(v[1] if v[1] != '' else 'uint256' for v in sorted(args.items()))
 
 
+def _new_args(tracer: Tracer | None, bytes_selector: bytes) -> dict[int, str]:
+    return {} if tracer is None else _TracedArgs(tracer, bytes_selector)
+
+
+# 规则把栈顶的元素升级为新的Tag时调用，old是产生这个Tag的操作数(例如Arg -> ArgDynamicLength中的Arg)
+def _push_tag(vm: Vm, old: int | Tag, tag: Tag):
+    vm.stack.push(tag)
+    if vm.tracer is not None:
+        vm.tracer.on_tag(vm, old, tag)
+
+
+# 挂载了tracer时代替_process_function中的args字典，写入参数类型时产生on_type事件
+class _TracedArgs(dict):
+    __slots__ = ('tracer', 'selector')
+
+    def __init__(self, tracer: Tracer, selector: bytes):
+        super().__init__()
+        self.tracer = tracer
+        self.selector = selector
+
+    def __setitem__(self, offset: int, type_: str):
+        super().__setitem__(offset, type_)
+        self.tracer.on_type(self.selector, offset, type_)
+
+
+# 描述：一次执行dispatcher，同时推断多个函数选择器的参数类型
+'''function_arguments对每一个选择器都会从pc = 0开始重新执行一遍dispatcher，对于有几十上百个函数的合约，大部分时间都花在重复执行相同的EQ/XOR/SUB比较链上
+   function_arguments_many的运行流程：
+   step1：以第一个选择器作为calldata创建vm，这个vm同时代表所有还没有被区分开的选择器(pending)
+   step2：在dispatcher中，将由calldata前4个字节计算得到的值升级为CallDataSignature
+   step3：当EQ/XOR/SUB/LT/GT/ISZERO使用CallDataSignature作为操作数时，对pending中每一个选择器计算比较结果，按照比较结果是否为0将pending分组
+   step4：当前vm保留和calldata中的选择器同组的选择器，其余每一组都通过Vm.__copy__()从当前状态fork出一个新的vm，并把栈中的选择器以及比较结果替换为该组的值
+   step5：当某个vm进入了函数体，就从当前状态继续执行_process_function，gas_used也从fork时的值继续累加，所以结果和单独调用function_arguments完全一致
+'''
+def function_arguments_many(
+    code: bytes | str | memoryview,
+    selectors: list[bytes | str],
+    gas_limit: int = int(1e4),
+    *,
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+    fuse: bool = False,
+) -> dict[bytes | str, str]:
+    return {s: r.arguments for s, r in _function_arguments_many(code, selectors, gas_limit, tracer, governor, fuse).items()}
+
+
+def _function_arguments_many(
+    code: bytes | str | memoryview,
+    selectors: list[bytes | str],
+    gas_limit: int,
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+    fuse: bool = False,
+) -> dict[bytes | str, ArgumentsResult]:
+    bytes_code = _to_code(code)
+    bytes_selectors = [to_bytes(s) for s in selectors]
+    results: dict[bytes, ArgumentsResult] = {}
+    # 去掉重复的选择器，保持输入的顺序
+    pending = list(dict.fromkeys(bytes_selectors))
+    # 没有进入函数体的选择器 -> 所在的vm停止时的步数，上报给tracer
+    dispatcher_steps: dict[bytes, int] = {}
+    if len(pending) > 0:
+        # 工作队列中的每一项：(vm, 该vm代表的选择器, 已经消耗的gas, fork时最后一步的ret)
+        worklist = [(Vm(code=bytes_code, calldata=CallData(pending[0]), tracer=tracer, governor=governor, fuse=fuse), pending, 0, None)]
+        while len(worklist) > 0:
+            vm, pending, gas_used, ret = worklist.pop()
+            if ret is not None and _enter_function(vm, ret, pending, gas_limit, gas_used, results):
+                continue
+            _process_dispatcher(vm, pending, gas_limit, gas_used, worklist, results, dispatcher_steps)
+
+    # 没有进入过函数体的选择器，和单独调用function_arguments一样返回空字符串
+    # 如果是因为governor的上限没有执行到，停止原因是governor记录的原因
+    if governor is None or governor.reason is None:
+        not_found = ArgumentsResult('', Termination.NOT_FOUND)
+    else:
+        not_found = ArgumentsResult('', governor.reason, 'not reached before the governor stopped the analysis')
+    if tracer is not None:
+        for bs in dict.fromkeys(bytes_selectors):
+            if bs not in results:
+                tracer.on_termination(bs, not_found, dispatcher_steps.get(bs, 0))
+    return {s: results.get(bs, not_found) for s, bs in zip(selectors, bytes_selectors)}
+
+
+# 描述：在dispatcher中执行vm，直到vm进入了某个函数体或者停止
+def _process_dispatcher(vm: Vm, pending: list[bytes], gas_limit: int, gas_used: int, worklist: list, results: dict[bytes, ArgumentsResult], dispatcher_steps: dict[bytes, int]):
+    while not vm.stopped:
+        try:
+            ret = vm.step()
+            gas_used += ret[1]
+            if gas_used > gas_limit:
+                break
+        except (StackIndexError, UnsupportedOpError, ResourceLimitError):
+            break
+
+        _mark_signature(vm, ret)
+        match ret:
+            # 函数选择器和常量做比较，pending中的选择器按照比较结果分组
+            case (Op.EQ | Op.XOR | Op.SUB | Op.LT | Op.GT, _, CallDataSignature(), _):
+                pending = _fork_pending(vm, ret, 2, pending, gas_used, worklist)
+            case (Op.EQ | Op.XOR | Op.SUB | Op.LT | Op.GT, _, _, CallDataSignature()):
+                pending = _fork_pending(vm, ret, 3, pending, gas_used, worklist)
+            case (Op.ISZERO, _, CallDataSignature()):
+                pending = _fork_pending(vm, ret, 2, pending, gas_used, worklist)
+
+        if _enter_function(vm, ret, pending, gas_limit, gas_used, results):
+            return
+    # 和单独调用function_arguments一样，步数包括fork之前执行的dispatcher
+    for s in pending:
+        dispatcher_steps[s] = vm.steps
+
+
+# 和_process_function中判断是否进入函数的逻辑完全一致，如果进入了函数体，则继续执行完这个函数
+def _enter_function(vm: Vm, ret: tuple, pending: list[bytes], gas_limit: int, gas_used: int, results: dict[bytes, ArgumentsResult]) -> bool:
+    if ret[0] in {Op.EQ, Op.XOR, Op.SUB}:
+        p = int(vm.stack.peek())
+        if p == (1 if ret[0] == Op.EQ else 0) and int(ret[2]).to_bytes(32, 'big').endswith(pending[0]):
+            # 比较的操作数不是CallDataSignature时pending不会被分组，剩下的选择器只能单独从pc = 0开始执行
+            for s in pending[1:]:
+                results[s] = _process_function(Vm(code=vm.code, calldata=CallData(s), tracer=vm.tracer, governor=vm.governor, fuse=vm.fuse), s, gas_limit)
+            results[pending[0]] = _process_function(vm, pending[0], gas_limit, gas_used=gas_used, inside_function=True)
+            return True
+    return False
+
+
+# 描述：ret[idx]是CallDataSignature，按照把它替换为每个选择器之后的比较结果是否为0将pending分组，当前vm保留calldata中的选择器所在的组，其余的组fork出新的vm
+def _fork_pending(vm: Vm, ret: tuple, idx: int, pending: list[bytes], gas_used: int, worklist: list) -> list[bytes]:
+    groups: dict[bool, list[bytes]] = {}
+    for s in pending:
+        groups.setdefault(_compare(_resign_ret(ret, idx, s)) != 0, []).append(s)
+
+    keep = groups.pop(_compare(ret) != 0)
+    for group in groups.values():
+        fork, fork_ret = _fork_signature(vm, ret, idx, group[0])
+        worklist.append((fork, group, gas_used, fork_ret))
+    return keep
+
+
+# 从vm的当前状态fork出一个以selector作为calldata的vm，ret是刚执行完的比较操作，ret[idx]是CallDataSignature
+def _fork_signature(vm: Vm, ret: tuple, idx: int, selector: bytes) -> tuple[Vm, tuple]:
+    fork = vm.__copy__()
+    fork.calldata = CallData(selector)
+    fork.stack._data = [_resign(v, selector) for v in fork.stack._data]
+    fork.stack._shared = False
+    fork_ret = _resign_ret(ret, idx, selector)
+    # 栈顶是比较操作的结果，替换为该选择器的比较结果
+    fork.stack.pop()
+    fork.stack.push_uint(_compare(fork_ret))
+    return fork, fork_ret
+
+
+# dispatcher在CALLDATALOAD(0)之后通过SHR/DIV/AND(或者写入内存之后再MLOAD)取出函数选择器，如果结果的最后4个字节就是calldata中的选择器，则升级为CallDataSignature
+def _mark_signature(vm: Vm, ret: tuple):
+    match ret:
+        # fmt: off
+        case (Op.SHR, _, _, CallDataValue()) | \
+             (Op.AND, _, CallDataSignature() | CallDataValue(), _) | \
+             (Op.AND, _, _, CallDataSignature() | CallDataValue()) | \
+             (Op.DIV, _, CallDataSignature() | CallDataValue(), _
+            ):
+        # fmt: on
+            v = int(vm.stack.peek())
+            if len(vm.calldata) >= 4 and v.to_bytes(32, 'big')[-4:] == vm.calldata[:4]:
+                _push_tag(vm, vm.stack.pop(), CallDataSignature(v))
+
+        case (Op.MLOAD, _, set() as used):
+            if any(isinstance(u, CallDataValue) for u in used):
+                v = int(vm.stack.peek())
+                if len(vm.calldata) >= 4 and v.to_bytes(32, 'big')[-4:] == vm.calldata[:4]:
+                    _push_tag(vm, vm.stack.pop(), CallDataSignature(v))
+
+
+# 重新计算dispatcher中比较操作的结果，ret的格式和Vm.step()的返回值一致
+def _compare(ret: tuple) -> int:
+    s0 = int(ret[2])
+    if ret[0] == Op.ISZERO:
+        return 0 if s0 else 1
+
+    s1 = int(ret[3])
+    match ret[0]:
+        case Op.EQ:
+            return 1 if s0 == s1 else 0
+        case Op.XOR:
+            return s0 ^ s1
+        case Op.SUB:
+            return (s0 - s1) & E256M1
+        case Op.LT:
+            return 1 if s0 < s1 else 0
+        case Op.GT:
+            return 1 if s0 > s1 else 0
+        case _:
+            raise Exception(f'BUG: op {ret[0]} not handled in match')
+
+
+# fork出的vm需要把栈中由calldata得到的值都替换为新的选择器，这样才和以新的选择器作为calldata从头执行的状态一致
+def _resign(v: int | Tag, selector: bytes) -> int | Tag:
+    if isinstance(v, CallDataSignature):
+        return CallDataSignature(int.from_bytes(v.val.to_bytes(32, 'big')[:-4] + selector, 'big'))
+    if isinstance(v, CallDataValue):
+        return CallDataValue(int.from_bytes(selector + v.val.to_bytes(32, 'big')[len(selector):], 'big'))
+    return v
+
+
+def _resign_ret(ret: tuple, idx: int, selector: bytes) -> tuple:
+    return (*ret[:idx], _resign(ret[idx], selector), *ret[idx + 1 :])
+
 
+# 描述：不需要事先知道函数选择器，执行一遍dispatcher，找出合约中所有的函数选择器并推断它们的参数类型
+'''function_arguments_all的运行流程：
+   step1：以一个随意的选择器0xaabbccdd作为calldata创建vm，在dispatcher中执行，它的值只影响step2之前的比较结果，每个候选的选择器都会fork出自己的vm
+   step2：EQ/XOR/SUB使用CallDataSignature和常量比较时，常量的最后4个字节就是一个候选的函数选择器，fork出以该选择器作为calldata的vm，然后通过_enter_function进入函数体推断参数类型
+   step3：LT/GT使用CallDataSignature比较时说明dispatcher在二分查找选择器，fork出一个vm，把比较结果取反，这样两个分支中的选择器都能被找到
+         同一个(pc, 常量, 取反之后的结果)只fork一次，否则在循环中反复比较的字节码会让fork的数量指数增长；工作队列最多保留_MAX_DISCOVERY_FORKS个vm
+   每个函数体的执行都是从它真实的dispatcher路径fork出来的，所以结果和对找到的选择器单独调用function_arguments一致
+'''
+# 工作队列中最多同时保留的vm个数，正常的dispatcher远远达不到
+_MAX_DISCOVERY_FORKS = 4096
+
+
+def function_arguments_all(
+    code: bytes | str | memoryview, gas_limit: int = int(1e4), *, tracer: Tracer | None = None, governor: 'Governor | None' = None, fuse: bool = False
+) -> dict[str, str]:
+    return {s: r.arguments for s, r in _function_arguments_all(code, gas_limit, tracer, governor, fuse).items()}
+
+
+def _function_arguments_all(
+    code: bytes | str | memoryview, gas_limit: int, tracer: Tracer | None = None, governor: 'Governor | None' = None, fuse: bool = False
+) -> dict[str, ArgumentsResult]:
+    vm = Vm(code=_to_code(code), calldata=CallData(b'\xaa\xbb\xcc\xdd'), tracer=tracer, governor=governor, fuse=fuse)
+    results: dict[bytes, ArgumentsResult] = {}
+    # 工作队列中的每一项：(vm, 已经消耗的gas)
+    worklist = [(vm, 0)]
+    # 已经fork过的LT/GT：(pc, 常量, 取反之后的结果)
+    forked: set[tuple[int, int, int]] = set()
+    while len(worklist) > 0:
+        vm, gas_used = worklist.pop()
+        _process_discovery(vm, gas_limit, gas_used, worklist, results, forked)
+    return {s.hex(): v for s, v in results.items()}
+
+
+def _process_discovery(vm: Vm, gas_limit: int, gas_used: int, worklist: list, results: dict[bytes, ArgumentsResult], forked: set[tuple[int, int, int]]):
+    while not vm.stopped:
+        try:
+            ret = vm.step()
+            gas_used += ret[1]
+            if gas_used > gas_limit:
+                break
+        except (StackIndexError, UnsupportedOpError, ResourceLimitError):
+            break
+
+        _mark_signature(vm, ret)
+        match ret:
+            # fmt: off
+            case (Op.EQ | Op.XOR | Op.SUB, _, CallDataSignature(), ot) | \
+                 (Op.EQ | Op.XOR | Op.SUB, _, ot, CallDataSignature()
+                ):
+            # fmt: on
+                selector = int(ot).to_bytes(32, 'big')[-4:]
+                idx = 2 if isinstance(ret[2], CallDataSignature) else 3
+                # 只有当该选择器的比较结果和当前vm的比较结果不同时，才需要fork
+                if selector not in results and (_compare(_resign_ret(ret, idx, selector)) != 0) != (_compare(ret) != 0):
+                    fork, fork_ret = _fork_signature(vm, ret, idx, selector)
+                    if not _enter_function(fork, fork_ret, [selector], gas_limit, gas_used, results):
+                        worklist.append((fork, gas_used))
+
+            case (Op.LT | Op.GT, _, CallDataSignature(), _) | (Op.LT | Op.GT, _, _, CallDataSignature()):
+                constant = int(ret[3] if isinstance(ret[2], CallDataSignature) else ret[2])
+                flipped = 0 if int(vm.stack.peek()) else 1
+                key = (vm.pc, constant, flipped)
+                if key not in forked and len(worklist) < _MAX_DISCOVERY_FORKS:
+                    forked.add(key)
+                    fork = vm.__copy__()
+                    fork.stack.pop_uint()
+                    fork.stack.push_uint(flipped)
+                    worklist.append((fork, gas_used))
+
+        if _enter_function(vm, ret, [vm.calldata[:4]], gas_limit, gas_used, results):
+            return
+
+
+# 描述：和function_arguments_many/function_arguments_all相同，但是每个选择器返回ArgumentsResult，包含停止执行的原因
+# selectors为None时通过function_arguments_all找出合约中所有的函数选择器，结果的键是选择器的十六进制字符串
+def function_arguments_results(
+    code: bytes | str | memoryview,
+    selectors: list[bytes | str] | None = None,
+    gas_limit: int = int(1e4),
+    *,
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+    fuse: bool = False,
+) -> dict[bytes | str, ArgumentsResult]:
+    if selectors is None:
+        return _function_arguments_all(code, gas_limit, tracer, governor, fuse)
+    return _function_arguments_many(code, selectors, gas_limit, tracer, governor, fuse)
+
+
+# 描述：探索模式，在函数体中的JUMPI处同时执行两个分支，合并所有路径上推断出的参数类型
+'''function_arguments只沿着全0的calldata决定的那一个分支执行，位于长度检查、边界检查之后的解码代码可能永远不会被执行到
+   function_arguments_explore的运行流程：
+   step1：和function_arguments一样从pc = 0开始执行，进入函数体之后给vm挂载_Explorer
+   step2：函数体中每执行一条JUMPI，从JUMPI之前的状态fork出没有被选择的那个分支，放入工作队列(dispatcher跳转到函数体的那一条JUMPI除外)
+         fork出来的路径从fork时这条路径的参数字典的副本开始，栈中的Arg等来源标记在字典中都有对应的条目
+   step3：每个分支的状态用(pc, 栈的抽象形状)去重，栈中的int只保留合法的跳转目的地(函数的返回地址)，Tag只保留类型和offset，所以循环和菱形的控制流不会重复执行
+         fork出来的路径执行到已经访问过的状态时直接停止，具体的路径(concrete path)本身不会因为去重停止
+   step4：所有路径执行的总步数超过max_steps之后不再执行工作队列中剩下的路径，每条路径仍然受gas_limit的限制
+   step5：具体路径的结果优先，其余路径只补充具体路径中没有出现或者还不知道类型的参数
+   当前的vm不记录比较结果的来源，所以函数体中所有的JUMPI都被当作是依赖calldata的
+'''
+def function_arguments_explore(
+    code: bytes | str | memoryview,
+    selector: bytes | str,
+    gas_limit: int = int(1e4),
+    *,
+    max_steps: int = int(1e5),
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+    fuse: bool = False,
+) -> str:
+    bytes_selector = to_bytes(selector)
+    vm = Vm(code=_to_code(code), calldata=CallData(bytes_selector), tracer=tracer, governor=governor, fuse=fuse)
+    return _explore_function(vm, bytes_selector, gas_limit, max_steps).arguments
+
+
+def _explore_function(vm: Vm, bytes_selector: bytes, gas_limit: int, max_steps: int) -> ArgumentsResult:
+    tracer = vm.tracer
+    explorer = _Explorer(max_steps)
+    merged = _new_args(tracer, bytes_selector)
+    result = _process_function(vm, bytes_selector, gas_limit, explore=explorer, args=merged)
+    governor = vm.governor
+    while len(explorer.worklist) > 0 and explorer.steps < max_steps:
+        # 步数或者截止时间已经超出，剩下的路径都会立刻停止，不必再执行
+        if governor is not None and governor.reason is not None:
+            result = ArgumentsResult('', governor.reason, f'exploration stopped with {len(explorer.worklist)} pending paths')
+            break
+        fork, gas_used, path_args = explorer.worklist.pop()
+        _process_function(fork, bytes_selector, gas_limit, gas_used=gas_used, inside_function=True, explore=explorer, args=path_args)
+        for offset, t in path_args.items():
+            if merged.get(offset, '') == '':
+                merged[offset] = t
+
+    result = ArgumentsResult(_format_args(merged), result.reason, result.error)
+    if tracer is not None:
+        tracer.on_termination(bytes_selector, result, explorer.steps)
+    return result
+
+
+class _Explorer:
+    def __init__(self, max_steps: int):
+        self.max_steps = max_steps
+        self.steps = 0 # 所有路径在函数体中执行的总步数
+        self.worklist: list[tuple[Vm, int, dict[int, str]]] = [] # (fork出来的vm, fork时已经消耗的gas, fork时参数字典的副本)
+        self.visited: set[tuple] = set()
+
+    # 通过vm.set_explorer()把vm的类换成_ExploringVm(VM.py)，每一步之后调用after_step检查是否是JUMPI
+    # 每个vm自己的状态保存在vm上：explore_gas是已经消耗的gas，explore_args是这条路径写入的参数字典，explore_skip为True时跳过下一条JUMPI
+    # forked为False表示具体路径刚刚进入函数体，此时的下一条JUMPI是dispatcher跳转到函数体的那一条，不能fork
+    def attach(self, vm: Vm, gas_used: int, args: dict[int, str], *, forked: bool):
+        vm.explore_gas = gas_used
+        vm.explore_args = args
+        vm.explore_skip = not forked
+        vm.explore_forked = forked
+        vm.set_explorer(self)
+
+    def after_step(self, vm: Vm, pc: int, ret: tuple):
+        vm.explore_gas += ret[1]
+        self.steps += 1
+        if ret[0] == Op.JUMPI:
+            if vm.explore_skip:
+                vm.explore_skip = False
+            else:
+                self._branch(vm, pc, ret, vm.explore_gas, vm.explore_forked)
+
+    def _branch(self, vm: Vm, pc: int, ret: tuple, gas_used: int, forked: bool):
+        key = _state_key(vm, vm.pc)
+        if key in self.visited and forked:
+            vm.stopped = True
+        self.visited.add(key)
+
+        # 没有被选择的分支：条件为真时是JUMPI的下一条指令，条件为假时是跳转的目的地
+        alt = pc + 1 if ret[3] != 0 else ret[2]
+        if self.steps >= self.max_steps or alt >= len(vm.code) or (alt != pc + 1 and not vm.decoded.is_jumpdest(alt)):
+            return
+        key = _state_key(vm, alt)
+        if key in self.visited:
+            return
+        self.visited.add(key)
+        fork = vm.__copy__()
+        fork.pc = alt
+        fork.stopped = False
+        path_args = dict(vm.explore_args)
+        self.attach(fork, gas_used, path_args, forked=True)
+        self.worklist.append((fork, gas_used, path_args))
+## _Explorer类：function_arguments_explore的工作队列和去重集合，fork出来的vm都挂载了同一个_Explorer
+
+
+# 状态的抽象：pc以及栈中每个元素的形状
+def _state_key(vm: Vm, pc: int) -> tuple:
+    is_jumpdest = vm.decoded.is_jumpdest
+    return (pc, tuple((v if is_jumpdest(v) else None) if type(v) is int else (type(v), getattr(v, 'offset', None), getattr(v, 'dynamic', None)) for v in vm.stack._data))
+
+
+# 描述：多个探测calldata同步执行(lockstep)，合并所有探测推断出的参数类型
+'''function_arguments只使用全0的calldata，数组长度、偏移量这些依赖参数值的布局只能用不同的探测calldata分别执行
+   function_arguments_probes的运行流程：
+   step1：每个探测是选择器之后的calldata，和选择器拼接成一个lane，所有lane放在同一个LockstepVm(VM.py)中从pc = 0开始执行
+   step2：所有lane中相同的步骤只执行一次，读取calldata以及使用了不同值的步骤按lane执行，推断规则也对每个lane分别执行
+   step3：JUMPI/JUMP在lane之间的走向不同，或者需要在内存中保存不同的值时，按照lane分组继续执行(_run_lane_groups)，只剩一个lane的组就是普通的Vm
+   step4：包含第一个探测的那一组的结果优先，其余的组只补充没有出现或者还不知道类型的参数，停止的原因也来自第一组
+   probes为None时只有一个全0的探测，结果和function_arguments相同
+'''
+def function_arguments_probes(
+    code: bytes | str | memoryview,
+    selector: bytes | str,
+    probes: list[bytes | str] | None = None,
+    gas_limit: int = int(1e4),
+    *,
+    tracer: Tracer | None = None,
+    governor: 'Governor | None' = None,
+) -> str:
+    bytes_selector = to_bytes(selector)
+    lanes = [CallData(bytes_selector + to_bytes(p)) for p in (probes or [b''])]
+    if len(lanes) == 1:
+        vm = Vm(code=_to_code(code), calldata=lanes[0], tracer=tracer, governor=governor)
+    else:
+        vm = LockstepVm(code=_to_code(code), lanes=lanes, tracer=tracer, governor=governor)
+    return _process_function(vm, bytes_selector, gas_limit).arguments
+
+
+# 返回第一组的(停止原因, 错误)，其余组推断出的参数类型合并到args中
+def _run_lane_groups(
+    vm: 'LockstepVm', groups: list[list[int]], bytes_selector: bytes, gas_limit: int, gas_used: int, inside_function: bool, args: dict[int, str]
+) -> tuple[str, str | None]:
+    first = None
+    # 其余组从分开时的参数字典的副本开始，栈中的来源标记在字典中都有对应的条目
+    seeds = [args] + [dict(args) for _ in groups[1:]]
+    for child, path_args in zip(vm.split(groups), seeds):
+        # 第一组直接写入args，所以它的结果优先
+        result = _process_function(child, bytes_selector, gas_limit, gas_used=gas_used, inside_function=inside_function, args=path_args, report=False)
+        if first is None:
+            first = result
+            continue
+        for offset, t in path_args.items():
+            if args.get(offset, '') == '':
+                args[offset] = t
+    return first.reason, first.error
@@ -0,0 +1,108 @@
+# 描述：Vm.step()的微基准测试，在真实合约的字节码上统计每秒执行的步数(steps/sec)
+'''输入和regression.py使用同一个语料库(默认是benchmarks/corpus.jsonl)，每个合约使用语料库中列出的函数选择器
+   对每一个(合约, 选择器)，从pc = 0开始执行Vm.step()直到EVM停止、抛出异常或者达到步数上限
+   --fuse时使用融合指令(superinstruction)执行，一段融合的栈操作只算一步，所以steps/sec需要结合总时间比较
+   --arguments时同时执行完整的function_arguments(包括推断规则)，步数由MetricsCollector统计，和只执行Vm.step()的steps/sec比较得到推断规则的开销
+   --save-baseline把这一次的steps/sec写入json文件，--baseline和保存的基线比较，下降超过--max-regression时以状态码1退出
+   用法：python benchmark.py --rounds 5 --arguments --save-baseline before.json
+        python benchmark.py --rounds 5 --arguments --baseline before.json
+'''
+import argparse
+import json
+import sys
+import time
+
+from arguments import function_arguments, to_bytes
+from regression import DEFAULT_CORPUS, compare_baseline, load_suite
+from tracing import MetricsCollector
+from VM import CallData, StackIndexError, UnsupportedOpError, Vm
+
+# 和基线比较的指标，--arguments时才有arguments_steps_per_sec
+BENCH_METRICS = ('vm_steps_per_sec', 'arguments_steps_per_sec')
+
+
+def load_corpus(path: str = DEFAULT_CORPUS) -> list[tuple[bytes, list[bytes]]]:
+    return [(entry.code, [to_bytes(s) for s in entry.functions]) for entry in load_suite(path)]
+
+
+# 执行一个选择器，返回执行的步数
+def run_vm(code: bytes, selector: bytes, max_steps: int, fuse: bool = False) -> int:
+    vm = Vm(code=code, calldata=CallData(selector), fuse=fuse)
+    steps = 0
+    while not vm.stopped and steps < max_steps:
+        try:
+            vm.step()
+        except (StackIndexError, UnsupportedOpError):
+            break
+        steps += 1
+    return steps
+
+
+def bench_vm(corpus: list[tuple[bytes, list[bytes]]], rounds: int, max_steps: int, fuse: bool = False) -> tuple[int, float]:
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code, selectors in corpus:
+            for selector in selectors:
+                steps += run_vm(code, selector, max_steps, fuse)
+    return steps, time.perf_counter() - start
+
+
+# 执行完整的function_arguments，返回(步数, 秒)，步数不包括挂载MetricsCollector统计的那一遍
+def bench_arguments(corpus: list[tuple[bytes, list[bytes]]], rounds: int, gas_limit: int, fuse: bool = False) -> tuple[int, float]:
+    collector = MetricsCollector(per_selector=False)
+    for code, selectors in corpus:
+        for selector in selectors:
+            function_arguments(code, selector, gas_limit, tracer=collector)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code, selectors in corpus:
+            for selector in selectors:
+                function_arguments(code, selector, gas_limit, fuse=fuse)
+    return collector.steps * rounds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vm.step() micro-benchmark')
+    parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS, help='jsonl corpus in the regression.py format')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--max-steps', type=int, default=10000)
+    parser.add_argument('--fuse', action='store_true', help='run with fused stack-op superinstructions')
+    parser.add_argument('--arguments', action='store_true', help='also benchmark function_arguments, including the inference rules')
+    parser.add_argument('--gas-limit', type=int, default=int(1e4), help='gas limit for --arguments')
+    parser.add_argument('--baseline', help='json report to compare steps/sec against')
+    parser.add_argument('--max-regression', type=float, default=0.1, help='allowed steps/sec drop relative to the baseline (0.1 = 10%%)')
+    parser.add_argument('--save-baseline', help='write this run as a json baseline')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    # 预热：解码字节码并填充decode_code的缓存
+    bench_vm(corpus, 1, args.max_steps, args.fuse)
+    steps, elapsed = bench_vm(corpus, args.rounds, args.max_steps, args.fuse)
+    print(f'contracts: {len(corpus)}, selectors: {sum(len(s) for _, s in corpus)}')
+    print(f'steps: {steps}, time: {elapsed:.3f}s, steps/sec: {steps / elapsed:,.0f}')
+    report = {'vm_steps_per_sec': steps / elapsed}
+    if args.arguments:
+        bench_arguments(corpus, 1, args.gas_limit, args.fuse)
+        a_steps, a_elapsed = bench_arguments(corpus, args.rounds, args.gas_limit, args.fuse)
+        print(f'function_arguments steps: {a_steps}, time: {a_elapsed:.3f}s, steps/sec: {a_steps / a_elapsed:,.0f}')
+        report['arguments_steps_per_sec'] = a_steps / a_elapsed
+
+    failures = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for metric in BENCH_METRICS:
+            if metric in baseline and metric in report:
+                print(f'{metric}: {report[metric]:,.0f} (baseline {baseline[metric]:,.0f}, {report[metric] / baseline[metric] - 1:+.1%})')
+        failures = compare_baseline(report, baseline, args.max_regression, tuple(m for m in BENCH_METRICS if m in report))
+        for failure in failures:
+            print(f'FAIL {failure}')
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if len(failures) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# 描述：批量分析大量合约，把工作分发到进程池中并行执行
+'''analyze_many(items)的运行流程：
+   step1：items中的每一项是(code, selectors)，selectors为None时通过function_arguments_all找出合约中所有的函数选择器
+   step2：每batch_size个合约组成一批，交给进程池中的一个worker执行，同时在执行中的批次不超过workers * 2，所以items可以是很大的生成器
+   step3：每个合约使用一个Governor(governor.py)，执行超过timeout秒、max_steps步或者内存超过max_memory时停止，返回已经推断出的部分结果
+         另外设置一个2 * timeout秒的定时器(SIGALRM)兜底，超时的合约会被中断并记录为超时，不会卡住整个worker
+   step4：按照输入的顺序(ordered=True)或者按照完成的顺序(ordered=False)逐个返回每个合约的结果记录
+   每个合约的结果记录是一个可以直接写入json的dict：
+     {'index': 在items中的序号, 'status': 'ok' | 'partial' | 'timeout' | 'error', 'error': 错误描述, 'elapsed': 秒,
+      'functions': {选择器: {'arguments': 参数类型, 'reason': Termination中的停止原因, 'error': 异常描述}}}
+   status为'partial'表示有选择器被Governor停止(reason是step_limit/deadline/memory_limit)，它们的参数类型可能不完整，error中记录第一个停止原因
+   命令行用法：python bulk.py contracts.txt -o results.jsonl --workers 8 --timeout 10
+'''
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator
+
+from arguments import _RESOURCE_REASONS, function_arguments_results
+from governor import Governor
+
+
+class ContractTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise ContractTimeout
+
+
+def _init_worker():
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def analyze_contract(
+    index: int,
+    code: bytes | str,
+    selectors: list[bytes | str] | None,
+    timeout: float,
+    gas_limit: int,
+    max_steps: int | None = None,
+    max_memory: int | None = None,
+) -> dict:
+    record = {'index': index, 'status': 'ok', 'error': None, 'elapsed': 0.0, 'functions': {}}
+    start = time.perf_counter()
+    governor = Governor(max_steps=max_steps, timeout=timeout if timeout > 0 else None, max_memory=max_memory)
+    # 没有SIGALRM的平台(Windows)上只有governor限制执行时间
+    use_alarm = timeout > 0 and hasattr(signal, 'setitimer')
+    try:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 2 * timeout)
+        try:
+            results = function_arguments_results(code, selectors, gas_limit, governor=governor)
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        record['functions'] = {
+            (s if isinstance(s, str) else s.hex()): {'arguments': r.arguments, 'reason': r.reason, 'error': r.error}
+            for s, r in results.items()
+        }
+        # 被governor停止的结果不完整，调用者不应该把它们当作最终结果缓存
+        stopped = [r.reason for r in results.values() if r.reason in _RESOURCE_REASONS]
+        if len(stopped) > 0:
+            record['status'] = 'partial'
+            record['error'] = f'stopped by governor: {stopped[0]}'
+    except ContractTimeout:
+        record['status'] = 'timeout'
+        record['error'] = f'timeout after {timeout}s'
+    except Exception as ex:
+        record['status'] = 'error'
+        record['error'] = f'{ex.__class__.__name__}: {ex}'
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+
+def _analyze_batch(
+    batch: list[tuple[int, bytes | str, list[bytes | str] | None]], timeout: float, gas_limit: int, max_steps: int | None, max_memory: int | None
+) -> list[dict]:
+    return [analyze_contract(index, code, selectors, timeout, gas_limit, max_steps, max_memory) for index, code, selectors in batch]
+
+
+def _batches(items: Iterable[tuple[bytes | str, list[bytes | str] | None]], batch_size: int) -> Iterator[list]:
+    batch = []
+    for index, (code, selectors) in enumerate(items):
+        batch.append((index, code, selectors))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+# worker进程崩溃时，这一批中所有合约都记录为error
+def _failed_batch(batch: list, ex: BaseException) -> list[dict]:
+    return [{'index': index, 'status': 'error', 'error': f'{ex.__class__.__name__}: {ex}', 'elapsed': 0.0, 'functions': {}} for index, _, _ in batch]
+
+
+def analyze_many(
+    items: Iterable[tuple[bytes | str, list[bytes | str] | None]],
+    *,
+    workers: int | None = None,
+    batch_size: int = 16,
+    timeout: float = 10.0,
+    gas_limit: int = int(1e4),
+    max_steps: int | None = None,
+    max_memory: int | None = None,
+    ordered: bool = True,
+) -> Iterator[dict]:
+    workers = workers or os.cpu_count() or 1
+    max_inflight = workers * 2
+    batches = _batches(items, batch_size)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    # 按照提交顺序保存正在执行的批次
+    inflight: dict[Future, list] = {}
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(inflight) < max_inflight:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                try:
+                    inflight[executor.submit(_analyze_batch, batch, timeout, gas_limit, max_steps, max_memory)] = batch
+                except BrokenProcessPool:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+                    inflight[executor.submit(_analyze_batch, batch, timeout, gas_limit, max_steps, max_memory)] = batch
+            if len(inflight) == 0:
+                break
+
+            if ordered:
+                done = [next(iter(inflight))]
+            else:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                batch = inflight.pop(fut)
+                try:
+                    records = fut.result()
+                except BrokenProcessPool as ex:
+                    records = _failed_batch(batch, ex)
+                yield from records
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 输入文件的格式和benchmark.py相同：每一行是十六进制的runtime code，后面可以跟用逗号分隔的函数选择器，'-'表示从标准输入读取
+def read_contracts(path: str) -> Iterator[tuple[str, list[str] | None]]:
+    f = sys.stdin if path == '-' else open(path)
+    try:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 0:
+                continue
+            yield parts[0], (parts[1].split(',') if len(parts) > 1 else None)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Infer function arguments for many contracts in parallel')
+    parser.add_argument('input', help="file with one hex runtime code (and optional comma-separated selectors) per line, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="jsonl output file, '-' for stdout")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per contract, 0 to disable')
+    parser.add_argument('--gas-limit', type=int, default=int(1e4))
+    parser.add_argument('--max-steps', type=int, default=None, help='steps per contract')
+    parser.add_argument('--max-memory', type=int, default=None, help='memory expansion ceiling in bytes')
+    parser.add_argument('--unordered', action='store_true', help='emit results as they complete')
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        records = analyze_many(
+            read_contracts(args.input),
+            workers=args.workers,
+            batch_size=args.batch_size,
+            timeout=args.timeout,
+            gas_limit=args.gas_limit,
+            max_steps=args.max_steps,
+            max_memory=args.max_memory,
+            ordered=not args.unordered,
+        )
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# 描述：function_arguments的结果缓存，按照字节码的内容寻址
+'''同一份runtime code(工厂合约克隆出来的合约、标准的token合约)会被分析成千上万次，而function_arguments每次都会重新计算
+   缓存的键：sha256(code) + 函数选择器 + gas_limit + ANALYZER_VERSION
+   1.LRUCache：进程内的LRU缓存，容量有上限，记录命中、未命中以及被淘汰的次数
+   2.SqliteStore：可选的磁盘缓存，使用sqlite的WAL模式，多个worker进程可以同时读写同一个数据库文件
+   3.ResultCache：先查LRUCache，再查SqliteStore，都没有命中才调用function_arguments，并把结果写回两级缓存
+   4.ResultCache(fingerprinter=Fingerprinter())时用fingerprint.py中去掉了CBOR元数据的字节码代替code计算键，只有元数据不同的合约共享同一个条目
+     屏蔽immutable(mask_immutables=True)不能证明被屏蔽的值和参数推断无关，可能把一个合约的结果返回给另一个合约，所以不能用作缓存的键
+   推断规则(arguments.py)的结果发生变化时需要修改ANALYZER_VERSION，旧的缓存条目会因为键不同而自动失效
+   同一个数据库文件可以同时被多个salt使用(例如滚动部署中新旧版本的worker)，打开时不删除其他salt的条目，确认不再使用的旧版本用SqliteStore.purge()删除
+'''
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict
+
+from arguments import function_arguments, function_arguments_many, to_bytes
+from fingerprint import Fingerprinter
+
+ANALYZER_VERSION = '3'
+
+
+def cache_key(code: bytes, selector: bytes, gas_limit: int, salt: str = ANALYZER_VERSION) -> str:
+    h = hashlib.sha256(code)
+    h.update(b'\x00' + selector)
+    h.update(b'\x00' + gas_limit.to_bytes(16, 'big'))
+    h.update(b'\x00' + salt.encode())
+    return h.hexdigest()
+
+
+class CacheStats:
+    __slots__ = ('hits', 'misses', 'evictions')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return f'CacheStats(hits={self.hits}, misses={self.misses}, evictions={self.evictions})'
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 65536):
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._data: OrderedDict[str, str] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> str | None:
+        val = self._data.get(key)
+        if val is None:
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return val
+
+    def put(self, key: str, val: str):
+        self._data[key] = val
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+## LRUCache类：进程内的LRU缓存，超过maxsize之后淘汰最久没有被使用的条目
+
+
+class SqliteStore:
+    def __init__(self, path: str, salt: str = ANALYZER_VERSION):
+        self.path = path
+        self.salt = salt
+        self.stats = CacheStats()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = 0
+        self._connect()
+
+    # sqlite的连接不能跨进程使用，fork之后的worker进程需要重新连接
+    # 同一个进程中允许在其他线程使用(server.py在单独的线程中访问缓存)，调用者需要保证同一时间只有一个线程使用
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, salt TEXT NOT NULL, val TEXT NOT NULL)')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        row = self._connect().execute('SELECT val FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return row[0]
+
+    def put_many(self, items: list[tuple[str, str]]):
+        conn = self._connect()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO results (key, salt, val) VALUES (?, ?, ?)', ((k, self.salt, v) for k, v in items))
+
+    def put(self, key: str, val: str):
+        self.put_many([(key, val)])
+
+    # 删除这些salt写入的条目，例如已经没有worker使用的旧的ANALYZER_VERSION
+    def purge(self, *salts: str):
+        conn = self._connect()
+        with conn:
+            conn.executemany('DELETE FROM results WHERE salt = ?', ((salt,) for salt in salts))
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+## SqliteStore类：磁盘缓存，多个进程可以共享同一个数据库文件，写入通过sqlite的事务保证安全
+
+
+class ResultCache:
+    def __init__(self, maxsize: int = 65536, path: str | None = None, salt: str = ANALYZER_VERSION, *, fingerprinter: Fingerprinter | None = None):
+        if fingerprinter is not None and fingerprinter.mask_immutables:
+            raise ValueError('fingerprints with masked immutables cannot be used as cache keys')
+        self.salt = salt
+        self.fingerprinter = fingerprinter
+        # 同一个合约的多个选择器连续查询时只规范化一次
+        self._last_code: bytes | None = None
+        self._last_key_code = b''
+        self.memory = LRUCache(maxsize)
+        self.disk = SqliteStore(path, salt) if path is not None else None
+
+    # 计算缓存的键使用的字节码
+    def _key_code(self, code: bytes) -> bytes:
+        if self.fingerprinter is None:
+            return code
+        if code is not self._last_code:
+            self._last_key_code = self.fingerprinter.canonical(code)
+            self._last_code = code
+        return self._last_key_code
+
+    def _lookup(self, key: str) -> str | None:
+        val = self.memory.get(key)
+        if val is None and self.disk is not None:
+            val = self.disk.get(key)
+            if val is not None:
+                self.memory.put(key, val)
+        return val
+
+    # 只查缓存，不调用function_arguments，没有命中时返回None
+    def get(self, code: bytes, selector: bytes, gas_limit: int = int(1e4)) -> str | None:
+        return self._lookup(cache_key(self._key_code(code), selector, gas_limit, self.salt))
+
+    # 把同一个合约的多个结果写入两级缓存，磁盘只写入一次
+    def put_many(self, code: bytes, results: dict[bytes, str], gas_limit: int = int(1e4)):
+        key_code = self._key_code(code)
+        items = [(cache_key(key_code, s, gas_limit, self.salt), v) for s, v in results.items()]
+        for k, v in items:
+            self.memory.put(k, v)
+        if self.disk is not None and len(items) > 0:
+            self.disk.put_many(items)
+
+    def function_arguments(self, code: bytes | str, selector: bytes | str, gas_limit: int = int(1e4)) -> str:
+        bytes_code = to_bytes(code)
+        key = cache_key(self._key_code(bytes_code), to_bytes(selector), gas_limit, self.salt)
+        val = self._lookup(key)
+        if val is None:
+            val = function_arguments(bytes_code, selector, gas_limit)
+            self.memory.put(key, val)
+            if self.disk is not None:
+                self.disk.put(key, val)
+        return val
+
+    # 只对没有命中缓存的选择器调用function_arguments_many，并一次性写入磁盘
+    def function_arguments_many(self, code: bytes | str, selectors: list[bytes | str], gas_limit: int = int(1e4)) -> dict[bytes | str, str]:
+        bytes_code = to_bytes(code)
+        key_code = self._key_code(bytes_code)
+        keys = {s: cache_key(key_code, to_bytes(s), gas_limit, self.salt) for s in selectors}
+        ret = {s: self._lookup(k) for s, k in keys.items()}
+        missing = [s for s, v in ret.items() if v is None]
+        if len(missing) > 0:
+            computed = function_arguments_many(bytes_code, missing, gas_limit)
+            for s, v in computed.items():
+                ret[s] = v
+                self.memory.put(keys[s], v)
+            if self.disk is not None:
+                self.disk.put_many([(keys[s], v) for s, v in computed.items()])
+        return ret
+
+    def stats(self) -> dict[str, CacheStats | int]:
+        ret = {'memory': self.memory.stats, 'memory_size': len(self.memory)}
+        if self.disk is not None:
+            ret['disk'] = self.disk.stats
+        return ret
+## ResultCache类：两级缓存，对外提供和arguments.py中同名的function_arguments/function_arguments_many
@@ -0,0 +1,314 @@
+# 描述：紧凑的二进制合约语料库，通过mmap读取，以及按照流的方式分析整个语料库
+'''几个GB的十六进制字节码文件，每次启动都要逐行to_bytes并且全部留在内存中，启动时间和RSS都被它占满
+   语料库文件的格式(整数都是大端序)：
+     头部：MAGIC(8字节) + 合约数量(u64) + 索引的位置(u64)
+     数据：去重之后的字节码，一个接着一个
+     索引：每个合约一项，sha256(32字节) + 字节码的位置(u64) + 字节码的长度(u32)，按照sha256排序
+   用法：
+   step1：build_corpus(read_contracts('contracts.txt'), 'corpus.bin')，同一份字节码只写入一次，只有索引留在内存中
+   step2：corpus = Corpus('corpus.bin')，corpus[i]/corpus.get(sha256)返回mmap上的memoryview，function_arguments等函数可以直接使用，不需要复制
+   step3：write_records(stream_analysis('corpus.bin'), 'results.bin')，每个worker进程自己打开语料库，按照索引的区间分析，同时在执行中的区间不超过workers * 2，
+         结果按照索引的顺序逐条写入，所以内存占用和语料库的大小无关
+         每个合约产生一条和bulk.py相同结构的记录，超时、出错的合约也有记录；worker进程崩溃时和bulk.py一样重新创建进程池，正在执行的区间中的合约记录为error
+   结果文件的格式：RESULTS_MAGIC(8字节)，然后每个合约一条记录(字符串都是utf-8)：
+     合约在索引中的序号(u32) + status在STATUSES中的序号(u8) + elapsed(f64) + 函数的个数(u16) + error的长度(u16) + error
+     然后每个函数：函数选择器(4字节) + reason在REASONS中的序号(u8) + 参数类型的长度(u16) + error的长度(u16) + 参数类型 + error
+   命令行用法：python corpus.py build contracts.txt corpus.bin
+             python corpus.py analyze corpus.bin results.bin --workers 8 --timeout 10
+             python corpus.py dump results.bin
+'''
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Iterable, Iterator
+
+from arguments import Termination, to_bytes
+from bulk import _failed_batch, _init_worker, analyze_contract, read_contracts
+
+MAGIC = b'EVMCORP\x01'
+RESULTS_MAGIC = b'EVMARGS\x02'
+_HEADER = struct.Struct('>8sQQ')
+_ENTRY = struct.Struct('>32sQI')
+_RECORD = struct.Struct('>IBdHH')
+_FUNCTION = struct.Struct('>4sBHH')
+# 结果文件中status和reason按照在这两个元组中的序号保存，只能在末尾追加
+STATUSES = ('ok', 'partial', 'timeout', 'error')
+REASONS = (
+    Termination.STOPPED,
+    Termination.UNSUPPORTED_OP,
+    Termination.STACK_ERROR,
+    Termination.GAS_OVERFLOW,
+    Termination.NOT_FOUND,
+    Termination.STEP_LIMIT,
+    Termination.DEADLINE,
+    Termination.MEMORY_LIMIT,
+    Termination.LOOP,
+    Termination.DECODED,
+)
+
+
+class CorpusWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._f: BinaryIO = open(path, 'wb')
+        self._f.write(_HEADER.pack(MAGIC, 0, 0))
+        self._pos = _HEADER.size
+        # sha256 -> (位置, 长度)，唯一需要留在内存中的数据
+        self._index: dict[bytes, tuple[int, int]] = {}
+        self.added = 0
+
+    def __enter__(self) -> 'CorpusWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    # 返回字节码的sha256，已经写入过的字节码不会重复写入
+    def add(self, code: bytes) -> bytes:
+        self.added += 1
+        digest = hashlib.sha256(code).digest()
+        if digest not in self._index:
+            self._index[digest] = (self._pos, len(code))
+            self._f.write(code)
+            self._pos += len(code)
+        return digest
+
+    def close(self):
+        if self._f.closed:
+            return
+        for digest in sorted(self._index):
+            self._f.write(_ENTRY.pack(digest, *self._index[digest]))
+        self._f.seek(0)
+        self._f.write(_HEADER.pack(MAGIC, len(self._index), self._pos))
+        self._f.close()
+## CorpusWriter类：逐个写入字节码，close()时写入排好序的索引并回填头部
+
+
+def build_corpus(codes: Iterable[bytes | str | tuple], path: str) -> tuple[int, int]:
+    # codes中的每一项可以是字节码本身，也可以是bulk.read_contracts返回的(code, selectors)
+    with CorpusWriter(path) as writer:
+        for code in codes:
+            if isinstance(code, tuple):
+                code = code[0]
+            writer.add(to_bytes(code))
+        return writer.added, len(writer)
+
+
+class Corpus:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._index_pos = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f'{path}: not a corpus file')
+        self._view = memoryview(self._mm)
+
+    def __enter__(self) -> 'Corpus':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def digest(self, i: int) -> bytes:
+        return _ENTRY.unpack_from(self._mm, self._index_pos + i * _ENTRY.size)[0]
+
+    # 索引中第i个合约的字节码，只读的memoryview，不复制数据
+    def __getitem__(self, i: int) -> memoryview:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        _, pos, size = _ENTRY.unpack_from(self._mm, self._index_pos + i * _ENTRY.size)
+        return self._view[pos : pos + size]
+
+    def __iter__(self) -> Iterator[tuple[bytes, memoryview]]:
+        for i in range(self._count):
+            yield self.digest(i), self[i]
+
+    # 在排好序的索引上二分查找，没有找到时返回None
+    def index_of(self, digest: bytes) -> int | None:
+        i = bisect.bisect_left(range(self._count), digest, key=self.digest)
+        if i < self._count and self.digest(i) == digest:
+            return i
+        return None
+
+    def get(self, digest: bytes) -> memoryview | None:
+        i = self.index_of(digest)
+        return None if i is None else self[i]
+
+    # 所有从__getitem__得到的memoryview都释放之后才能关闭，否则mmap会抛出BufferError
+    def close(self):
+        self._view.release()
+        self._mm.close()
+## Corpus类：只读的语料库，打开时只读取头部，字节码和索引都按需从mmap中读取
+
+
+# 每个worker进程中已经打开的语料库，同一个文件只打开一次
+_open_corpora: dict[str, Corpus] = {}
+
+
+def _analyze_range(
+    path: str, start: int, stop: int, timeout: float, gas_limit: int, max_steps: int | None, max_memory: int | None
+) -> list[dict]:
+    corpus = _open_corpora.get(path)
+    if corpus is None:
+        corpus = _open_corpora[path] = Corpus(path)
+    records = []
+    for i in range(start, stop):
+        code = corpus[i]
+        try:
+            records.append(analyze_contract(i, code, None, timeout, gas_limit, max_steps, max_memory))
+        finally:
+            code.release()
+    return records
+
+
+# worker进程崩溃时，区间中所有合约都记录为error
+def _failed_range(start: int, stop: int, ex: BaseException) -> list[dict]:
+    return _failed_batch([(i, None, None) for i in range(start, stop)], ex)
+
+
+def stream_analysis(
+    path: str,
+    *,
+    workers: int | None = None,
+    chunk_size: int = 64,
+    timeout: float = 10.0,
+    gas_limit: int = int(1e4),
+    max_steps: int | None = None,
+    max_memory: int | None = None,
+) -> Iterator[dict]:
+    with Corpus(path) as corpus:
+        count = len(corpus)
+    workers = workers or os.cpu_count() or 1
+    max_inflight = workers * 2
+    ranges = ((start, min(start + chunk_size, count)) for start in range(0, count, chunk_size))
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    # 按照提交的顺序保存正在执行的区间，结果按照索引的顺序返回
+    inflight: list[tuple[Future, tuple[int, int]]] = []
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(inflight) < max_inflight:
+                r = next(ranges, None)
+                if r is None:
+                    exhausted = True
+                    break
+                try:
+                    fut = executor.submit(_analyze_range, path, *r, timeout, gas_limit, max_steps, max_memory)
+                except BrokenProcessPool:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+                    fut = executor.submit(_analyze_range, path, *r, timeout, gas_limit, max_steps, max_memory)
+                inflight.append((fut, r))
+            if len(inflight) == 0:
+                break
+            fut, r = inflight.pop(0)
+            try:
+                records = fut.result()
+            except BrokenProcessPool as ex:
+                records = _failed_range(*r, ex)
+            yield from records
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 返回写入的合约记录数
+def write_records(records: Iterable[dict], path: str) -> int:
+    n = 0
+    with open(path, 'wb') as f:
+        f.write(RESULTS_MAGIC)
+        for record in records:
+            error = (record['error'] or '').encode()
+            f.write(_RECORD.pack(record['index'], STATUSES.index(record['status']), record['elapsed'], len(record['functions']), len(error)))
+            f.write(error)
+            for selector, r in record['functions'].items():
+                arguments = r['arguments'].encode()
+                func_error = (r['error'] or '').encode()
+                f.write(_FUNCTION.pack(bytes.fromhex(selector), REASONS.index(r['reason']), len(arguments), len(func_error)))
+                f.write(arguments)
+                f.write(func_error)
+            n += 1
+    return n
+
+
+# 逐条返回和bulk.py相同结构的记录，空的error读出来是None
+def read_records(path: str) -> Iterator[dict]:
+    with open(path, 'rb') as f:
+        if f.read(len(RESULTS_MAGIC)) != RESULTS_MAGIC:
+            raise ValueError(f'{path}: not a results file')
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            index, status, elapsed, count, size = _RECORD.unpack(head)
+            record = {'index': index, 'status': STATUSES[status], 'error': f.read(size).decode() or None, 'elapsed': elapsed, 'functions': {}}
+            for _ in range(count):
+                selector, reason, size, error_size = _FUNCTION.unpack(f.read(_FUNCTION.size))
+                arguments = f.read(size).decode()
+                error = f.read(error_size).decode() or None
+                record['functions'][selector.hex()] = {'arguments': arguments, 'reason': REASONS[reason], 'error': error}
+            yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build, analyze and dump memory-mapped contract corpora')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help='convert a hex dump (same format as bulk.py) into a corpus file')
+    p.add_argument('input', help="'-' for stdin")
+    p.add_argument('output')
+    p = sub.add_parser('analyze', help='stream function_arguments results for every contract in a corpus')
+    p.add_argument('corpus')
+    p.add_argument('output')
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--chunk-size', type=int, default=64)
+    p.add_argument('--timeout', type=float, default=10.0, help='seconds per contract, 0 to disable')
+    p.add_argument('--gas-limit', type=int, default=int(1e4))
+    p.add_argument('--max-steps', type=int, default=None, help='steps per contract')
+    p.add_argument('--max-memory', type=int, default=None, help='memory expansion ceiling in bytes')
+    p = sub.add_parser('dump', help='print a results file as jsonl')
+    p.add_argument('results')
+    p.add_argument('--corpus', help='also print the contract sha256')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        added, unique = build_corpus(read_contracts(args.input), args.output)
+        print(f'{added} contracts, {unique} unique', file=sys.stderr)
+    elif args.command == 'analyze':
+        records = stream_analysis(
+            args.corpus,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            timeout=args.timeout,
+            gas_limit=args.gas_limit,
+            max_steps=args.max_steps,
+            max_memory=args.max_memory,
+        )
+        print(f'{write_records(records, args.output)} records', file=sys.stderr)
+    else:
+        corpus = Corpus(args.corpus) if args.corpus is not None else None
+        try:
+            for record in read_records(args.results):
+                if corpus is not None:
+                    record['contract'] = corpus.digest(record['index']).hex()
+                print(json.dumps(record))
+        finally:
+            if corpus is not None:
+                corpus.close()
+
+
+if __name__ == '__main__':
+    main()
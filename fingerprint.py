@@ -0,0 +1,139 @@
+# 描述：和编译元数据无关的字节码指纹，让只有元数据或者immutable不同的合约共享同一份分析结果
+'''大量已部署的合约只有末尾的solc CBOR元数据不同(源码路径、注释、编译器设置的变化都会改变ipfs哈希)，或者只有构造函数写入的immutable不同，按照sha256(code)缓存时它们互相不能命中
+   Fingerprinter.canonical(code)的流程：
+   step1：去掉末尾的CBOR元数据：最后2个字节是元数据的长度L，code[-2 - L]是CBOR map的头(0xa1 ~ 0xa5)，并且元数据中包含ipfs/bzzr0/bzzr1/solc/experimental中的一个键
+   step2：mask_immutables=True时，把看起来不是跳转目的地、偏移量、掩码或者选择器的PUSH32的数据替换为0，solc总是用PUSH32读取immutable；以下的值会被保留：
+     合法的JUMPDEST(跳转目的地)，小于2**32的值(偏移量、长度、选择器)，低位或者高位连续的0xff(AND屏蔽用的掩码)，
+     最低或者最高4个字节是dispatcher中的函数选择器的值
+     替换只改变PUSH的数据，不改变指令的边界，所以JUMPDEST和控制流图都不会变化
+   step3：fingerprint(code)返回sha256(canonical(code))，同时在stats中统计去重的比例
+   mask_immutables是启发式的：一个immutable的值恰好影响了参数推断时，共享的结果可能来自另一个immutable的值，所以默认不开启
+     只用于命令行估计去重比例，cache.ResultCache拒绝使用mask_immutables=True的Fingerprinter计算键
+   命令行用法：python fingerprint.py contracts.txt --mask-immutables，输出去重比例，用来估计缓存的大小
+'''
+import argparse
+import hashlib
+import json
+
+from arguments import to_bytes
+from bulk import read_contracts
+from VM import DecodedCode, Op
+
+# solc/vyper写入元数据的CBOR map中可能出现的键
+METADATA_KEYS = (b'ipfs', b'bzzr0', b'bzzr1', b'solc', b'experimental')
+
+E256M1 = 2**256 - 1
+
+
+# 没有元数据时返回code本身
+def strip_metadata(code: bytes) -> bytes:
+    if len(code) < 2:
+        return code
+    size = int.from_bytes(code[-2:], 'big')
+    start = len(code) - 2 - size
+    if size == 0 or start < 0 or not (0xa1 <= code[start] <= 0xa5):
+        return code
+    trailer = code[start:-2]
+    if not any(key in trailer for key in METADATA_KEYS):
+        return code
+    return code[:start]
+
+
+def _is_mask(v: int) -> bool:
+    inv = E256M1 ^ v
+    return v & (v + 1) == 0 or inv & (inv + 1) == 0
+
+
+class FingerprintStats:
+    __slots__ = ('contracts', 'stripped', 'masked', '_exact', '_canonical')
+
+    def __init__(self):
+        self.contracts = 0
+        self.stripped = 0 # 去掉了元数据的合约数量
+        self.masked = 0 # 被替换为0的PUSH32的数量
+        # 只保存sha256的摘要，分析几百万个合约时也只占几十MB
+        self._exact: set[bytes] = set()
+        self._canonical: set[bytes] = set()
+
+    def __repr__(self):
+        return f'FingerprintStats({self.snapshot()})'
+
+    def snapshot(self) -> dict:
+        n = self.contracts
+        return {
+            'contracts': n,
+            'unique_exact': len(self._exact),
+            'unique_canonical': len(self._canonical),
+            # 1 - 不同的键的数量 / 合约数量，也就是缓存足够大时的命中率上限
+            'dedup_ratio_exact': 1 - len(self._exact) / n if n > 0 else 0.0,
+            'dedup_ratio_canonical': 1 - len(self._canonical) / n if n > 0 else 0.0,
+            'stripped': self.stripped,
+            'masked': self.masked,
+        }
+## FingerprintStats类：比较按照原始字节码和按照规范化的字节码去重的效果
+
+
+class Fingerprinter:
+    def __init__(self, *, mask_immutables: bool = False):
+        self.mask_immutables = mask_immutables
+        self.stats = FingerprintStats()
+
+    # 不更新stats，ResultCache每次查询都会调用
+    def canonical(self, code: bytes) -> bytes:
+        return self._canonical(code)[0]
+
+    # 返回(规范化的字节码, 被替换为0的PUSH32的数量)
+    def _canonical(self, code: bytes) -> tuple[bytes, int]:
+        stripped = strip_metadata(code)
+        if self.mask_immutables:
+            return self._mask(stripped)
+        return stripped, 0
+
+    # 直接创建DecodedCode，不放入decode_code的缓存：去掉元数据之后的字节码不会被执行，放入缓存只会挤掉真正要分析的合约
+    def _mask(self, code: bytes) -> tuple[bytes, int]:
+        decoded = DecodedCode(code)
+        selectors = set(int.from_bytes(s, 'big') for s in decoded.cfg.entries)
+        out = None
+        masked = 0
+        # 按照指令遍历，PUSH数据中的0x7f不会被当作PUSH32
+        pc = 0
+        while pc < len(code):
+            if decoded.ops[pc] == Op.PUSH32:
+                v = decoded.imm[pc]
+                if not (v < 2**32 or _is_mask(v) or decoded.is_jumpdest(v) or (v & 0xffffffff) in selectors or (v >> 224) in selectors):
+                    if out is None:
+                        out = bytearray(code)
+                    end = min(pc + 33, len(code))
+                    out[pc + 1 : end] = bytes(end - pc - 1)
+                    masked += 1
+            pc = decoded.next_pc[pc]
+        return (code if out is None else bytes(out)), masked
+
+    # 规范化的字节码的sha256，同时更新stats，每个合约调用一次
+    def fingerprint(self, code: bytes) -> str:
+        canonical, masked = self._canonical(code)
+        digest = hashlib.sha256(canonical).digest()
+        self.stats.contracts += 1
+        self.stats.masked += masked
+        if len(canonical) != len(code):
+            self.stats.stripped += 1
+        self.stats._exact.add(hashlib.sha256(code).digest() if canonical is not code else digest)
+        self.stats._canonical.add(digest)
+        return digest.hex()
+## Fingerprinter类：cache.ResultCache(fingerprinter=Fingerprinter())用canonical(code)代替code计算缓存的键，stats只统计fingerprint()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report how many contracts share a metadata-insensitive fingerprint')
+    parser.add_argument('input', help="file with one hex runtime code per line (same format as bulk.py), '-' for stdin")
+    parser.add_argument('--mask-immutables', action='store_true', help='also mask PUSH32 immediates that look irrelevant to argument inference (heuristic)')
+    args = parser.parse_args()
+
+    fp = Fingerprinter(mask_immutables=args.mask_immutables)
+    for code, _ in read_contracts(args.input):
+        fp.fingerprint(to_bytes(code))
+    print(json.dumps(fp.stats.snapshot(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# 描述：一次分析的资源上限，防止恶意构造的字节码卡住worker
+'''gas_limit只限制了_exec_opcode返回的粗略的gas，不限制内存，也不限制执行时间
+   Governor的用法：
+   step1：governor = Governor(max_steps=100000, timeout=1.0, max_memory=1 << 20)
+   step2：function_arguments(code, selector, governor=governor)，function_arguments_many/function_arguments_all/function_arguments_results/function_arguments_explore同理
+   step3：同一次分析中fork出来的所有vm共享同一个governor，所以步数和截止时间是整次分析的上限，而不是每个选择器的上限
+   step4：超出上限时Vm抛出ResourceLimitError的子类，function_arguments停止执行并返回已经推断出的参数类型，ArgumentsResult.reason为：
+     Termination.STEP_LIMIT：执行的步数超过max_steps
+     Termination.DEADLINE：超过了截止时间(time.monotonic())
+     Termination.MEMORY_LIMIT：MSTORE/CALLDATACOPY写入的位置超过max_memory
+   步数和截止时间一旦超出，之后的每一步都会立刻停止；内存的上限只停止超出上限的那一条路径
+'''
+import time
+
+from VM import DeadlineError, StepLimitError
+
+
+class Governor:
+    # 每执行这么多步才读取一次时钟
+    CLOCK_INTERVAL = 1024
+
+    def __init__(self, *, max_steps: int | None = None, timeout: float | None = None, max_memory: int | None = None):
+        self.max_steps = max_steps
+        self.max_memory = max_memory
+        # 截止时间从创建governor时开始计算
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.steps = 0
+        self.reason: str | None = None # 第一次超出步数或者截止时间时记录停止原因
+
+    def check(self):
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.reason = StepLimitError.reason
+            raise StepLimitError(f'step limit exceeded: {self.max_steps}')
+        if self.deadline is not None and (self.reason == DeadlineError.reason or self.steps % self.CLOCK_INTERVAL == 0 and time.monotonic() > self.deadline):
+            self.reason = DeadlineError.reason
+            raise DeadlineError(f'deadline exceeded after {self.steps} steps')
+
+    # 一次记入n步(arguments.py中复用子程序的摘要时)，会超出max_steps时不记入并返回False，由调用者逐步执行到超出的那一步
+    def advance(self, n: int) -> bool:
+        if self.max_steps is not None and self.steps + n > self.max_steps:
+            return False
+        before = self.steps
+        self.steps += n
+        if self.deadline is not None and (self.reason == DeadlineError.reason or self.steps // self.CLOCK_INTERVAL > before // self.CLOCK_INTERVAL and time.monotonic() > self.deadline):
+            self.reason = DeadlineError.reason
+            raise DeadlineError(f'deadline exceeded after {self.steps} steps')
+        return True
+## Governor类：Vm每执行一步之前调用check()，没有传入governor的vm不会执行任何检查
@@ -0,0 +1,197 @@
+# 描述：function_arguments的吞吐量基准测试和回归测试
+'''语料库benchmarks/corpus.jsonl中每一行是一个合约：
+     {'name': 名称, 'code': 十六进制的runtime code, 'functions': {选择器: 期望的function_arguments结果},
+      'explore': {选择器: 期望的function_arguments_explore结果}(可选，只列出和functions不同的选择器)}
+   benchmark.py使用同一个语料库
+   synthetic/开头的合约是手工汇编的最小dispatcher + 函数体，每个合约覆盖arguments.py中的一个类型分支：
+     静态的uint/int/address/bytesN/bool，bytes，uint256[](SHL和MUL两种写法)，元素为动态Arg的T[]，以及SIGNEXTEND和BYTE的分支
+   web3/开头的合约是solc 0.8.24编译的真实合约，期望结果是当前版本的分析结果
+   regression.py的运行流程：
+   step1：对每一个(合约, 选择器)检查所有的入口，结果和期望不一致时记录为失败(同时也是预热)：
+     function_arguments、function_arguments_many、function_arguments_all(只检查语料库中的选择器)、function_arguments_explore，fuse=False和fuse=True各一遍
+     function_arguments_probes使用两个全0的lane(b''和256个0字节)，不会分开，结果必须和function_arguments相同
+   step2：挂载MetricsCollector执行一遍，统计总步数
+   step3：不挂载tracer执行rounds遍，记录每个选择器的耗时，计算selectors/sec、steps/sec以及p50/p99延迟
+   step4：使用tracemalloc执行一遍，记录峰值内存
+   step5：如果给出了--baseline，吞吐量比基线下降超过--max-regression时失败
+   --fuse时使用Vm的融合指令(superinstruction)执行，步数仍然按照没有融合的指令计算
+   用法：python regression.py --rounds 20 --save-baseline baseline.json
+        python regression.py --rounds 20 --baseline baseline.json --max-regression 0.1
+   有任何失败时以状态码1退出
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from arguments import (
+    function_arguments,
+    function_arguments_all,
+    function_arguments_explore,
+    function_arguments_many,
+    function_arguments_probes,
+    to_bytes,
+)
+from tracing import MetricsCollector
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'corpus.jsonl')
+
+# 和基线比较的吞吐量指标，越大越好
+THROUGHPUT_METRICS = ('selectors_per_sec', 'steps_per_sec')
+
+
+class SuiteEntry:
+    __slots__ = ('name', 'code', 'functions', 'explore')
+
+    def __init__(self, name: str, code: bytes, functions: dict[str, str], explore: dict[str, str] | None = None):
+        self.name = name
+        self.code = code
+        self.functions = functions # 选择器 -> 期望的结果
+        self.explore = explore or {} # 选择器 -> 和functions不同的探索模式的期望结果
+## SuiteEntry类：语料库中的一个合约
+
+
+def load_suite(path: str = DEFAULT_CORPUS) -> list[SuiteEntry]:
+    suite = []
+    with open(path) as f:
+        for line in f:
+            if line.strip() == '':
+                continue
+            obj = json.loads(line)
+            suite.append(SuiteEntry(obj['name'], to_bytes(obj['code']), obj['functions'], obj.get('explore')))
+    return suite
+
+
+# 两个相同的全0的lane，LockstepVm不会分开，结果必须和function_arguments相同
+_PROBES = [b'', bytes(256)]
+
+
+def check_results(suite: list[SuiteEntry], gas_limit: int) -> list[str]:
+    failures = []
+
+    def check(entry: SuiteEntry, api: str, selector: str, got: str | None, expected: str):
+        if got != expected:
+            failures.append(f'{entry.name} {selector} {api}: got {got!r}, expected {expected!r}')
+
+    for entry in suite:
+        selectors = list(entry.functions)
+        for fuse in (False, True):
+            suffix = ' fuse' if fuse else ''
+            many = function_arguments_many(entry.code, selectors, gas_limit, fuse=fuse)
+            discovered = function_arguments_all(entry.code, gas_limit, fuse=fuse)
+            for selector, expected in entry.functions.items():
+                check(entry, 'function_arguments' + suffix, selector, function_arguments(entry.code, selector, gas_limit, fuse=fuse), expected)
+                check(entry, 'function_arguments_many' + suffix, selector, many.get(selector), expected)
+                check(entry, 'function_arguments_all' + suffix, selector, discovered.get(selector), expected)
+                got = function_arguments_explore(entry.code, selector, gas_limit, fuse=fuse)
+                check(entry, 'function_arguments_explore' + suffix, selector, got, entry.explore.get(selector, expected))
+        for selector, expected in entry.functions.items():
+            check(entry, 'function_arguments_probes', selector, function_arguments_probes(entry.code, selector, _PROBES, gas_limit), expected)
+    return failures
+
+
+def count_steps(suite: list[SuiteEntry], gas_limit: int) -> int:
+    collector = MetricsCollector(per_selector=False)
+    for entry in suite:
+        for selector in entry.functions:
+            function_arguments(entry.code, selector, gas_limit, tracer=collector)
+    return collector.steps
+
+
+# 返回每一次function_arguments调用的耗时(秒)
+def measure_latency(suite: list[SuiteEntry], rounds: int, gas_limit: int, fuse: bool = False) -> list[float]:
+    samples = []
+    clock = time.perf_counter
+    for _ in range(rounds):
+        for entry in suite:
+            for selector in entry.functions:
+                start = clock()
+                function_arguments(entry.code, selector, gas_limit, fuse=fuse)
+                samples.append(clock() - start)
+    return samples
+
+
+def measure_peak_memory(suite: list[SuiteEntry], gas_limit: int, fuse: bool = False) -> int:
+    tracemalloc.start()
+    try:
+        for entry in suite:
+            for selector in entry.functions:
+                function_arguments(entry.code, selector, gas_limit, fuse=fuse)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def run_suite(suite: list[SuiteEntry], rounds: int = 10, gas_limit: int = int(1e4), fuse: bool = False) -> dict:
+    failures = check_results(suite, gas_limit)
+    steps = count_steps(suite, gas_limit)
+    samples = measure_latency(suite, rounds, gas_limit, fuse)
+    elapsed = sum(samples)
+    return {
+        'contracts': len(suite),
+        'selectors': sum(len(e.functions) for e in suite),
+        'rounds': rounds,
+        'selectors_per_sec': len(samples) / elapsed,
+        'steps_per_sec': steps * rounds / elapsed,
+        'p50_ms': percentile(samples, 50) * 1e3,
+        'p99_ms': percentile(samples, 99) * 1e3,
+        'peak_memory_bytes': measure_peak_memory(suite, gas_limit, fuse),
+        'failures': failures,
+    }
+
+
+# 吞吐量低于基线的(1 - max_regression)倍时失败
+def compare_baseline(report: dict, baseline: dict, max_regression: float, metrics: tuple[str, ...] = THROUGHPUT_METRICS) -> list[str]:
+    failures = []
+    for metric in metrics:
+        if metric not in baseline:
+            continue
+        floor = baseline[metric] * (1 - max_regression)
+        if report[metric] < floor:
+            failures.append(f'{metric} regressed: {report[metric]:,.0f} < {floor:,.0f} (baseline {baseline[metric]:,.0f}, max regression {max_regression:.0%})')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='function_arguments throughput benchmark and regression suite')
+    parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS, help='jsonl corpus with expected results')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--gas-limit', type=int, default=int(1e4))
+    parser.add_argument('--baseline', help='json report to compare throughput against')
+    parser.add_argument('--max-regression', type=float, default=0.1, help='allowed throughput drop relative to the baseline (0.1 = 10%%)')
+    parser.add_argument('--save-baseline', help='write this run as a json baseline')
+    parser.add_argument('--fuse', action='store_true', help='run with fused stack-op superinstructions')
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args()
+
+    report = run_suite(load_suite(args.corpus), args.rounds, args.gas_limit, args.fuse)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            report['failures'] += compare_baseline(report, json.load(f), args.max_regression)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"contracts: {report['contracts']}, selectors: {report['selectors']}, rounds: {report['rounds']}")
+        print(f"selectors/sec: {report['selectors_per_sec']:,.0f}, steps/sec: {report['steps_per_sec']:,.0f}")
+        print(f"latency p50: {report['p50_ms']:.3f}ms, p99: {report['p99_ms']:.3f}ms")
+        print(f"peak memory: {report['peak_memory_bytes'] / 1024:,.1f} KiB")
+        for failure in report['failures']:
+            print(f'FAIL {failure}')
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({k: report[k] for k in THROUGHPUT_METRICS}, f, indent=2)
+    sys.exit(1 if len(report['failures']) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+# 描述：常驻的本地分析服务，避免每个短生命周期的进程都要重新import、从空的缓存开始分析
+'''AnalysisServer的运行流程：
+   step1：启动时创建进程池，并给每个worker提交一个预热任务，worker在第一个请求到来之前就已经fork好并import了arguments
+   step2：前端使用asyncio，在Unix socket(或者TCP端口)上接收换行分隔的json请求，每一行是一个请求，每一个响应也是一行json
+   step3：已经在ResultCache中的选择器直接返回，其余的放入有界的队列；队列满了之后读取请求的协程会阻塞，客户端的写入也随之阻塞(背压)
+   step4：分发协程每次从队列中取出所有已经到达的请求，同一个合约(同一个gas_limit)的请求合并为一次function_arguments_results，交给进程池执行
+         同时执行的批次不超过workers * 2，进程池忙的时候队列会被填满
+   step5：结果写回ResultCache，再拆分给各个请求；ResultCache的读写(可能访问sqlite)都在一个单独的线程中执行，不会阻塞事件循环；被Governor停止的选择器(bulk.py中status为'partial')的结果不完整，不写入缓存
+   请求的格式：
+     {'id': 任意值, 'code': 十六进制的runtime code, 'selectors': [选择器, ...] 或者 null(找出所有选择器), 'gas_limit': 可选}
+     {'id': 任意值, 'op': 'stats'}
+   响应的格式：
+     {'id': 请求中的id, 'functions': {选择器: function_arguments的结果}} 或者 {'id': 请求中的id, 'error': 错误描述}
+     有选择器被Governor停止时还有'partial': {选择器: 停止原因(step_limit/deadline/memory_limit)}
+     stats的响应：{'id': 请求中的id, 'stats': {请求数、缓存命中数、批次数、队列长度、延迟的p50/p99等}}
+   用法：python server.py --socket /tmp/evmole.sock --workers 8 --cache-path cache.sqlite
+'''
+import argparse
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from arguments import _RESOURCE_REASONS, to_bytes
+from bulk import _init_worker, analyze_contract
+from cache import ResultCache
+from fingerprint import Fingerprinter
+
+
+def _warmup() -> int:
+    return os.getpid()
+
+
+# 在worker进程中执行，selectors为None时找出所有的选择器
+def _analyze(code: bytes, selectors: list[str] | None, timeout: float, gas_limit: int) -> dict:
+    return analyze_contract(0, code, selectors, timeout, gas_limit)
+
+
+class ServerStats:
+    def __init__(self, latency_window: int = 10000):
+        self.requests = 0
+        self.errors = 0
+        self.selectors = 0 # 请求中选择器的总数
+        self.cache_hits = 0
+        self.batches = 0 # 提交给进程池的批次数
+        self.batched_requests = 0 # 被合并进批次的请求数
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+
+    def snapshot(self, queue_depth: int, inflight: int) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            if len(ordered) == 0:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1e3
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'selectors': self.selectors,
+            'cache_hits': self.cache_hits,
+            'batches': self.batches,
+            'batched_requests': self.batched_requests,
+            'queue_depth': queue_depth,
+            'inflight_batches': inflight,
+            'latency_p50_ms': pct(50),
+            'latency_p99_ms': pct(99),
+        }
+## ServerStats类：stats请求返回的计数，延迟只保留最近latency_window个请求
+
+
+class AnalysisServer:
+    def __init__(
+        self,
+        *,
+        workers: int | None = None,
+        queue_size: int = 1024,
+        batch_window: float = 0.002,
+        timeout: float = 10.0,
+        gas_limit: int = int(1e4),
+        cache: ResultCache | None = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_window = batch_window # 等待同一个合约的其他请求的时间(秒)
+        self.timeout = timeout # 单个合约的超时时间，和bulk.py相同
+        self.gas_limit = gas_limit
+        self.cache = cache if cache is not None else ResultCache()
+        self.stats = ServerStats()
+        self._queue: asyncio.Queue | None = None
+        self._queue_size = queue_size
+        self._slots: asyncio.Semaphore | None = None
+        self._inflight = 0
+        self._executor: ProcessPoolExecutor | None = None
+        # ResultCache不是线程安全的，所有的读写都放在这一个线程中依次执行
+        self._cache_executor: ThreadPoolExecutor | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._slots = asyncio.Semaphore(self.workers * 2)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self._cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-cache')
+        await self._warm()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def _warm(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warmup) for _ in range(self.workers)))
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._cache_executor is not None:
+            self._cache_executor.shutdown(wait=False, cancel_futures=True)
+
+    # 返回每个选择器的function_arguments结果，选择器统一为不带0x的小写十六进制字符串
+    async def analyze(self, code: bytes | str, selectors: list[bytes | str] | None, gas_limit: int | None = None) -> dict[str, str]:
+        return (await self.analyze_partial(code, selectors, gas_limit))[0]
+
+    # 和analyze相同，另外返回被Governor停止的选择器 -> 停止原因，这些选择器的结果可能不完整
+    async def analyze_partial(
+        self, code: bytes | str, selectors: list[bytes | str] | None, gas_limit: int | None = None
+    ) -> tuple[dict[str, str], dict[str, str]]:
+        start = time.perf_counter()
+        self.stats.requests += 1
+        try:
+            return await self._analyze(to_bytes(code), selectors, gas_limit or self.gas_limit)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.latencies.append(time.perf_counter() - start)
+
+    async def _analyze(self, code: bytes, selectors: list[bytes | str] | None, gas_limit: int) -> tuple[dict[str, str], dict[str, str]]:
+        ret: dict[str, str] = {}
+        missing = None
+        if selectors is not None:
+            missing = []
+            wanted = list(dict.fromkeys(to_bytes(s) for s in selectors))
+            cached = await asyncio.get_running_loop().run_in_executor(self._cache_executor, self._cache_get_many, code, wanted, gas_limit)
+            for s, val in zip(wanted, cached):
+                self.stats.selectors += 1
+                if val is None:
+                    missing.append(s.hex())
+                else:
+                    self.stats.cache_hits += 1
+                    ret[s.hex()] = val
+            if len(missing) == 0:
+                return ret, {}
+
+        fut = asyncio.get_running_loop().create_future()
+        # 队列满了之后在这里等待
+        await self._queue.put((code, missing, gas_limit, fut))
+        functions, partial = await fut
+        ret.update(functions)
+        return ret, partial
+
+    # 在缓存线程中执行
+    def _cache_get_many(self, code: bytes, selectors: list[bytes], gas_limit: int) -> list[str | None]:
+        return [self.cache.get(code, s, gas_limit) for s in selectors]
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                first = await self._queue.get()
+            except BaseException:
+                self._slots.release()
+                raise
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            items = [first]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            # 同一个合约的请求合并为一个批次，selectors为None的请求单独执行
+            groups: dict[tuple[bytes, int], list] = {}
+            for item in items:
+                code, selectors, gas_limit, _ = item
+                groups.setdefault((code, gas_limit) if selectors is not None else (code, gas_limit, id(item)), []).append(item)
+            tasks = list(groups.values())
+            # 第一个批次使用已经获取的名额，其余的批次各自再获取一个
+            for i, group in enumerate(tasks):
+                if i > 0:
+                    await self._slots.acquire()
+                asyncio.create_task(self._run_batch(group))
+
+    async def _run_batch(self, group: list):
+        code, _, gas_limit, _ = group[0]
+        selectors = None if group[0][1] is None else list(dict.fromkeys(s for item in group for s in item[1]))
+        self.stats.batches += 1
+        self.stats.batched_requests += len(group)
+        self._inflight += 1
+        try:
+            record = await self._submit(code, selectors, gas_limit)
+            if record['status'] not in ('ok', 'partial'):
+                raise RuntimeError(record['error'])
+            results = {s: f['arguments'] for s, f in record['functions'].items()}
+            partial = {s: f['reason'] for s, f in record['functions'].items() if f['reason'] in _RESOURCE_REASONS}
+            complete = {bytes.fromhex(s): v for s, v in results.items() if s not in partial}
+            await asyncio.get_running_loop().run_in_executor(self._cache_executor, self.cache.put_many, code, complete, gas_limit)
+            for _, wanted, _, fut in group:
+                if not fut.done():
+                    if wanted is None:
+                        fut.set_result((results, partial))
+                    else:
+                        fut.set_result(({s: results[s] for s in wanted}, {s: partial[s] for s in wanted if s in partial}))
+        # CancelledError不是Exception，同样要让等待这一批的请求得到错误，否则客户端会一直等待
+        except BaseException as ex:
+            error = ex if isinstance(ex, Exception) else RuntimeError(f'batch cancelled: {ex.__class__.__name__}')
+            for _, _, _, fut in group:
+                if not fut.done():
+                    fut.set_exception(error)
+            if not isinstance(ex, Exception):
+                raise
+        finally:
+            self._inflight -= 1
+            self._slots.release()
+
+    async def _submit(self, code: bytes, selectors: list[str] | None, gas_limit: int) -> dict:
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            return await loop.run_in_executor(executor, _analyze, code, selectors, self.timeout, gas_limit)
+        except BrokenProcessPool:
+            # worker进程崩溃之后重新创建进程池，这一批返回错误
+            # 同一个进程池中的其他批次也会收到BrokenProcessPool，只有第一个替换进程池，不能关闭其他批次已经创建的新进程池
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            raise
+
+    def stats_snapshot(self) -> dict:
+        return self.stats.snapshot(self._queue.qsize() if self._queue is not None else 0, self._inflight)
+
+    # 处理一个连接：每读到一行就创建一个任务，响应按照完成的顺序写回，客户端通过id对应请求
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        pending: set[asyncio.Task] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                if line.strip() == b'':
+                    continue
+                task = asyncio.create_task(self._handle_line(line, writer, lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                # 每个连接同时处理的请求也有上限，超过之后不再读取，背压传递到客户端
+                while len(pending) >= self._queue_size:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if len(pending) > 0:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+    async def _handle_line(self, line: bytes, writer: asyncio.StreamWriter, lock: asyncio.Lock):
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get('id')
+            if req.get('op', 'analyze') == 'stats':
+                resp = {'id': req_id, 'stats': self.stats_snapshot()}
+            else:
+                functions, partial = await self.analyze_partial(req['code'], req.get('selectors'), req.get('gas_limit'))
+                resp = {'id': req_id, 'functions': functions}
+                if len(partial) > 0:
+                    resp['partial'] = partial
+        except Exception as ex:
+            resp = {'id': req_id, 'error': f'{ex.__class__.__name__}: {ex}'}
+        async with lock:
+            writer.write(json.dumps(resp).encode() + b'\n')
+            await writer.drain()
+## AnalysisServer类：进程池、请求队列以及共享的ResultCache，可以通过analyze()直接在asyncio程序中使用，也可以通过serve()提供socket服务
+
+
+async def serve(server: AnalysisServer, *, path: str | None = None, host: str = '127.0.0.1', port: int | None = None):
+    await server.start()
+    try:
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            listener = await asyncio.start_unix_server(server.handle_connection, path=path)
+        else:
+            listener = await asyncio.start_server(server.handle_connection, host=host, port=port)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+# 给短生命周期的进程使用的同步客户端，发送一个请求并等待它的响应
+def request(req: dict, *, path: str | None = None, host: str = '127.0.0.1', port: int | None = None, timeout: float | None = 60.0) -> dict:
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = path
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, port)
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        with sock.makefile('rwb') as f:
+            f.write(json.dumps(req).encode() + b'\n')
+            f.flush()
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local function_arguments server (newline-delimited json)')
+    parser.add_argument('--socket', help='unix socket path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='tcp port, used when --socket is not given')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--batch-window', type=float, default=0.002, help='seconds to wait for more requests for the same contract')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per contract, 0 to disable')
+    parser.add_argument('--gas-limit', type=int, default=int(1e4))
+    parser.add_argument('--cache-size', type=int, default=65536)
+    parser.add_argument('--cache-path', help='sqlite file for the shared result cache')
+    parser.add_argument('--fingerprint', action='store_true', help='key the cache on bytecode without the CBOR metadata trailer')
+    args = parser.parse_args()
+    if args.socket is None and args.port is None:
+        parser.error('one of --socket or --port is required')
+
+    server = AnalysisServer(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        batch_window=args.batch_window,
+        timeout=args.timeout,
+        gas_limit=args.gas_limit,
+        cache=ResultCache(args.cache_size, args.cache_path, fingerprinter=Fingerprinter() if args.fingerprint else None),
+    )
+    try:
+        asyncio.run(serve(server, path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
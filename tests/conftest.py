@@ -0,0 +1,20 @@
+# 仓库的模块都在根目录下(VM.py、arguments.py等)，测试直接从根目录导入
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from regression import DEFAULT_CORPUS, load_suite
+
+
+# 按照名字查找benchmarks/corpus.jsonl中的合约，例如corpus_entry('web3/address_reflector_contract')
+@pytest.fixture(scope='session')
+def corpus_entry():
+    entries = {e.name: e for e in load_suite(DEFAULT_CORPUS)}
+
+    def lookup(name: str = 'web3/emitter_contract'):
+        return entries[name]
+
+    return lookup
@@ -0,0 +1,57 @@
+# bulk.py的测试
+import multiprocessing
+import os
+
+import pytest
+
+import bulk
+from arguments import function_arguments_results
+from bulk import analyze_contract, analyze_many
+from regression import DEFAULT_CORPUS, load_suite
+
+
+def _expected(entry) -> dict:
+    return {s: r.arguments for s, r in function_arguments_results(entry.code, list(entry.functions)).items()}
+
+
+def test_records_equal_function_arguments():
+    suite = load_suite(DEFAULT_CORPUS)
+    records = list(analyze_many(((e.code, list(e.functions)) for e in suite), workers=2, batch_size=4))
+    assert [r['index'] for r in records] == list(range(len(suite)))
+    for entry, record in zip(suite, records):
+        assert record['status'] == 'ok', (entry.name, record['error'])
+        assert {s: f['arguments'] for s, f in record['functions'].items()} == _expected(entry), entry.name
+
+
+def test_unordered_returns_every_contract():
+    suite = load_suite(DEFAULT_CORPUS)[:12]
+    records = list(analyze_many(((e.code, None) for e in suite), workers=2, batch_size=2, ordered=False))
+    assert sorted(r['index'] for r in records) == list(range(len(suite)))
+
+
+def test_status_of_a_single_contract(corpus_entry):
+    entry = corpus_entry('web3/emitter_contract')
+    partial = analyze_contract(0, entry.code, list(entry.functions), 0, int(1e4), max_steps=50)
+    assert partial['status'] == 'partial'
+    assert partial['error'] == 'stopped by governor: step_limit'
+    error = analyze_contract(1, 'zz', None, 0, int(1e4))
+    assert error['status'] == 'error' and error['functions'] == {}
+
+
+def _crash_on_first(batch, *args):
+    if batch[0][0] == 0:
+        os._exit(1)
+    return bulk._analyze_batch_orig(batch, *args)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='workers must inherit the patched _analyze_batch')
+def test_worker_crash_is_recorded_and_recovered(monkeypatch):
+    # worker进程是fork出来的，会看到替换之后的_analyze_batch
+    monkeypatch.setattr(bulk, '_analyze_batch_orig', bulk._analyze_batch, raising=False)
+    monkeypatch.setattr(bulk, '_analyze_batch', _crash_on_first)
+    suite = load_suite(DEFAULT_CORPUS)[:8]
+    records = list(analyze_many(((e.code, list(e.functions)) for e in suite), workers=1, batch_size=2))
+    assert [r['index'] for r in records] == list(range(len(suite)))
+    assert records[0]['status'] == 'error' and 'BrokenProcessPool' in records[0]['error']
+    # 进程池重新创建之后，后面提交的批次正常执行
+    assert records[-1]['status'] == 'ok'
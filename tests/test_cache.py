@@ -0,0 +1,79 @@
+# cache.py的测试
+import pytest
+
+from arguments import function_arguments, function_arguments_many
+from cache import ANALYZER_VERSION, LRUCache, ResultCache, SqliteStore, cache_key
+from fingerprint import Fingerprinter
+
+
+# solc的CBOR元数据：{'solc': 0x000800 + version}，最后2个字节是长度
+def _with_metadata(code: bytes, version: int) -> bytes:
+    trailer = b'\xa1\x64solc\x43\x00\x08' + bytes([version])
+    return code + trailer + len(trailer).to_bytes(2, 'big')
+
+
+def test_results_equal_function_arguments(corpus_entry):
+    entry = corpus_entry()
+    cache = ResultCache()
+    selectors = list(entry.functions)
+    assert cache.function_arguments_many(entry.code, selectors) == function_arguments_many(entry.code, selectors)
+    for s in selectors:
+        assert cache.function_arguments(entry.code, s) == function_arguments(entry.code, s)
+    assert cache.memory.stats.hits == len(selectors)
+    assert cache.memory.stats.misses == len(selectors)
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.put('a', '1')
+    lru.put('b', '2')
+    assert lru.get('a') == '1'
+    lru.put('c', '3')
+    assert lru.get('b') is None
+    assert lru.get('a') == '1' and lru.get('c') == '3'
+    assert lru.stats.evictions == 1
+
+
+def test_sqlite_is_shared_and_salted(tmp_path, corpus_entry):
+    entry = corpus_entry()
+    path = str(tmp_path / 'cache.sqlite')
+    selectors = list(entry.functions)
+    first = ResultCache(path=path)
+    expected = first.function_arguments_many(entry.code, selectors)
+    first.disk.close()
+
+    # 新的进程(这里是新的ResultCache)从磁盘读取，不重新计算
+    second = ResultCache(path=path)
+    assert second.function_arguments_many(entry.code, selectors) == expected
+    assert second.disk.stats.hits == len(selectors)
+    second.disk.close()
+
+    # 其他salt使用不同的键，打开时不删除这个salt的条目，只有purge()才会删除
+    key = cache_key(entry.code, bytes.fromhex(selectors[0]), int(1e4))
+    other = SqliteStore(path, salt='other')
+    assert other.get(cache_key(entry.code, bytes.fromhex(selectors[0]), int(1e4), salt='other')) is None
+    assert other.get(key) == expected[selectors[0]]
+    other.purge(ANALYZER_VERSION)
+    assert other.get(key) is None
+    other.close()
+
+
+def test_fingerprint_shares_entries_across_metadata(corpus_entry):
+    entry = corpus_entry('web3/address_reflector_contract')
+    code_a, code_b = _with_metadata(entry.code, 1), _with_metadata(entry.code, 2)
+    cache = ResultCache(fingerprinter=Fingerprinter())
+    selectors = list(entry.functions)
+    assert cache.function_arguments_many(code_a, selectors) == function_arguments_many(code_a, selectors)
+    assert cache.function_arguments_many(code_b, selectors) == function_arguments_many(code_b, selectors)
+    assert cache.memory.stats.hits == len(selectors)
+    # 没有fingerprinter时两个合约的键不同
+    plain = ResultCache()
+    plain.function_arguments_many(code_a, selectors)
+    plain.function_arguments_many(code_b, selectors)
+    assert plain.memory.stats.hits == 0
+
+
+def test_masked_fingerprints_are_not_cache_keys():
+    # 屏蔽immutable是启发式的，两个只有immutable不同的合约的参数可能不同
+    with pytest.raises(ValueError):
+        ResultCache(fingerprinter=Fingerprinter(mask_immutables=True))
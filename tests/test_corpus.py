@@ -0,0 +1,80 @@
+# corpus.py的测试
+import hashlib
+import multiprocessing
+import os
+
+import pytest
+
+import corpus
+from arguments import function_arguments, function_arguments_all
+from corpus import Corpus, build_corpus, read_records, stream_analysis, write_records
+from regression import DEFAULT_CORPUS, load_suite
+
+
+@pytest.fixture
+def corpus_path(tmp_path) -> str:
+    path = str(tmp_path / 'corpus.bin')
+    codes = [e.code for e in load_suite(DEFAULT_CORPUS)]
+    # 重复的字节码只写入一次
+    assert build_corpus(codes + codes[:3], path) == (len(codes) + 3, len(set(codes)))
+    return path
+
+
+def test_lookup_by_index_and_digest(corpus_path):
+    with Corpus(corpus_path) as c:
+        for e in load_suite(DEFAULT_CORPUS):
+            digest = hashlib.sha256(e.code).digest()
+            view = c.get(digest)
+            assert bytes(view) == e.code
+            assert c.digest(c.index_of(digest)) == digest
+            # 只读的memoryview可以直接分析，结果和bytes相同
+            for s in e.functions:
+                assert function_arguments(view, s) == function_arguments(e.code, s)
+            view.release()
+        assert c.index_of(b'\x00' * 32) is None
+
+
+def test_writable_memoryview(corpus_entry):
+    e = corpus_entry('web3/emitter_contract')
+    view = memoryview(bytearray(e.code))
+    for s, expected in e.functions.items():
+        assert function_arguments(view, s) == expected
+    assert function_arguments_all(view) == function_arguments_all(e.code)
+
+
+def test_stream_analysis_round_trip(corpus_path, tmp_path):
+    records = list(stream_analysis(corpus_path, workers=2, chunk_size=8))
+    with Corpus(corpus_path) as c:
+        assert [r['index'] for r in records] == list(range(len(c)))
+        for r in records:
+            code = c[r['index']]
+            assert r['status'] == 'ok'
+            assert {s: f['arguments'] for s, f in r['functions'].items()} == function_arguments_all(bytes(code))
+            code.release()
+    results = str(tmp_path / 'results.bin')
+    assert write_records(records, results) == len(records)
+    assert list(read_records(results)) == records
+
+
+def test_failed_contracts_are_kept(corpus_path):
+    records = list(stream_analysis(corpus_path, workers=1, chunk_size=16, max_steps=50))
+    assert {r['status'] for r in records} == {'ok', 'partial'}
+    assert all(r['error'] == 'stopped by governor: step_limit' for r in records if r['status'] == 'partial')
+
+
+def _crash_on_second(path, start, stop, *args):
+    if start == 8:
+        os._exit(1)
+    return corpus._analyze_range_orig(path, start, stop, *args)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='workers must inherit the patched _analyze_range')
+def test_worker_crash_is_recorded_and_recovered(corpus_path, monkeypatch):
+    monkeypatch.setattr(corpus, '_analyze_range_orig', corpus._analyze_range, raising=False)
+    monkeypatch.setattr(corpus, '_analyze_range', _crash_on_second)
+    records = list(stream_analysis(corpus_path, workers=1, chunk_size=8))
+    with Corpus(corpus_path) as c:
+        assert [r['index'] for r in records] == list(range(len(c)))
+    assert all(r['status'] == 'ok' for r in records[:8])
+    assert all(r['status'] == 'error' and 'BrokenProcessPool' in r['error'] for r in records[8:16])
+    assert records[-1]['status'] == 'ok'
@@ -0,0 +1,25 @@
+# decode_code(VM.py)中预先解码的指令和JUMPDEST位图的测试
+import arguments
+from arguments import Termination, function_arguments, function_arguments_results
+from VM import Op, decode_code
+
+# 函数0x10000000的函数体从0x15开始：PUSH1 0x19 JUMP; PUSH1 0x5b; PUSH1 4 CALLDATALOAD PUSH1 0xff AND STOP
+# 0x19处的0x5b是PUSH1的数据，不是JUMPDEST，按照原来逐字节的检查会跳过去并推断出uint8
+JUMP_INTO_PUSH_DATA = bytes.fromhex('60003560e01c80631000000014610014575f80fd5b' + '601956605b60043560ff1600')
+
+
+def test_push_data_is_not_a_jumpdest():
+    decoded = decode_code(JUMP_INTO_PUSH_DATA)
+    assert decoded.is_jumpdest(0x14)
+    assert decoded.ops[0x18] == Op.PUSH1
+    assert not decoded.is_jumpdest(0x19)
+    assert decoded.next_pc[0x18] == 0x1a
+
+
+def test_jump_into_push_data_is_rejected(monkeypatch):
+    # 控制流图中0x19不可达，JUMP之前就会因为解码结束而停止，关掉提前停止才能执行到JUMP
+    monkeypatch.setattr(arguments, '_decoding_done', lambda vm: False)
+    for fuse in (False, True):
+        r = function_arguments_results(JUMP_INTO_PUSH_DATA, ['10000000'], fuse=fuse)['10000000']
+        assert (r.arguments, r.reason) == ('', Termination.UNSUPPORTED_OP)
+        assert function_arguments(JUMP_INTO_PUSH_DATA, '10000000', fuse=fuse) == ''
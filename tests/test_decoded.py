@@ -0,0 +1,42 @@
+# 参数解码结束之后提前停止(Termination.DECODED)的测试
+import arguments
+from arguments import Termination, function_arguments_explore, function_arguments_results
+from governor import Governor
+from regression import DEFAULT_CORPUS, load_suite
+
+
+def _results(entry) -> dict:
+    return {s: (r.arguments, r.reason) for s, r in function_arguments_results(entry.code, list(entry.functions)).items()}
+
+
+def test_early_stop_does_not_change_arguments(monkeypatch):
+    suite = load_suite(DEFAULT_CORPUS)
+    early = {entry.name: _results(entry) for entry in suite}
+    monkeypatch.setattr(arguments, '_decoding_done', lambda vm: False)
+    full = {entry.name: _results(entry) for entry in suite}
+    stopped = 0
+    for entry in suite:
+        for s, (args, reason) in early[entry.name].items():
+            assert args == full[entry.name][s][0] == entry.functions[s], (entry.name, s)
+            stopped += reason == Termination.DECODED
+    assert stopped > 0
+
+
+def test_early_stop_saves_steps(monkeypatch, corpus_entry):
+    entry = corpus_entry('web3/emitter_contract')
+    early = Governor()
+    function_arguments_results(entry.code, list(entry.functions), governor=early)
+    monkeypatch.setattr(arguments, '_decoding_done', lambda vm: False)
+    full = Governor()
+    function_arguments_results(entry.code, list(entry.functions), governor=full)
+    assert early.steps < full.steps
+
+
+def test_no_early_stop_before_a_later_calldata_read(corpus_entry):
+    # 函数体先执行一个不涉及calldata的循环，此时栈中没有来源标记，但是循环之后还会读取calldata
+    # 默认模式在没有新信息的循环入口停止，只有探索模式会离开循环，执行到后面的读取
+    for name in ('synthetic/loop,uint8', 'synthetic/bytes-loop,uint8'):
+        entry = corpus_entry(name)
+        for s in entry.functions:
+            assert function_arguments_results(entry.code, [s])[s].reason == Termination.LOOP
+            assert function_arguments_explore(entry.code, s) == entry.explore[s]
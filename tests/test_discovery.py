@@ -0,0 +1,21 @@
+# function_arguments_all在dispatcher中fork的测试
+import time
+
+from arguments import function_arguments_all
+
+# PUSH1 0 CALLDATALOAD PUSH1 0xe0 SHR; L: DUP1 PUSH4 0x50000000 LT POP PUSH2 L JUMP
+# 每一轮循环都拿选择器和同一个常量比较，原来每一轮都会fork，fork出来的vm又会继续fork
+LT_LOOP = '60003560e01c5b806350000000105061000656'
+# 在GT的循环中二分查找，只有取反之后的分支才能到达0x10000000的函数体(uint8)
+GT_LOOP = '60003560e01c5b80635000000011610006578063100000001461002157610006565b60043560ff1600'
+
+
+def test_compare_in_loop_does_not_fork_forever():
+    start = time.monotonic()
+    assert function_arguments_all(LT_LOOP) == {}
+    assert time.monotonic() - start < 5
+
+
+def test_flipped_branch_is_still_explored():
+    assert function_arguments_all(GT_LOOP) == {'10000000': 'uint8'}
+    assert function_arguments_all(GT_LOOP, fuse=True) == {'10000000': 'uint8'}
@@ -0,0 +1,11 @@
+# function_arguments_explore的测试
+from arguments import function_arguments, function_arguments_explore
+
+# 函数0x10000000读取第一个参数，PUSH1 0; JUMPI永远不跳转，只有探索出来的分支会对这个参数执行BYTE
+BYTE_ON_UNTAKEN_BRANCH = '60003560e01c80631000000014610014575f80fd5b600435600061001f57005b60001a00'
+
+
+def test_fork_sees_the_tags_on_its_stack():
+    assert function_arguments(BYTE_ON_UNTAKEN_BRANCH, '10000000') == 'uint256'
+    assert function_arguments_explore(BYTE_ON_UNTAKEN_BRANCH, '10000000') == 'bytes32'
+    assert function_arguments_explore(BYTE_ON_UNTAKEN_BRANCH, '10000000', fuse=True) == 'bytes32'
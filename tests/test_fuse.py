@@ -0,0 +1,25 @@
+# fuse=True(VM.py中的_compile_run)的测试
+import VM
+from arguments import function_arguments, function_arguments_all, function_arguments_many
+from regression import DEFAULT_CORPUS, load_suite
+from VM import decode_code
+
+
+def test_fused_results_equal_unfused():
+    for entry in load_suite(DEFAULT_CORPUS):
+        selectors = list(entry.functions)
+        for s in selectors:
+            assert function_arguments(entry.code, s, fuse=True) == function_arguments(entry.code, s), (entry.name, s)
+        assert function_arguments_many(entry.code, selectors, fuse=True) == function_arguments_many(entry.code, selectors), entry.name
+        assert function_arguments_all(entry.code, fuse=True) == function_arguments_all(entry.code), entry.name
+
+
+def test_fused_factories_are_bounded(monkeypatch):
+    monkeypatch.setattr(VM, '_FUSED_FACTORIES_SIZE', 8)
+    monkeypatch.setattr(VM, '_fused_factories', {})
+    for entry in load_suite(DEFAULT_CORPUS):
+        # 清空DecodedCode中已经编译好的融合指令，每个合约都重新编译
+        decode_code(entry.code).fused.clear()
+        for s in entry.functions:
+            assert function_arguments(entry.code, s, fuse=True) == entry.functions[s], (entry.name, s)
+        assert len(VM._fused_factories) <= 8
@@ -0,0 +1,52 @@
+# governor.py的测试
+from arguments import Termination, function_arguments, function_arguments_many, function_arguments_results
+from governor import Governor
+from regression import DEFAULT_CORPUS, load_suite
+
+# 函数0x10000000先执行MSTORE(0x200000, 1)，再读取一个uint8参数
+MSTORE_FAR = '60003560e01c80631000000014610014575f80fd5b' + '60016220000052' + '60043560ff1600'
+
+
+def test_generous_limits_do_not_change_results():
+    for entry in load_suite(DEFAULT_CORPUS):
+        for s in entry.functions:
+            governor = Governor(max_steps=10**7, timeout=60, max_memory=1 << 30)
+            assert function_arguments(entry.code, s, governor=governor) == function_arguments(entry.code, s), (entry.name, s)
+
+
+def test_step_limit_is_shared_by_all_selectors(corpus_entry):
+    entry = corpus_entry()
+    selectors = list(entry.functions)
+    governor = Governor(max_steps=200)
+    results = function_arguments_results(entry.code, selectors, governor=governor)
+    assert governor.reason == Termination.STEP_LIMIT
+    # 超出之后每个还在执行的vm只会再调用一次check()
+    assert 200 < governor.steps <= 200 + len(selectors)
+    assert any(r.reason == Termination.STEP_LIMIT for r in results.values())
+    # 停止之后的选择器都会立刻停止，返回已经推断出的部分结果
+    assert function_arguments_many(entry.code, selectors, governor=governor) == {s: '' for s in selectors}
+    # function_arguments_all在dispatcher中停止时只返回已经找到的选择器
+    found = function_arguments_results(entry.code, None, governor=Governor(max_steps=50))
+    assert len(found) < len(selectors)
+    assert all(r.reason == Termination.STEP_LIMIT for r in found.values())
+
+
+def test_deadline(monkeypatch):
+    monkeypatch.setattr(Governor, 'CLOCK_INTERVAL', 1)
+    result = function_arguments_results(MSTORE_FAR, ['10000000'], governor=Governor(timeout=0))['10000000']
+    assert result.reason == Termination.DEADLINE
+
+
+def test_memory_limit_stops_only_the_path():
+    assert function_arguments(MSTORE_FAR, '10000000', governor=Governor(max_memory=1 << 22)) == 'uint8'
+    governor = Governor(max_memory=1 << 20)
+    result = function_arguments_results(MSTORE_FAR, ['10000000'], governor=governor)['10000000']
+    assert result.reason == Termination.MEMORY_LIMIT
+    assert governor.reason is None
+
+
+def test_advance():
+    governor = Governor(max_steps=10)
+    assert governor.advance(10)
+    assert not governor.advance(1)
+    assert governor.steps == 10
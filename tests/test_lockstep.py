@@ -0,0 +1,76 @@
+# function_arguments_probes和LockstepVm(VM.py)的测试
+from arguments import CallData, Termination, Vm, _format_args, _process_function, function_arguments, function_arguments_probes
+from governor import Governor
+from regression import DEFAULT_CORPUS, load_suite
+from VM import LaneDivergence, LockstepVm
+
+
+def _word(v: int) -> bytes:
+    return v.to_bytes(32, 'big')
+
+
+# 和regression.py/benchmark.py中的探测不同，这些探测会让数组长度和偏移量走不同的分支
+PROBES = [b'', _word(0x20) * 8, _word(0x40) + _word(0) * 2 + _word(3) + _word(1) * 8, bytes.fromhex('ff' * 32) * 8]
+
+# PUSH1 4 CALLDATALOAD PUSH2 0x0008 JUMPI STOP JUMPDEST STOP：第一个参数不为0时跳转到0x08
+BRANCH_ON_ARG = bytes.fromhex('60043561000857005b00')
+# 函数0x10000000：第一个参数不为0时跳转到0x1e，对这个参数执行BYTE
+BYTE_WHEN_NONZERO = '60003560e01c80631000000014610014575f80fd5b' + '6004358061001e57005b60001a00'
+
+
+def test_single_probe_equals_function_arguments():
+    for entry in load_suite(DEFAULT_CORPUS):
+        for s in entry.functions:
+            assert function_arguments_probes(entry.code, s) == function_arguments(entry.code, s), (entry.name, s)
+
+
+def test_lockstep_equals_merged_separate_runs():
+    # 第一个探测的结果优先，其余探测只补充没有出现或者还不知道类型的参数
+    for entry in load_suite(DEFAULT_CORPUS):
+        for s in entry.functions:
+            selector = bytes.fromhex(s)
+            merged: dict[int, str] = {}
+            for probe in PROBES:
+                path_args: dict[int, str] = {}
+                _process_function(Vm(code=entry.code, calldata=CallData(selector + probe)), selector, int(1e4), args=path_args)
+                for offset, t in path_args.items():
+                    if merged.get(offset, '') == '':
+                        merged[offset] = t
+            assert function_arguments_probes(entry.code, s, PROBES) == _format_args(merged), (entry.name, s)
+
+
+def test_lanes_split_at_a_divergent_jumpi():
+    selector = b'\x00' * 4
+    vm = LockstepVm(code=BRANCH_ON_ARG, lanes=[CallData(selector + _word(v)) for v in (0, 1, 2)])
+    groups = None
+    while groups is None:
+        try:
+            vm.step()
+        except LaneDivergence as ex:
+            groups = ex.groups
+    # JUMPI还没有执行，按照下一条指令分组
+    assert sorted(groups) == [[0], [1, 2]]
+    assert vm.pc == 6
+    children = vm.split(sorted(groups))
+    assert type(children[0]) is Vm and type(children[1]) is LockstepVm
+    assert children[1].lanes == vm.lanes[1:]
+    for child in children:
+        child.step()
+    assert [child.pc for child in children] == [7, 8]
+
+
+def test_later_groups_see_the_tags_on_their_stack():
+    # 只有第二个探测会跳转，分开之后的第二组栈中仍然是第一个参数的Arg
+    assert function_arguments(BYTE_WHEN_NONZERO, '10000000') == 'uint256'
+    assert function_arguments_probes(BYTE_WHEN_NONZERO, '10000000', [b'', _word(1)]) == 'bytes32'
+
+
+def test_governor_is_shared_by_all_lanes(corpus_entry):
+    entry = corpus_entry('web3/emitter_contract')
+    for s in entry.functions:
+        selector = bytes.fromhex(s)
+        governor = Governor(max_steps=20)
+        vm = LockstepVm(code=entry.code, lanes=[CallData(selector + p) for p in PROBES], governor=governor)
+        result = _process_function(vm, selector, int(1e4))
+        assert result.reason == Termination.STEP_LIMIT
+        assert governor.steps == 21
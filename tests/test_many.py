@@ -0,0 +1,20 @@
+# function_arguments_many(一次执行dispatcher推断多个选择器)的测试
+from arguments import function_arguments, function_arguments_many
+from regression import DEFAULT_CORPUS, load_suite
+
+# 语料库中没有出现的选择器，包括0和全1，dispatcher的比较对它们都不成立
+UNKNOWN = ['00000000', 'ffffffff', 'deadbeef']
+
+
+def test_many_equals_one_call_per_selector():
+    for entry in load_suite(DEFAULT_CORPUS):
+        selectors = list(entry.functions) + UNKNOWN
+        assert function_arguments_many(entry.code, selectors) == {s: function_arguments(entry.code, s) for s in selectors}, entry.name
+
+
+def test_selector_types_are_kept_as_keys(corpus_entry):
+    entry = corpus_entry()
+    selectors = [bytes.fromhex(s) for s in entry.functions] + [bytes.fromhex(UNKNOWN[2])]
+    result = function_arguments_many(entry.code, selectors)
+    assert list(result) == selectors
+    assert result[selectors[-1]] == ''
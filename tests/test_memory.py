@@ -0,0 +1,77 @@
+# Memory(VM.py)的写时复制快照和CALLDATACOPY复制的区间的测试
+import copy
+
+from arguments import function_arguments
+from VM import CallData, CallDataCopy, CallDataValue, Memory, Vm
+
+# 函数0x10000000的dispatcher，函数体从0x15开始
+PREFIX = '60003560e01c80631000000014610014575f80fd5b'
+
+
+# 函数体：CALLDATACOPY(0x20, 0x44, 0x20); MLOAD(offset); AND 0xff
+def _copy_then_load(offset: int) -> str:
+    return PREFIX + '6020604460203760' + f'{offset:02x}' + '5160ff1600'
+
+
+def test_aligned_mload_of_a_copy():
+    assert function_arguments(_copy_then_load(0x20), '10000000') == 'uint8'
+
+
+def test_mload_starting_before_a_copy_is_not_an_argument():
+    # 加载的值从0x10开始，只有后半部分来自复制的区间，不对应calldata中的任何位置(原来会被当作0x34处的参数)
+    assert function_arguments(_copy_then_load(0x10), '10000000') == ''
+
+
+def test_snapshot_keeps_the_state_at_the_copy():
+    parent = Memory()
+    tag = CallDataValue(1)
+    parent.store(0, b'\x01' * 32, tag)
+    snap = copy.copy(parent)
+    # 父对象之后的写入：覆盖已有的页、写入新的页、复制calldata，都不能出现在快照中
+    parent.store(0, b'\x02' * 32)
+    parent.store(0x5000, b'\x03' * 32)
+    parent.store_range(0x40, 0x20, CallDataCopy(0, 4, 4))
+    assert snap.load(0) == (int.from_bytes(b'\x01' * 32, 'big'), {tag})
+    assert snap.load(0x5000) == (0, set())
+    assert snap.load(0x40) == (0, set())
+    # 快照自己的写入也不会影响父对象
+    snap.store(0, b'\x04' * 32)
+    assert parent.load(0) == (int.from_bytes(b'\x02' * 32, 'big'), set())
+
+
+def test_second_snapshot_after_a_write():
+    # 父对象已经拥有的页，再次快照之后写入时仍然要复制
+    parent = Memory()
+    parent.store(0, b'\x01' * 32)
+    first = copy.copy(parent)
+    parent.store(0, b'\x02' * 32)
+    second = copy.copy(parent)
+    parent.store(0, b'\x03' * 32)
+    assert first.load(0)[0] == int.from_bytes(b'\x01' * 32, 'big')
+    assert second.load(0)[0] == int.from_bytes(b'\x02' * 32, 'big')
+
+
+def test_forked_vm_stack_and_memory_are_isolated():
+    vm = Vm(code=bytes.fromhex('00'), calldata=CallData(b''))
+    vm.stack.push(1)
+    vm.memory.store(0, b'\x01' * 32)
+    fork = copy.copy(vm)
+    vm.stack.push(2)
+    vm.memory.store(0, b'\x02' * 32)
+    assert fork.stack._data == [1]
+    assert fork.memory.load(0)[0] == int.from_bytes(b'\x01' * 32, 'big')
+
+
+# 函数体：CALLDATACOPY(0, 4, size); MLOAD(0x200); AND 0xff
+def _long_copy_then_load(size: int) -> str:
+    return PREFIX + f'62{size:06x}' + '6004600037' + '610200' + '5160ff1600'
+
+
+def test_calldatacopy_longer_than_256_bytes():
+    # 原来超过256字节的CALLDATACOPY直接停止；现在只记录一个区间，0x200处是calldata中0x204处的参数
+    for size in (0x400, 0x100000):
+        assert function_arguments(_long_copy_then_load(size), '10000000') == 'uint8'
+        memory = Memory()
+        memory.store_range(0, size, CallDataCopy(0, 4, 4))
+        _, used = memory.load(0x200)
+        assert [u.offset for u in used] == [0x204]
@@ -0,0 +1,54 @@
+# register_rule/unregister_rule的测试
+from arguments import Arg, Op, function_arguments, register_rule, unregister_rule
+from VM import decode_code
+
+
+def _tag_and(vm, ret, args):
+    for v in ret[2:]:
+        if isinstance(v, Arg):
+            args[v.offset] = 'bytes7'
+            return True
+    return False
+
+
+def test_rule_changes_invalidate_summaries(corpus_entry):
+    # 两个选择器都调用同一个address的解码子程序，第一次分析之后摘要保存在DecodedCode中
+    entry = corpus_entry('web3/address_reflector_contract')
+    selectors = list(entry.functions)
+    for s in selectors:
+        assert function_arguments(entry.code, s) == entry.functions[s]
+    assert len(decode_code(entry.code).summaries) > 0
+
+    register_rule(Op.AND, first=True)(_tag_and)
+    try:
+        # fuse=True的vm不使用摘要，结果应该和复用摘要的vm相同
+        for s in selectors:
+            assert function_arguments(entry.code, s) == function_arguments(entry.code, s, fuse=True) == 'bytes7'
+    finally:
+        unregister_rule(_tag_and)
+    for s in selectors:
+        assert function_arguments(entry.code, s) == entry.functions[s]
+
+
+def test_rules_on_fusable_opcodes_are_not_skipped(corpus_entry):
+    # 融合指令中间的PUSH/DUP/SWAP/JUMP不会返回给_process_function，注册了规则之后这些操作码不再融合
+    entry = corpus_entry('web3/address_reflector_contract')
+    selector = next(iter(entry.functions))
+    seen = {False: [], True: []}
+    fuse = False
+
+    def record(vm, ret, args):
+        seen[fuse].append(ret[:2])
+        return False
+
+    register_rule(Op.DUP1, Op.SWAP1, Op.JUMP)(record)
+    try:
+        for fuse in (False, True):
+            function_arguments(entry.code, selector, fuse=fuse)
+    finally:
+        unregister_rule(record)
+    assert len(seen[False]) > 0
+    assert seen[True] == seen[False]
+    # 删除规则之后恢复融合
+    assert function_arguments(entry.code, selector, fuse=True) == entry.functions[selector]
+    assert any(run is not None for run in decode_code(entry.code).fused.values())
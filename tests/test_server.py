@@ -0,0 +1,206 @@
+# server.py的测试，每个测试用asyncio.run启动自己的AnalysisServer
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import server as server_module
+from bulk import analyze_contract
+from cache import ResultCache
+from regression import DEFAULT_CORPUS, load_suite
+from server import AnalysisServer, request, serve
+
+
+def test_results_and_cache(tmp_path, corpus_entry):
+    entry = corpus_entry()
+    selectors = list(entry.functions)
+
+    async def run():
+        server = AnalysisServer(workers=1, cache=ResultCache(path=str(tmp_path / 'cache.sqlite')))
+        await server.start()
+        try:
+            first = await server.analyze(entry.code, selectors)
+            second = await server.analyze(entry.code, selectors)
+            everything = await server.analyze(entry.code, None)
+            return first, second, everything, server.stats_snapshot()
+        finally:
+            await server.close()
+
+    first, second, everything, stats = asyncio.run(run())
+    assert first == second == entry.functions
+    assert everything == entry.functions
+    assert stats['cache_hits'] == len(selectors)
+    assert stats['requests'] == 3
+
+
+def test_requests_for_one_contract_are_batched(corpus_entry):
+    entry = corpus_entry()
+    selectors = list(entry.functions)
+
+    async def run():
+        server = AnalysisServer(workers=1, batch_window=0.05)
+        await server.start()
+        try:
+            results = await asyncio.gather(*(server.analyze(entry.code, [s]) for s in selectors))
+            return results, server.stats_snapshot()
+        finally:
+            await server.close()
+
+    results, stats = asyncio.run(run())
+    assert results == [{s: entry.functions[s]} for s in selectors]
+    assert stats['batches'] == 1
+    assert stats['batched_requests'] == len(selectors)
+
+
+def test_partial_results_are_returned_but_not_cached(corpus_entry):
+    entry = corpus_entry()
+    selectors = list(entry.functions)
+
+    async def run():
+        server = AnalysisServer(workers=1, batch_window=0)
+        await server.start()
+
+        async def limited(code, selectors, gas_limit):
+            return analyze_contract(0, code, selectors, 0, gas_limit, max_steps=50)
+
+        server._submit = limited
+        try:
+            functions, partial = await server.analyze_partial(entry.code, selectors)
+            cached = [server.cache.get(entry.code, bytes.fromhex(s)) for s in partial]
+            return functions, partial, cached
+        finally:
+            await server.close()
+
+    functions, partial, cached = asyncio.run(run())
+    assert set(functions) == set(selectors)
+    assert len(partial) > 0 and set(partial.values()) == {'step_limit'}
+    assert cached == [None] * len(partial)
+
+
+def test_socket_round_trip(tmp_path, corpus_entry):
+    entry = corpus_entry('web3/address_reflector_contract')
+    path = str(tmp_path / 'evmole.sock')
+
+    async def run():
+        server = AnalysisServer(workers=1)
+        task = asyncio.create_task(serve(server, path=path))
+        try:
+            while server._dispatcher is None or not (tmp_path / 'evmole.sock').exists():
+                await asyncio.sleep(0.01)
+            analyzed = await asyncio.to_thread(request, {'id': 1, 'code': entry.code.hex(), 'selectors': list(entry.functions)}, path=path)
+            stats = await asyncio.to_thread(request, {'id': 2, 'op': 'stats'}, path=path)
+            bad = await asyncio.to_thread(request, {'id': 3, 'code': 'zz'}, path=path)
+            return analyzed, stats, bad
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    analyzed, stats, bad = asyncio.run(run())
+    assert analyzed == {'id': 1, 'functions': entry.functions}
+    assert stats['id'] == 2 and stats['stats']['requests'] == 1
+    assert bad['id'] == 3 and 'error' in bad
+
+
+def _crash_on_empty(code, selectors, timeout, gas_limit):
+    if len(code) == 0:
+        os._exit(1)
+    return server_module._analyze_orig(code, selectors, timeout, gas_limit)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='workers must inherit the patched _analyze')
+def test_worker_crash_resolves_every_request(monkeypatch):
+    monkeypatch.setattr(server_module, '_analyze_orig', server_module._analyze, raising=False)
+    monkeypatch.setattr(server_module, '_analyze', _crash_on_empty)
+    suite = load_suite(DEFAULT_CORPUS)[:6]
+
+    async def run():
+        server = AnalysisServer(workers=2, batch_window=0.01)
+        await server.start()
+        try:
+            # 同时在执行的几个批次都会收到BrokenProcessPool，每个请求都要得到结果或者错误
+            requests = [server.analyze(b'', ['10000000'])] + [server.analyze(e.code, list(e.functions)) for e in suite]
+            outcomes = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 30)
+            after = await asyncio.wait_for(server.analyze(suite[0].code, list(suite[0].functions)), 30)
+            return outcomes, after
+        finally:
+            await server.close()
+
+    outcomes, after = asyncio.run(run())
+    assert isinstance(outcomes[0], Exception)
+    for entry, outcome in zip(suite, outcomes[1:]):
+        assert isinstance(outcome, Exception) or outcome == entry.functions
+    assert after == suite[0].functions
+
+
+# 由测试决定每个任务什么时候结束的executor
+class _ManualExecutor(Executor):
+    def __init__(self):
+        self.futures: list[Future] = []
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        fut = Future()
+        self.futures.append(fut)
+        return fut
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shut_down = True
+        if cancel_futures:
+            # 和ProcessPoolExecutor一样，只取消还在排队的任务
+            for fut in self.futures:
+                fut.cancel()
+
+
+def test_broken_pool_is_replaced_only_once():
+    async def run():
+        server = AnalysisServer(workers=1)
+        old = server._executor = _ManualExecutor()
+        first = asyncio.create_task(server._submit(b'a', None, int(1e4)))
+        second = asyncio.create_task(server._submit(b'b', None, int(1e4)))
+        await asyncio.sleep(0)
+        # 两个批次都在崩溃的worker中执行
+        for fut in old.futures:
+            fut.set_running_or_notify_cancel()
+        old.futures[0].set_exception(BrokenProcessPool())
+        with pytest.raises(BrokenProcessPool):
+            await first
+        replacement = server._executor
+        assert replacement is not old
+        replacement.shutdown()
+        # 第一个批次换上的新进程池已经在执行其他批次
+        new = server._executor = _ManualExecutor()
+        third = asyncio.create_task(server._submit(b'c', None, int(1e4)))
+        await asyncio.sleep(0)
+        old.futures[1].set_exception(BrokenProcessPool())
+        with pytest.raises(BrokenProcessPool):
+            await second
+        assert server._executor is new and not new.shut_down
+        new.futures[0].set_result({'status': 'ok'})
+        return await third
+
+    assert asyncio.run(run()) == {'status': 'ok'}
+
+
+def test_cancelled_batch_resolves_its_requests():
+    async def run():
+        server = AnalysisServer(workers=1)
+        server._slots = asyncio.Semaphore(1)
+        await server._slots.acquire()
+
+        async def cancelled(code, selectors, gas_limit):
+            raise asyncio.CancelledError
+
+        server._submit = cancelled
+        fut = asyncio.get_running_loop().create_future()
+        with pytest.raises(asyncio.CancelledError):
+            await server._run_batch([(b'a', ['10000000'], int(1e4), fut)])
+        return fut
+
+    fut = asyncio.run(run())
+    assert isinstance(fut.exception(), RuntimeError)
@@ -0,0 +1,73 @@
+# 共享子程序的摘要(arguments.py中的_Summaries)的测试
+import arguments
+from arguments import function_arguments, function_arguments_results
+from governor import Governor
+from VM import Tracer, decode_code
+
+# 挂载了tracer的vm不使用摘要，作为逐条执行的对照
+_PLAIN = Tracer()
+
+
+def _count_replays(monkeypatch) -> list[int]:
+    replays = [0]
+    before_step = arguments._Summaries.before_step
+
+    def counting(self, *args):
+        ret = before_step(self, *args)
+        if ret is not None:
+            replays[0] += 1
+        return ret
+
+    monkeypatch.setattr(arguments._Summaries, 'before_step', counting)
+    return replays
+
+
+def test_replay_matches_step_by_step(monkeypatch, corpus_entry):
+    entry = corpus_entry('web3/emitter_contract')
+    decode_code(entry.code).summaries.clear()
+    replays = _count_replays(monkeypatch)
+    for s, expected in entry.functions.items():
+        assert function_arguments(entry.code, s) == expected
+    assert len(decode_code(entry.code).summaries) > 0
+    assert replays[0] > 0
+    for s in entry.functions:
+        assert function_arguments(entry.code, s) == function_arguments(entry.code, s, tracer=_PLAIN)
+
+
+def test_replay_counts_steps_on_the_governor(corpus_entry):
+    entry = corpus_entry('web3/emitter_contract')
+    for s in entry.functions:
+        function_arguments(entry.code, s)
+    for s in entry.functions:
+        plain, replayed = Governor(), Governor()
+        r0 = function_arguments_results(entry.code, [s], tracer=_PLAIN, governor=plain)[s]
+        r1 = function_arguments_results(entry.code, [s], governor=replayed)[s]
+        assert (r1.arguments, r1.reason) == (r0.arguments, r0.reason)
+        assert replayed.steps == plain.steps
+
+
+def test_step_limit_inside_a_summary_stops_at_the_same_step(corpus_entry):
+    # advance()超出max_steps时逐条执行，停止的位置和结果都和不使用摘要时相同
+    entry = corpus_entry('web3/address_reflector_contract')
+    for s in entry.functions:
+        function_arguments(entry.code, s)
+    for s in entry.functions:
+        total = Governor()
+        function_arguments_results(entry.code, [s], tracer=_PLAIN, governor=total)
+        for k in range(1, total.steps + 2):
+            r0 = function_arguments_results(entry.code, [s], tracer=_PLAIN, governor=Governor(max_steps=k))[s]
+            r1 = function_arguments_results(entry.code, [s], governor=Governor(max_steps=k))[s]
+            assert (r1.arguments, r1.reason) == (r0.arguments, r0.reason), k
+
+
+# 两个函数都用4调用0x1f处的子程序(CALLDATALOAD; PUSH2 0x31; POP; SWAP1; JUMP)，返回地址0x31/0x40小于257，子程序中还压入了和返回地址相等的常量
+SMALL_RETURN = bytes.fromhex('60003560e01c806310000000146100275780631000000114610036575f80fd5b356100315090565b610031600461001f565b60ff16005b610040600461001f565b60ff1600')
+
+
+def test_small_return_address_is_tracked_by_position(monkeypatch):
+    decode_code(SMALL_RETURN).summaries.clear()
+    replays = _count_replays(monkeypatch)
+    for s in ('10000000', '10000001'):
+        assert function_arguments(SMALL_RETURN, s) == function_arguments(SMALL_RETURN, s, tracer=_PLAIN) == 'uint8'
+    assert len(decode_code(SMALL_RETURN).summaries) == 1
+    assert replays[0] == 1
@@ -0,0 +1,80 @@
+# Tracer(VM.py)的事件和MetricsCollector(tracing.py)的计数的测试
+from arguments import Termination, function_arguments, function_arguments_many
+from regression import DEFAULT_CORPUS, load_suite
+from tracing import MetricsCollector
+from VM import Op, Tracer
+
+# 函数0x10000000的函数体从0x15开始：PUSH1 4 CALLDATALOAD PUSH1 0xff AND STOP
+UINT8 = bytes.fromhex('60003560e01c80631000000014610014575f80fd5b' + '60043560ff1600')
+SELECTOR = bytes.fromhex('10000000')
+
+
+# 按顺序记录所有事件
+class _Recorder(Tracer):
+    def __init__(self):
+        self.events = []
+
+    def on_step(self, vm, pc, ret):
+        self.events.append(('step', pc, ret[0]))
+
+    def on_tag(self, vm, old, new):
+        self.events.append(('tag', type(new).__name__))
+
+    def on_type(self, selector, offset, type_):
+        self.events.append(('type', selector, offset, type_))
+
+    def on_termination(self, selector, result, steps):
+        self.events.append(('termination', selector, result.arguments, result.reason, steps))
+
+
+def test_events_of_one_selector():
+    recorder = _Recorder()
+    assert function_arguments(UINT8, '10000000', tracer=recorder) == 'uint8'
+    steps = [e for e in recorder.events if e[0] == 'step']
+    # 每一条执行完的指令一个事件，不支持的STOP没有执行完，不产生事件
+    assert steps[-5:] == [('step', 0x14, Op.JUMPDEST), ('step', 0x15, Op.PUSH1), ('step', 0x17, Op.CALLDATALOAD), ('step', 0x18, Op.PUSH1), ('step', 0x1a, Op.AND)]
+    after_load = recorder.events[recorder.events.index(('step', 0x17, Op.CALLDATALOAD)) + 1 :]
+    assert after_load[:2] == [('tag', 'Arg'), ('type', SELECTOR, 4, '')]
+    assert ('type', SELECTOR, 4, 'uint8') in recorder.events
+    assert recorder.events[-1] == ('termination', SELECTOR, 'uint8', Termination.UNSUPPORTED_OP, len(steps))
+
+
+def test_tracer_does_not_change_results():
+    for entry in load_suite(DEFAULT_CORPUS):
+        for s in entry.functions:
+            assert function_arguments(entry.code, s, tracer=_Recorder()) == function_arguments(entry.code, s), (entry.name, s)
+
+
+def test_metrics_counts():
+    collector = MetricsCollector()
+    function_arguments(UINT8, '10000000', tracer=collector)
+    snapshot = collector.snapshot()
+    assert snapshot['selectors'] == 1
+    assert snapshot['steps'] == sum(snapshot['opcodes'].values()) == snapshot['steps_per_selector']['10000000']
+    assert snapshot['opcodes']['CALLDATALOAD'] == 2 and snapshot['opcodes']['AND'] == 1
+    assert snapshot['tags'] == {'Arg': 1}
+    assert snapshot['types'] == {'uint8': 1}
+    assert snapshot['terminations'] == {Termination.UNSUPPORTED_OP: 1}
+
+
+def test_metrics_of_many_equal_separate_calls():
+    # function_arguments_many中没有找到的选择器也上报执行到停止为止的步数
+    selectors = ['10000000', '20000000']
+    many = MetricsCollector()
+    function_arguments_many(UINT8, selectors, tracer=many)
+    separate = MetricsCollector()
+    for s in selectors:
+        function_arguments(UINT8, s, tracer=separate)
+    assert many.steps_per_selector == separate.steps_per_selector == {'10000000': 14, '20000000': 12}
+    assert many.terminations == separate.terminations
+    assert many.types == separate.types
+
+
+def test_merge_adds_counts():
+    a, b = MetricsCollector(), MetricsCollector(per_selector=False)
+    function_arguments(UINT8, '10000000', tracer=a)
+    function_arguments(UINT8, '10000000', tracer=b)
+    assert b.steps_per_selector == {}
+    a.merge(b)
+    assert a.selectors == 2 and a.steps == 28
+    assert a.snapshot()['types'] == {'uint8': 2}
@@ -0,0 +1,70 @@
+# 描述：内置的Tracer实现，为指标系统汇总Vm和参数推断循环中的事件
+'''MetricsCollector的用法：
+   step1：collector = MetricsCollector()，然后function_arguments(code, selector, tracer=collector)，function_arguments_many/function_arguments_all/function_arguments_results同理
+   step2：同一个collector可以挂载到任意多次分析上，计数会一直累加
+   step3：collector.snapshot()返回一个可以直接写入json的dict：
+     {'steps': 总步数, 'selectors': 分析过的选择器数量,
+      'opcodes': {操作码名称: 执行次数}, 'tags': {Tag类名: 创建次数}, 'types': {参数类型: 确定次数},
+      'terminations': {Termination中的停止原因: 次数}, 'steps_per_selector': {选择器: 步数}}
+   多个进程中的collector可以通过merge()合并成一个
+'''
+from collections import Counter
+
+from VM import Tracer, opcode2name
+
+
+class MetricsCollector(Tracer):
+    def __init__(self, *, per_selector: bool = True):
+        # per_selector为False时不记录每个选择器的步数，分析大量合约时避免字典无限增长
+        self.per_selector = per_selector
+        self.reset()
+
+    def reset(self):
+        # 以操作码的字节计数，snapshot()的时候才转换为名称
+        self.opcodes: Counter[int] = Counter()
+        self.tags: Counter[str] = Counter()
+        self.types: Counter[str] = Counter()
+        self.terminations: Counter[str] = Counter()
+        self.steps_per_selector: dict[str, int] = {}
+        self.selectors = 0
+        self.steps = 0
+
+    def on_step(self, vm, pc: int, ret: tuple):
+        self.opcodes[ret[0]] += 1
+
+    def on_tag(self, vm, old, new):
+        self.tags[type(new).__name__] += 1
+
+    def on_type(self, selector: bytes, offset: int, type_: str):
+        # ''只是说明这个位置有参数，还不是一个类型
+        if type_ != '':
+            self.types[type_] += 1
+
+    def on_termination(self, selector: bytes, result, steps: int):
+        self.selectors += 1
+        self.steps += steps
+        self.terminations[result.reason] += 1
+        if self.per_selector:
+            self.steps_per_selector[selector.hex()] = steps
+
+    def merge(self, other: 'MetricsCollector'):
+        self.opcodes.update(other.opcodes)
+        self.tags.update(other.tags)
+        self.types.update(other.types)
+        self.terminations.update(other.terminations)
+        self.steps_per_selector.update(other.steps_per_selector)
+        self.selectors += other.selectors
+        self.steps += other.steps
+
+    def snapshot(self) -> dict:
+        return {
+            'steps': self.steps,
+            'selectors': self.selectors,
+            'opcodes': {opcode2name(op): n for op, n in self.opcodes.most_common()},
+            'tags': dict(self.tags.most_common()),
+            'types': dict(self.types.most_common()),
+            'terminations': dict(self.terminations.most_common()),
+            'steps_per_selector': dict(self.steps_per_selector),
+        }
+## MetricsCollector类：统计每个操作码的执行次数、每个选择器的步数以及停止原因的分布
+## 实际应用：steps是on_termination中上报的步数之和，包括进入函数之前在dispatcher中执行的步数，function_arguments_many中fork出来的vm会继承fork之前的步数
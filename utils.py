@@ -0,0 +1,9 @@
+# 描述：和evmole 0.2.2的utils.py相同的工具函数
+
+
+# 十六进制字符串(可以带0x前缀)或者bytes转换为bytes
+def to_bytes(v: str | bytes) -> bytes:
+    if isinstance(v, str):
+        return bytes.fromhex(v[2:] if v.startswith('0x') else v)
+    assert isinstance(v, bytes), 'must be hex-string or bytes'
+    return v